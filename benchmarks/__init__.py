@@ -0,0 +1,3 @@
+"""
+benchmarks package：效能基準測試（合成資料，不需連線 MSSQL）
+"""
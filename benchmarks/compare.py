@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""比較兩次基準測試結果，找出變慢的階段
+
+使用方式：
+    python -m benchmarks.compare 舊結果.json 新結果.json [--threshold 0.1]
+
+任一階段耗時增加超過 threshold（預設 10%）時以結束碼 1 結束，
+可直接用於 CI 或排程檢查。
+"""
+
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('meta', {}), {
+        (r['case'], r['stage']): r for r in data.get('results', [])
+    }
+
+
+def compare(old_path, new_path, threshold=0.1):
+    """回傳 (各階段比較列, 變慢的階段數)"""
+    _, old = load_results(old_path)
+    _, new = load_results(new_path)
+    rows = []
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        before = old[key]['seconds']
+        after = new[key]['seconds']
+        ratio = after / before if before > 0 else float('inf')
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions += 1
+        rows.append((key[0], key[1], before, after, ratio, regressed))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='比較兩次基準測試結果')
+    parser.add_argument('old', help='基準（舊）結果 JSON')
+    parser.add_argument('new', help='新結果 JSON')
+    parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='耗時增加超過此比例視為退步（預設 0.1 = 10%%）',
+    )
+    args = parser.parse_args(argv)
+
+    old_meta, _ = load_results(args.old)
+    new_meta, _ = load_results(args.new)
+    print(
+        f"基準: {old_meta.get('commit')} ({old_meta.get('timestamp')})  "
+        f"比較: {new_meta.get('commit')} ({new_meta.get('timestamp')})"
+    )
+    rows, regressions = compare(args.old, args.new, args.threshold)
+    print(
+        f"{'案例':<16}{'階段':<30}{'舊(秒)':>10}{'新(秒)':>10}{'倍率':>8}"
+    )
+    for case, stage, before, after, ratio, regressed in rows:
+        mark = '  <-- 變慢' if regressed else ''
+        print(
+            f"{case:<16}{stage:<30}{before:>10.4f}{after:>10.4f}"
+            f"{ratio:>8.2f}{mark}"
+        )
+    print(f"\n共比較 {len(rows)} 個階段，{regressions} 個變慢")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
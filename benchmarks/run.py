@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""效能基準測試：以合成資料量測各階段耗時並輸出 JSON
+
+使用方式：
+    python -m benchmarks.run --rows 10k,1m --symbols 1,100 --repeat 3
+    python -m benchmarks.compare 舊結果.json 新結果.json
+
+每個案例（筆數 x 商品數）依 analyzer 的處理方式逐一商品執行下列階段，
+各階段耗時為所有商品的加總：
+- compute_base_indicators：由原始 OHLCV 計算基礎指標（--compute-indicators）
+- indicator:<名稱>：單獨計算一個指標
+- compute_signals：一次計算全部指標
+- generate_trade_signals / format_signals_for_output / print_analysis_summary
+- save_sqlite：以 SQLite 後端（signals.backends.SQLiteBackend）寫入訊號
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 以 python benchmarks/run.py 執行時，確保專案根目錄在 sys.path
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+
+from benchmarks.synthetic import (  # noqa: E402
+    generate_ohlcv,
+    iter_symbol_frames,
+    parse_size,
+)
+from signals import indicators as ind  # noqa: E402
+from signals import trades as tradesmod  # noqa: E402
+from signals.backends import SQLiteBackend  # noqa: E402
+from signals.compute import RAW_COLUMNS, compute_base_indicators  # noqa: E402
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=_root, stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except Exception:
+        return None
+
+
+def _metadata():
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+class _StageTimer:
+    """累計各階段耗時（跨商品加總）"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+
+
+def _run_case_once(frames, db_path, stages):
+    """對每個商品依序執行各階段一次，回傳 {階段: 秒數}"""
+    timer = _StageTimer()
+    backend = SQLiteBackend(db_path)
+    for symbol, frame in frames:
+        if 'compute_base_indicators' in stages:
+            raw = frame[RAW_COLUMNS].copy()
+            with timer.stage('compute_base_indicators'):
+                compute_base_indicators(raw)
+
+        for entry in ind.REGISTRY:
+            name = f'indicator:{entry.name}'
+            if name in stages:
+                with timer.stage(name):
+                    ind.compute_signals(frame, indicators=[entry])
+
+        df = frame.copy()
+        with timer.stage('compute_signals'):
+            ind.compute_signals(df)
+        with timer.stage('generate_trade_signals'):
+            tradesmod.generate_trade_signals(df)
+        with timer.stage('format_signals_for_output'):
+            out_df = tradesmod.format_signals_for_output(df)
+        if 'print_analysis_summary' in stages:
+            with contextlib.redirect_stdout(io.StringIO()):
+                with timer.stage('print_analysis_summary'):
+                    tradesmod.print_analysis_summary(df)
+        if 'save_sqlite' in stages:
+            with contextlib.redirect_stdout(io.StringIO()):
+                with timer.stage('save_sqlite'):
+                    backend.save_signals(out_df, 'trade_signals')
+    return timer.seconds
+
+
+def all_stages():
+    return (
+        ['compute_base_indicators']
+        + [f'indicator:{e.name}' for e in ind.REGISTRY]
+        + [
+            'compute_signals', 'generate_trade_signals',
+            'format_signals_for_output', 'print_analysis_summary',
+            'save_sqlite',
+        ]
+    )
+
+
+def run_case(rows, symbols, repeat=3, seed=0, stages=None):
+    """執行一個案例，回傳各階段的結果列"""
+    stages = set(stages or all_stages())
+    df = generate_ohlcv(rows, symbols, seed=seed)
+    frames = list(iter_symbol_frames(df))
+    total_rows = len(df)
+    del df
+
+    samples = {}
+    for _ in range(max(1, repeat)):
+        # 每次重複使用新的 SQLite 檔，量測的是首次寫入
+        with tempfile.TemporaryDirectory() as tmp:
+            seconds = _run_case_once(
+                frames, os.path.join(tmp, 'signals.db'), stages
+            )
+        for name, value in seconds.items():
+            samples.setdefault(name, []).append(value)
+
+    results = []
+    for name, values in samples.items():
+        best = min(values)
+        results.append({
+            'case': f'{rows}x{symbols}',
+            'rows': total_rows,
+            'symbols': symbols,
+            'stage': name,
+            'repeat': len(values),
+            'seconds': best,
+            'mean': sum(values) / len(values),
+            'rows_per_sec': total_rows / best if best > 0 else None,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='交易訊號效能基準測試')
+    parser.add_argument(
+        '--rows', default='10k,1m',
+        help='總筆數，逗號分隔，可用 k/m 單位（預設 10k,1m，例如 10k,1m,10m）',
+    )
+    parser.add_argument(
+        '--symbols', default='1,100',
+        help='商品數，逗號分隔（預設 1,100，例如 1,100,5000）',
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='重複次數，取最短耗時')
+    parser.add_argument('--seed', type=int, default=0, help='亂數種子')
+    parser.add_argument(
+        '--stages', default=None,
+        help=f"只執行指定的階段（逗號分隔），可用: {', '.join(all_stages())}",
+    )
+    parser.add_argument(
+        '--output', default=None,
+        help='結果 JSON 路徑（預設 benchmarks/results/<時間>_<commit>.json）',
+    )
+    args = parser.parse_args(argv)
+
+    stages = args.stages.split(',') if args.stages else None
+    meta = _metadata()
+    results = []
+    for rows in [parse_size(r) for r in args.rows.split(',')]:
+        for symbols in [parse_size(s) for s in args.symbols.split(',')]:
+            if symbols > rows:
+                continue
+            print(f"執行案例 rows={rows:,} symbols={symbols:,} ...")
+            case_results = run_case(
+                rows, symbols, repeat=args.repeat, seed=args.seed,
+                stages=stages,
+            )
+            for r in case_results:
+                rps = r['rows_per_sec']
+                print(
+                    f"  {r['stage']:<30}{r['seconds']:>10.4f} 秒"
+                    f"{(rps or 0):>16,.0f} 筆/秒"
+                )
+            results.extend(case_results)
+
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(
+            _root, 'benchmarks', 'results',
+            f"{stamp}_{meta['commit'] or 'unknown'}.json",
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(
+            {'meta': meta, 'results': results}, f,
+            ensure_ascii=False, indent=2,
+        )
+    print(f"結果已儲存至 {output}")
+    return output
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""可重現的合成 OHLCV 資料產生器
+
+產生與 stock_data_<period> 資料表相同欄位的資料：原始 OHLCV 以固定
+亂數種子的幾何隨機漫步產生，指標欄位（ma5、bb_upper、dif、rsi_14、
+k_value 等）再由 signals.compute 依資料表相同的方式算出，
+signals.indicators 的每個函式都能直接使用。
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from signals.compute import RAW_COLUMNS, compute_base_indicators
+
+_SIZE_SUFFIX = {'': 1, 'k': 1_000, 'm': 1_000_000}
+
+
+def parse_size(text):
+    """將 '10k'、'1m'、'10M'、'5000' 等字串轉為整數"""
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kKmM]?)\s*', str(text))
+    if not m:
+        raise ValueError(f"無法解析的數量: {text}")
+    return int(float(m.group(1)) * _SIZE_SUFFIX[m.group(2).lower()])
+
+
+def generate_ohlcv(
+    rows,
+    symbols=1,
+    seed=0,
+    start='2015-01-01',
+    freq='1h',
+    with_indicators=True,
+):
+    """
+    產生 rows 筆、平均分配給 symbols 個商品的合成 K 棒。
+
+    每個商品的筆數為 rows // symbols（至少 1 筆），依 (symbol, datetime)
+    排序。with_indicators=False 時只回傳 RAW_COLUMNS 原始欄位
+    （對應 --compute-indicators 的讀取）。
+    """
+    symbols = max(1, int(symbols))
+    per_symbol = max(1, int(rows) // symbols)
+    rng = np.random.default_rng(seed)
+    shape = (symbols, per_symbol)
+
+    # 每個商品各自的起始價位與波動度
+    base = rng.uniform(10, 500, size=(symbols, 1))
+    vol = rng.uniform(0.005, 0.03, size=(symbols, 1))
+    log_ret = rng.standard_normal(shape) * vol
+    close = base * np.exp(np.cumsum(log_ret, axis=1))
+    prev_close = np.concatenate([base, close[:, :-1]], axis=1)
+    open_ = prev_close * (1 + rng.standard_normal(shape) * vol * 0.3)
+    spread = np.abs(rng.standard_normal(shape)) * vol * 0.5
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = np.round(rng.lognormal(mean=12, sigma=0.6, size=shape))
+
+    width = len(str(symbols - 1))
+    names = np.array([f'SYM{i:0{width}d}' for i in range(symbols)])
+    times = pd.date_range(start, periods=per_symbol, freq=freq)
+
+    df = pd.DataFrame({
+        'symbol': np.repeat(names, per_symbol),
+        'datetime': np.tile(times.values, symbols),
+        'open_price': open_.ravel(),
+        'high_price': high.ravel(),
+        'low_price': low.ravel(),
+        'close_price': close.ravel(),
+        'volume': volume.ravel(),
+    }, columns=RAW_COLUMNS)
+    if with_indicators:
+        df = add_indicator_columns(df)
+    return df
+
+
+def add_indicator_columns(df):
+    """依 symbol 分組補上資料表中預存的指標欄位"""
+    parts = []
+    for _, part in df.groupby('symbol', sort=False):
+        part = part.reset_index(drop=True)
+        parts.append(compute_base_indicators(part))
+    return pd.concat(parts, ignore_index=True)
+
+
+def iter_symbol_frames(df):
+    """逐一 yield (symbol, 依 datetime 排序的單一商品 DataFrame)"""
+    for symbol, part in df.groupby('symbol', sort=False):
+        yield symbol, part.reset_index(drop=True)
@@ -4,7 +4,32 @@ from dotenv import load_dotenv
 import os
 import argparse
 import re as _re
-from signals.analyzer import analyze_signals_from_db_with_symbol
+from signals.analyzer import (
+    analyze_signals_from_db_with_symbol,
+    analyze_signals_for_symbols,
+    analyze_signals_for_table,
+    output_table_for,
+)
+from signals import backtest as btmod
+from signals import sinks
+from signals import sweep as sweepmod
+from signals import timeframes as tfmod
+from signals.backends import BACKENDS, make_backend
+from signals.cache import OHLCVCache
+from signals.daemon import SignalDaemon
+from signals.indicators import resolve_indicators
+from signals.metrics import (
+    enable_memory_tracing,
+    write_jsonl,
+    write_prometheus,
+)
+from signals.parallel import (
+    chunk_symbols,
+    print_results_table,
+    run_jobs_parallel,
+)
+from signals.pipeline import run_pipeline
+from signals.snapshot import SignalSnapshot, serve_snapshot
 
 env_local = '.env.local'
 if os.path.exists(env_local):
@@ -19,6 +44,11 @@ default_table = os.getenv('MSSQL_TABLE')
 default_user = os.getenv('MSSQL_USER')
 default_password = os.getenv('MSSQL_PASSWORD')
 default_output = os.getenv('OUTPUT_CSV', '')
+default_format = os.getenv('OUTPUT_FORMAT', 'csv')
+default_max_connections = int(os.getenv('MSSQL_MAX_CONNECTIONS', '4'))
+default_cache_dir = os.getenv('OHLCV_CACHE_DIR') or None
+default_backend = os.getenv('STORAGE_BACKEND', 'mssql')
+default_sqlite_path = os.getenv('SQLITE_PATH', 'signals.db')
 
 parser = argparse.ArgumentParser(description='分析交易訊號')
 # 支援舊式位置參數 symbol，也支援 -s/--symbol
@@ -50,6 +80,236 @@ parser.add_argument(
     help='輸出 CSV 路徑，若不帶參數則輸出到 ./output/',
     default=None,
 )
+parser.add_argument(
+    '--format',
+    choices=sinks.FORMATS,
+    default=default_format,
+    help=(
+        '輸出格式（預設 csv）；parquet / feather 時 --output 為資料集根目錄，'
+        '依 table= / symbol= 分區寫入'
+    ),
+)
+parser.add_argument(
+    '--all-symbols',
+    action='store_true',
+    help='串流分析資料表中的所有 symbol（keyset 分頁讀取，記憶體用量固定）',
+)
+parser.add_argument(
+    '--page-size',
+    type=int,
+    default=50000,
+    help='--all-symbols 時每頁讀取的筆數（預設 50000）',
+)
+parser.add_argument(
+    '--workers',
+    type=int,
+    default=1,
+    help='平行分析的行程數（預設 1，即逐一執行）',
+)
+parser.add_argument(
+    '--pipeline',
+    action='store_true',
+    help='多商品時以管線模式重疊讀取、計算與寫入（見 README）',
+)
+parser.add_argument(
+    '--pipeline-workers',
+    type=int,
+    default=1,
+    help='管線模式的計算執行緒數（預設 1）',
+)
+parser.add_argument(
+    '--pipeline-queue',
+    type=int,
+    default=8,
+    help='管線模式各佇列最多暫存的 symbol 數（預設 8）',
+)
+parser.add_argument(
+    '--max-db-connections',
+    type=int,
+    default=default_max_connections,
+    help='平行模式下同時開啟的 MSSQL 連線上限（預設 4）',
+)
+parser.add_argument(
+    '--batch-size',
+    type=int,
+    default=500,
+    help='多商品時每次集合查詢讀取的 symbol 數（預設 500）',
+)
+parser.add_argument(
+    '--save-batch-size',
+    type=int,
+    default=10000,
+    help='寫入暫存表時每次 executemany 的筆數（預設 10000）',
+)
+parser.add_argument(
+    '--compute-indicators',
+    action='store_true',
+    help='由原始 OHLCV 自行計算 MA/MACD/RSI/KD 等指標，只讀取 6 個原始欄位',
+)
+parser.add_argument(
+    '--indicators',
+    default=None,
+    help=(
+        '只計算指定的指標（逗號分隔，例如 rsi,kd,macd；'
+        'all 為全部、scoring 為所有計分指標），未指定時計算全部；'
+        '未涵蓋全部指標時結果寫入 trade_signals_<週期>_partial'
+    ),
+)
+parser.add_argument(
+    '--timeframes',
+    default=None,
+    help=(
+        '多時間週期：只讀取一次資料表（例如 --1h），在本機合成較粗的週期'
+        '（逗號分隔，例如 1h,1d,1w），並分別寫入 trade_signals_<週期>'
+    ),
+)
+parser.add_argument(
+    '--incremental',
+    action='store_true',
+    help='增量模式：只計算並寫回 trade_signals 表中最新紀錄之後的新資料',
+)
+parser.add_argument(
+    '--cache-dir',
+    default=None,
+    help='本機 OHLCV 快取目錄（Parquet），只向資料庫抓取快取之後的新資料',
+)
+parser.add_argument(
+    '--refresh',
+    action='store_true',
+    help='忽略本機快取，重新從資料庫下載完整歷史並覆寫快取',
+)
+parser.add_argument(
+    '--cache-max-size',
+    type=float,
+    default=None,
+    help='快取容量上限（MB），超過時淘汰最久未使用的 symbol',
+)
+parser.add_argument(
+    '--cache-max-age',
+    type=float,
+    default=None,
+    help='快取分區最長保存天數，超過即刪除',
+)
+
+parser.add_argument(
+    '--backend',
+    choices=BACKENDS,
+    default=default_backend,
+    help='儲存後端：mssql（預設）或 sqlite（內嵌資料庫檔，不需伺服器）',
+)
+parser.add_argument(
+    '--sqlite-path',
+    default=default_sqlite_path,
+    help='--backend sqlite 使用的資料庫檔案（預設 signals.db）',
+)
+parser.add_argument(
+    '--compact-storage',
+    action='store_true',
+    help='訊號改存精簡窄表 <訊號表>_packed（訊號欄打包為一個整數），'
+         '並建立還原寬表的檢視表 <訊號表>_wide',
+)
+parser.add_argument(
+    '--metrics-jsonl',
+    default=os.getenv('METRICS_JSONL') or None,
+    help='將各 symbol 的階段耗時、筆數與記憶體峰值以 JSON-lines 附加寫入此檔',
+)
+parser.add_argument(
+    '--metrics-prom',
+    default=os.getenv('METRICS_PROM') or None,
+    help='將各階段彙總指標寫為 Prometheus textfile（供 node_exporter 收集）',
+)
+parser.add_argument(
+    '--backtest',
+    default=None,
+    help=(
+        '回測 Trade_Signal 的 N 根後報酬（逗號分隔，例如 5 或 1,5,20），'
+        '執行完畢後輸出各訊號的平均報酬、勝率與權益曲線'
+    ),
+)
+parser.add_argument(
+    '--backtest-output',
+    default=None,
+    help='回測統計 CSV 路徑（權益曲線另存為同名的 _equity.csv）',
+)
+parser.add_argument(
+    '--sweep',
+    default=None,
+    metavar='GRID.json',
+    help=(
+        '參數掃描：依 JSON 設定掃描 SIGNAL_WEIGHTS、min_signals 與指標門檻，'
+        '資料只讀取一次，以回測指標排序（不寫回資料庫）'
+    ),
+)
+parser.add_argument(
+    '--sweep-metric',
+    choices=sweepmod.METRICS,
+    default='mean_signed_return',
+    help='參數掃描的排序指標（預設 mean_signed_return）',
+)
+parser.add_argument(
+    '--sweep-horizon',
+    type=int,
+    default=5,
+    help='參數掃描回測的 N 根後報酬（預設 5）',
+)
+parser.add_argument(
+    '--sweep-top',
+    type=int,
+    default=10,
+    help='參數掃描顯示前 N 名（預設 10）',
+)
+parser.add_argument(
+    '--sweep-output',
+    default=None,
+    help='參數掃描完整排名 CSV 路徑',
+)
+parser.add_argument(
+    '--serve',
+    action='store_true',
+    help=(
+        '常駐模式：保留各商品近期歷史，依資料表週期輪詢新 K 棒並只計算新資料，'
+        '收到 Ctrl+C / SIGTERM 時完成目前工作後結束'
+    ),
+)
+parser.add_argument(
+    '--serve-interval',
+    type=float,
+    default=None,
+    help='常駐模式輪詢間隔（秒），預設依資料表週期（1h=3600、1d=86400）',
+)
+parser.add_argument(
+    '--serve-delay',
+    type=float,
+    default=60.0,
+    help='常駐模式於每個週期結束後延遲輪詢的秒數，等待新 K 棒寫入（預設 60）',
+)
+parser.add_argument(
+    '--status-file',
+    default=os.getenv('SERVE_STATUS_FILE') or None,
+    help='常駐模式狀態檔（JSON），記錄各商品最後處理的 K 棒與輪詢狀態',
+)
+parser.add_argument(
+    '--snapshot',
+    default=os.getenv('SIGNAL_SNAPSHOT') or None,
+    metavar='PATH',
+    help='最新訊號快照檔（JSON）：每個商品寫入後以最後一根 K 棒的訊號更新',
+)
+parser.add_argument(
+    '--snapshot-port',
+    type=int,
+    default=None,
+    help='常駐模式下於此埠號提供快照的 JSON 查詢端點（/signals）',
+)
+parser.add_argument(
+    '--snapshot-host',
+    default='127.0.0.1',
+    help='快照查詢端點的監聽位址（預設 127.0.0.1）',
+)
+parser.add_argument(
+    '--trace-memory',
+    action='store_true',
+    help='以 tracemalloc 記錄各階段的 Python 記憶體峰值（會降低執行速度）',
+)
 
 # 新增簡短旗標：period（--1d/--1h 等）與 region (--us/--tw 等)
 period_group = parser.add_mutually_exclusive_group()
@@ -149,6 +409,20 @@ def _normalize_symbols(pos_list, s_list):
 
 symbols = _normalize_symbols(args.symbol_pos, args.symbol)
 
+# 驗證並解析 --indicators
+try:
+    indicators = [e.name for e in resolve_indicators(args.indicators)]
+except ValueError as e:
+    parser.error(str(e))
+
+# 驗證並解析 --backtest
+backtest = None
+if args.backtest:
+    try:
+        backtest = btmod.parse_horizons(args.backtest)
+    except ValueError as e:
+        parser.error(str(e))
+
 # 決定使用的 database：命令列 --database > region flag > 環境預設
 if args.database is not None:
     database = args.database
@@ -165,10 +439,55 @@ elif getattr(args, 'period', None):
 else:
     table = default_table
 
+# 驗證並解析 --timeframes（需在決定 table 之後）
+timeframes = None
+if args.timeframes:
+    try:
+        timeframes = tfmod.parse_timeframes(args.timeframes)
+    except ValueError as e:
+        parser.error(str(e))
+    base_timeframe = tfmod.table_timeframe(table)
+    if base_timeframe is None:
+        parser.error(f"無法由資料表名稱 {table} 判斷時間週期，不能使用 --timeframes")
+    finer = [
+        tf for tf in timeframes
+        if tfmod.TIMEFRAMES.index(tf) < tfmod.TIMEFRAMES.index(base_timeframe)
+    ]
+    if finer:
+        parser.error(
+            f"--timeframes 不能比資料表的週期 {base_timeframe} 更細: "
+            f"{', '.join(finer)}"
+        )
+    if args.incremental:
+        parser.error("--timeframes 不支援與 --incremental 併用")
+if args.serve and (args.sweep or timeframes):
+    parser.error("--serve 不支援與 --sweep、--timeframes 併用")
+if args.pipeline and (args.serve or args.sweep):
+    parser.error("--pipeline 不支援與 --serve、--sweep 併用")
+if args.pipeline and args.workers > 1:
+    parser.error("--pipeline 不支援與 --workers 併用，請改用 --pipeline-workers")
+if args.snapshot_port is not None and not args.serve:
+    parser.error(
+        "--snapshot-port 需搭配 --serve；單次執行請以 "
+        "python -m signals.snapshot <快照檔> 提供查詢"
+    )
+if args.snapshot and args.workers > 1 and not args.serve:
+    # 快照只存在本行程的記憶體，worker 行程無法更新
+    parser.error("--snapshot 不支援與 --workers 併用，請改用 --pipeline")
+if args.all_symbols and (args.incremental or args.cache_dir):
+    # --all-symbols 以 keyset 分頁串流整張資料表，不讀取水位線也不使用快取
+    parser.error("--all-symbols 不支援與 --incremental、--cache-dir 併用")
+# 未指定 --cache-dir 時使用環境變數 OHLCV_CACHE_DIR（--all-symbols 不使用）
+args.cache_dir = args.cache_dir or default_cache_dir
+
 # server/user/password/output 使用者指定優先，否則回退到環境變數
 server = args.server or default_server
 user = args.user or default_user
 password = args.password or default_password
+backend = make_backend(
+    args.backend, server, database, user, password,
+    sqlite_path=args.sqlite_path, compact=args.compact_storage,
+)
 
 # 處理 output：若使用者傳入 --output 而未帶值，預設輸出至 ./output/ 目錄
 if args.output == '__DEFAULT_OUTPUT__':
@@ -183,8 +502,16 @@ else:
 
 
 def _resolve_output_for_symbol(
-    args_output, default_output, symbol, table, multiple
+    args_output, default_output, symbol, table, multiple, fmt='csv'
 ):
+    if fmt != 'csv':
+        # 欄式格式：所有 symbol 寫入同一個依 table / symbol 分區的資料集
+        if args_output == '__DEFAULT_OUTPUT__':
+            root = os.path.join(os.getcwd(), 'output')
+        else:
+            root = args_output or default_output
+        return sinks.dataset_path(root, table, symbol, fmt) if root else None
+
     if args_output == '__DEFAULT_OUTPUT__':
         out_dir = os.path.join(os.getcwd(), 'output')
         os.makedirs(out_dir, exist_ok=True)
@@ -219,17 +546,228 @@ print(
 )
 
 multiple = len(symbols) > 1
+# 輸出檔名 / 資料集分區使用的資料表名稱（部分指標時加上 _partial）
+output_table = output_table_for(table, indicators)
+output_paths = {}
 for symbol in symbols:
-    out_path = _resolve_output_for_symbol(
-        args.output, default_output, symbol, table, multiple
-    )
-    print(f"開始分析 symbol={symbol}")
-    analyze_signals_from_db_with_symbol(
-        server,
-        database,
-        table,
-        user,
-        password,
-        out_path,
-        symbol,
+    output_paths[symbol] = _resolve_output_for_symbol(
+        args.output, default_output, symbol, output_table, multiple,
+        args.format,
     )
+
+if __name__ == '__main__':
+    if args.trace_memory:
+        enable_memory_tracing()
+
+    snapshot = None
+    snapshot_server = None
+    if args.snapshot or args.snapshot_port is not None:
+        snapshot = SignalSnapshot(args.snapshot)
+        if args.snapshot_port is not None:
+            snapshot_server = serve_snapshot(
+                snapshot, args.snapshot_host, args.snapshot_port
+            )
+
+    if args.serve:
+        try:
+            daemon = SignalDaemon(
+                backend, table,
+                symbols=None if args.all_symbols else symbols,
+                compute_indicators=args.compute_indicators,
+                indicators=indicators,
+                interval=args.serve_interval,
+                delay=args.serve_delay,
+                status_path=args.status_file,
+                batch_size=args.batch_size,
+                save_batch_size=args.save_batch_size,
+                metrics_jsonl=args.metrics_jsonl,
+                metrics_prom=args.metrics_prom,
+                snapshot=snapshot,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            daemon.run()
+        finally:
+            if snapshot_server is not None:
+                snapshot_server.shutdown()
+                snapshot_server.server_close()
+        results = []
+    elif args.sweep:
+        try:
+            ranked = sweepmod.sweep(
+                backend, table, sweepmod.load_grid(args.sweep),
+                symbols=None if args.all_symbols else symbols,
+                horizon=args.sweep_horizon,
+                metric=args.sweep_metric,
+                workers=max(1, args.workers),
+                compute_indicators=args.compute_indicators,
+                indicators=indicators,
+                batch_size=args.batch_size,
+                page_size=args.page_size,
+            )
+        except (OSError, ValueError) as e:
+            parser.error(f"參數掃描設定錯誤: {e}")
+        sweepmod.print_sweep_report(ranked, top=args.sweep_top)
+        if args.sweep_output and not ranked.empty:
+            ranked.to_csv(args.sweep_output, encoding='utf-8-sig')
+            print(f"參數掃描結果已儲存至 {args.sweep_output}")
+        results = []
+    elif args.pipeline and (args.all_symbols or multiple or timeframes):
+        results = run_pipeline(
+            server,
+            database,
+            table,
+            user,
+            password,
+            symbols=None if args.all_symbols else symbols,
+            output_paths=output_paths,
+            output_for_symbol=(
+                (lambda s: _resolve_output_for_symbol(
+                    args.output, default_output, s, output_table, True,
+                    args.format,
+                ))
+                if args.all_symbols else None
+            ),
+            batch_size=args.batch_size,
+            page_size=args.page_size,
+            incremental=args.incremental and not args.all_symbols,
+            save_batch_size=args.save_batch_size,
+            cache_dir=args.cache_dir,
+            refresh=args.refresh,
+            compute_indicators=args.compute_indicators,
+            indicators=indicators,
+            backend=backend,
+            backtest=backtest,
+            timeframes=timeframes,
+            compute_workers=args.pipeline_workers,
+            queue_size=args.pipeline_queue,
+            snapshot=snapshot,
+        )
+        print_results_table(results)
+    elif args.all_symbols:
+        results = analyze_signals_for_table(
+            server,
+            database,
+            table,
+            user,
+            password,
+            output_for_symbol=lambda s: _resolve_output_for_symbol(
+                args.output, default_output, s, output_table, True,
+                args.format,
+            ),
+            page_size=args.page_size,
+            save_batch_size=args.save_batch_size,
+            compute_indicators=args.compute_indicators,
+            indicators=indicators,
+            backend=backend,
+            backtest=backtest,
+            timeframes=timeframes,
+            snapshot=snapshot,
+        )
+        print_results_table(results)
+    elif multiple or timeframes:
+        workers = max(1, min(args.workers, len(symbols)))
+        if workers > 1:
+            print(
+                f"平行模式：{workers} 個行程，"
+                f"資料庫連線上限 {args.max_db_connections}"
+            )
+        chunks = chunk_symbols(symbols, workers, args.batch_size)
+        jobs = [
+            {
+                'server': server,
+                'database': database,
+                'table': table,
+                'user': user,
+                'password': password,
+                'symbols': chunk,
+                'output_paths': {s: output_paths[s] for s in chunk},
+                'batch_size': args.batch_size,
+                'incremental': args.incremental,
+                'save_batch_size': args.save_batch_size,
+                'cache_dir': args.cache_dir,
+                'refresh': args.refresh,
+                'compute_indicators': args.compute_indicators,
+                'indicators': indicators,
+                'backend': backend,
+                'backtest': backtest,
+                'timeframes': timeframes,
+                'snapshot': snapshot,
+            }
+            for chunk in chunks
+        ]
+        if workers > 1:
+            results = run_jobs_parallel(
+                jobs, workers, max_connections=args.max_db_connections,
+                trace_memory=args.trace_memory,
+            )
+        else:
+            results = []
+            for job in jobs:
+                results.extend(analyze_signals_for_symbols(**job))
+        print_results_table(results)
+    else:
+        symbol = symbols[0]
+        print(f"開始分析 symbol={symbol}")
+        results = [analyze_signals_from_db_with_symbol(
+            server,
+            database,
+            table,
+            user,
+            password,
+            output_paths[symbol],
+            symbol,
+            incremental=args.incremental,
+            save_batch_size=args.save_batch_size,
+            cache_dir=args.cache_dir,
+            refresh=args.refresh,
+            compute_indicators=args.compute_indicators,
+            indicators=indicators,
+            backend=backend,
+            backtest=backtest,
+            snapshot=snapshot,
+        )]
+
+    if backtest and results:
+        # 多時間週期時各週期分開回測
+        for timeframe in timeframes or [None]:
+            if timeframe:
+                print(f"\n時間週期 {timeframe}：")
+            bt_result = btmod.combine([
+                r.get('backtest') for r in results
+                if r.get('timeframe') == timeframe
+            ])
+            btmod.print_backtest_report(bt_result)
+            if args.backtest_output:
+                path = args.backtest_output
+                if timeframe:
+                    base, ext = os.path.splitext(path)
+                    path = f"{base}_{timeframe}{ext or '.csv'}"
+                btmod.save_backtest(bt_result, path)
+
+    if snapshot is not None and args.snapshot and not args.serve:
+        snapshot.close()
+        print(f"最新訊號快照已寫入 {args.snapshot}（{len(snapshot)} 筆）")
+
+    # 常駐模式的指標已由 SignalDaemon 逐輪寫出
+    if args.metrics_jsonl and not args.serve:
+        write_jsonl(results, args.metrics_jsonl)
+        print(f"效能指標已附加至 {args.metrics_jsonl}")
+    if args.metrics_prom and not args.serve:
+        write_prometheus(
+            results, args.metrics_prom, database=database, table=table
+        )
+        print(f"Prometheus 指標已寫入 {args.metrics_prom}")
+
+    if args.cache_dir and (
+        args.cache_max_size is not None or args.cache_max_age is not None
+    ):
+        OHLCVCache(
+            args.cache_dir,
+            max_bytes=(
+                args.cache_max_size * 1024 * 1024
+                if args.cache_max_size is not None else None
+            ),
+            max_age_days=args.cache_max_age,
+        ).evict()
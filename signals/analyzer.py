@@ -13,13 +13,65 @@ if script_dir not in sys.path:
 
 try:
     from signals import db as dbmod
+    from signals import backtest as btmod
     from signals import indicators as ind
+    from signals.backends import MSSQLBackend
     from signals import trades as tradesmod
+    from signals.metrics import StageMetrics
+    from signals import sinks
+    from signals import timeframes as tfmod
+    from signals.compute import RAW_COLUMNS, compute_base_indicators
+    from signals.config import COMPUTE_WARMUP_BARS, INCREMENTAL_WARMUP_BARS
 except Exception:
     # 最後備援：嘗試相對匯入（若此模組被作為 package 匯入）
     from .signals import db as dbmod
+    from .signals import backtest as btmod
     from .signals import indicators as ind
+    from .signals.backends import MSSQLBackend
     from .signals import trades as tradesmod
+    from .signals.metrics import StageMetrics
+    from .signals import sinks
+    from .signals import timeframes as tfmod
+    from .signals.compute import RAW_COLUMNS, compute_base_indicators
+    from .signals.config import COMPUTE_WARMUP_BARS, INCREMENTAL_WARMUP_BARS
+
+
+def _signals_table_for_data_table(data_table: str) -> str:
+    """根據輸入的資料表名稱決定要儲存到哪個 trade_signals 表"""
+    # 支援 schema.table 或 [schema].[table] 等格式
+    if not data_table:
+        return 'trade_signals'
+    base = data_table.split('.')[-1]
+    base = base.replace('[', '').replace(']', '')
+    if '_' in base:
+        suffix = base.split('_')[-1]
+        return f'trade_signals_{suffix}'
+    return 'trade_signals'
+
+
+# 只計算部分指標（--indicators）時寫入的訊號表後綴
+PARTIAL_SUFFIX = '_partial'
+
+
+def _signals_table_for(data_table, indicators=None):
+    """
+    分析結果寫入的訊號表：只選部分指標時寫入 trade_signals_<週期>_partial，
+    避免以部分規則計分的 Trade_Signal 覆蓋完整模型的訊號。
+    """
+    signals_table = _signals_table_for_data_table(data_table)
+    if ind.is_partial(indicators):
+        signals_table += PARTIAL_SUFFIX
+    return signals_table
+
+
+def output_table_for(data_table, indicators=None):
+    """
+    輸出檔名與資料集 table 分區使用的資料表名稱：只選部分指標時同樣
+    加上 _partial 後綴，避免覆寫完整模型的輸出檔
+    """
+    if ind.is_partial(indicators):
+        return data_table + PARTIAL_SUFFIX
+    return data_table
 
 
 def analyze_signals_from_db(
@@ -38,20 +90,7 @@ def analyze_signals_from_db(
 
     df = df.sort_values('datetime').reset_index(drop=True)
 
-    df = ind.ma_cross_signal(df)
-    df = ind.bollinger_signal(df)
-    df = ind.macd_signal(df)
-    df = ind.trend_signal(df)
-    df = ind.macd_divergence(df)
-    df = ind.anomaly_detection(df)
-    df = ind.rsi_signal(df)
-    df = ind.kd_signal(df)
-    df = ind.support_resistance_signal(df)
-    df = ind.volume_anomaly_signal(df)
-    df = ind.ema_cross_signal(df)
-    df = ind.cci_signal(df)
-    df = ind.willr_signal(df)
-    df = ind.momentum_signal(df)
+    df = ind.compute_signals(df)
 
     calc_time = time.time() - calc_start
     print(f"指標計算完成，耗時 {calc_time:.2f} 秒")
@@ -62,29 +101,20 @@ def analyze_signals_from_db(
     print(f"訊號生成完成，耗時 {signal_time:.2f} 秒")
 
     # 根據輸入的資料表名稱決定要儲存到哪個 trade_signals 表
-    def _signals_table_for_data_table(data_table: str) -> str:
-        # 支援 schema.table 或 [schema].[table] 等格式
-        if not data_table:
-            return 'trade_signals'
-        base = data_table.split('.')[-1]
-        base = base.replace('[', '').replace(']', '')
-        if '_' in base:
-            suffix = base.split('_')[-1]
-            return f'trade_signals_{suffix}'
-        return 'trade_signals'
-
     signals_table = _signals_table_for_data_table(table)
     print(f"開始儲存結果到資料庫（目標表：{signals_table}）...")
     save_start = time.time()
+    # 中文標籤與 Signal_Strength 只在輸出時才展開
+    out_df = tradesmod.format_signals_for_output(df)
     dbmod.save_signals_to_mssql(
-        df, server, database, user, password, table_name=signals_table
+        out_df, server, database, user, password, table_name=signals_table
     )
     save_time = time.time() - save_start
     print(f"資料庫儲存完成，耗時 {save_time:.2f} 秒")
 
     if output_path:
         csv_start = time.time()
-        df.to_csv(output_path, index=False, encoding='utf-8-sig')
+        out_df.to_csv(output_path, index=False, encoding='utf-8-sig')
         csv_time = time.time() - csv_start
         print(f"CSV檔案儲存完成，耗時 {csv_time:.2f} 秒，路徑: {output_path}")
 
@@ -98,6 +128,14 @@ def analyze_signals_from_db(
     tradesmod.print_analysis_summary(df)
 
 
+def _finish_result(result, total_start_time, metrics=None):
+    """輔助函式：補上總耗時與各階段指標並回傳分析結果"""
+    result['total'] = time.time() - total_start_time
+    if metrics is not None:
+        result['metrics'] = metrics.as_dict()
+    return result
+
+
 def _print_db_connection_help(err, server, database, user):
     """輔助函式：顯示資料庫連線錯誤訊息"""
     print("\n[錯誤] 無法連線到 MSSQL 資料庫")
@@ -121,145 +159,372 @@ def _print_table_error_help(err, table, server, database):
     print("----------------------------------------\n")
 
 
-def analyze_signals_from_db_with_symbol(
-    server,
-    database,
-    table,
-    user,
-    password,
-    output_path=None,
-    symbol=None,
+def _open_reader(
+    backend, table, symbols, batch_size=500,
+    since=None, cache_dir=None, refresh=False, compute_indicators=False,
+    indicators=None, raw=False,
 ):
-    total_start_time = time.time()
+    """依是否啟用本機快取，回傳 yield (symbol, DataFrame) 的讀取器"""
+    columns = _read_columns(compute_indicators, indicators, raw)
+    if cache_dir and not compute_indicators:
+        # 快取分區需保持完整欄位，部分指標時仍讀取全部欄位
+        columns = None
+    if cache_dir:
+        from signals.cache import OHLCVCache
+        return OHLCVCache(cache_dir).read_symbols(
+            backend, table, symbols,
+            batch_size=batch_size, refresh=refresh, columns=columns,
+        )
+    return backend.read_ohlcv_by_symbols(
+        table, symbols,
+        batch_size=batch_size, since=since,
+        warmup_bars=_warmup_bars(compute_indicators),
+        columns=columns,
+    )
 
-    print(f"開始分析 symbol={symbol}" if symbol else "開始分析全部資料")
 
-    if symbol and symbol != 'Unknown':
-        conn_str = (
-            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-            f"SERVER={server};DATABASE={database};UID={user};PWD={password}"
-        )
-        import pyodbc
-        try:
-            conn = pyodbc.connect(conn_str)
-        except Exception as e:
-            _print_db_connection_help(e, server, database, user)
-            return
-        with conn:
-            check_query = f"SELECT COUNT(*) FROM {table} WHERE symbol = ?"
-            cursor = conn.cursor()
-            try:
-                count = cursor.execute(check_query, symbol).fetchval()
-            except Exception as e:
-                # 可能是資料表不存在或 SQL 語法/物件錯誤
-                _print_table_error_help(e, table, server, database)
-                return
-
-            if count == 0:
-                print(f"找不到 symbol={symbol} 的資料，程式結束。")
-                return
-
-            print(f"找到 {count} 筆 {symbol} 的資料，開始讀取...")
-            query = f"SELECT * FROM {table} WHERE symbol = ? "
-            query += "ORDER BY datetime"
-            read_start = time.time()
-            try:
-                df = pd.read_sql(query, conn, params=[symbol])
-            except Exception as e:
-                _print_table_error_help(e, table, server, database)
-                return
-            read_time = time.time() - read_start
-            print(f"讀取完成，耗時 {read_time:.2f} 秒")
-    else:
-        read_start = time.time()
-        df = dbmod.read_ohlcv_from_mssql(
-            server, database, table, user, password
+def _read_columns(compute_indicators, indicators=None, raw=False):
+    """
+    決定要向資料庫讀取的欄位；None 表示全部欄位。
+    raw 為 True 時另外讀取原始 OHLCV 欄位（合成較粗時間週期用）。
+    """
+    # 自行計算指標時只需讀取原始 OHLCV 欄位
+    if compute_indicators:
+        return RAW_COLUMNS
+    selected = ind.resolve_indicators(indicators)
+    if len(selected) == len(ind.REGISTRY):
+        return None
+    # 只選部分指標時，只讀取這些指標的輸入欄位
+    columns = list(RAW_COLUMNS) if raw else ['symbol', 'datetime', 'close_price']
+    columns += [
+        c for c in ind.required_columns(selected) if c not in columns
+    ]
+    return columns
+
+
+def _timeframe_frames(df, table, timeframes, compute_indicators):
+    """
+    依 timeframes 產生各時間週期的 (週期, 資料表名稱, DataFrame,
+    是否自行計算指標, 合成耗時)。timeframes 為 None 時只回傳原始資料；
+    原始週期沿用讀到的資料，較粗的週期由原始 K 棒合成，指標一律自行計算。
+    """
+    if not timeframes:
+        yield None, table, df, compute_indicators, 0.0
+        return
+    base = tfmod.table_timeframe(table)
+    for timeframe in timeframes:
+        if timeframe == base:
+            yield timeframe, table, df, compute_indicators, 0.0
+            continue
+        start = time.time()
+        frame = tfmod.resample_ohlcv(df, timeframe)
+        yield (
+            timeframe, tfmod.timeframe_table(table, timeframe), frame, True,
+            time.time() - start,
         )
-        read_time = time.time() - read_start
 
-    if df.empty:
-        print("沒有資料可分析，程式結束。")
-        return
 
-    print("開始計算技術指標...")
-    calc_start = time.time()
+def _needs_raw(table, timeframes):
+    """是否需要合成較粗的週期（需讀取原始 OHLCV 欄位）"""
+    base = tfmod.table_timeframe(table)
+    return any(tf != base for tf in timeframes or ())
 
-    signals = []
 
-    signals = []
+def _timeframe_output(output_path, timeframe, table, indicators=None):
+    """
+    較粗週期的輸出檔名加上週期後綴，避免覆寫原始週期的 CSV；
+    資料集輸出則改寫到該週期資料表的 table 分區
+    """
+    if not output_path or timeframe in (None, tfmod.table_timeframe(table)):
+        return output_path
+    if sinks.output_format(output_path) != 'csv':
+        return sinks.with_table(output_path, output_table_for(
+            tfmod.timeframe_table(table, timeframe), indicators
+        ))
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_{timeframe}{ext or '.csv'}"
 
-    df = ind.ma_cross_signal(df)
-    signals.append("MA交叉")
 
-    df = ind.bollinger_signal(df)
-    signals.append("布林通道")
+def _analyze_read_symbol(
+    server, database, table, user, password, symbol, df, read_time,
+    output_path=None, timeframes=None, compute_indicators=False, **kwargs
+):
+    """
+    分析已讀取的單一 symbol（各時間週期各一筆結果），回傳結果串列。
+    讀取耗時計入第一個時間週期；例外轉為 status='error' 的結果。
+    """
+    results = []
+    for timeframe, tf_table, tf_df, tf_compute, resample_time in (
+        _timeframe_frames(df, table, timeframes, compute_indicators)
+    ):
+        metrics = StageMetrics(symbol, database=database, table=tf_table)
+        if not results:
+            metrics.add('read', read_time, rows=len(df))
+        if resample_time:
+            metrics.add('resample', resample_time, rows=len(df))
+        tf_output = _timeframe_output(
+            output_path, timeframe, table, kwargs.get('indicators')
+        )
+        try:
+            result = analyze_signals_from_db_with_symbol(
+                server, database, tf_table, user, password,
+                output_path=tf_output,
+                symbol=symbol,
+                df=tf_df,
+                compute_indicators=tf_compute,
+                metrics=metrics,
+                **kwargs,
+            )
+        except Exception as e:
+            print(f"[錯誤] 分析 symbol={symbol} 時發生錯誤: {str(e)}")
+            result = {
+                'symbol': symbol,
+                'status': 'error',
+                'error': str(e),
+                'total': 0.0,
+                'output': tf_output,
+                'metrics': metrics.as_dict(),
+            }
+        if timeframe is not None:
+            result['timeframe'] = timeframe
+        if not results:
+            result['read'] = read_time
+            result['total'] += read_time
+        results.append(result)
+    return results
+
+
+def _warmup_bars(compute_indicators):
+    return COMPUTE_WARMUP_BARS if compute_indicators else INCREMENTAL_WARMUP_BARS
+
+
+def _warmup_slice(df, since, warmup_bars=INCREMENTAL_WARMUP_BARS):
+    """只保留水位線之後的資料，以及之前 warmup_bars 根暖機資料"""
+    new_rows = (df['datetime'] > pd.Timestamp(since)).to_numpy()
+    if not new_rows.any():
+        return df.iloc[0:0]
+    first = int(new_rows.argmax())
+    start = max(0, first - warmup_bars)
+    return df.iloc[start:].reset_index(drop=True)
+
+
+def _report_read_error(err, server, database, table, user):
+    """輔助函式：依例外類型顯示連線或資料表錯誤，並回傳對應狀態"""
+    # SQLite 的資料表不存在也是 OperationalError，以訊息區分
+    if (
+        type(err).__name__ in ('OperationalError', 'InterfaceError')
+        and 'no such table' not in str(err)
+    ):
+        _print_db_connection_help(err, server, database, user)
+        return 'db_error'
+    _print_table_error_help(err, table, server, database)
+    return 'table_error'
+
+
+def _compute_symbol(
+    df, result, metrics, symbol=None, incremental=False, since=None,
+    compute_indicators=False, indicators=None, backtest=None,
+):
+    """
+    計算單一 symbol 的指標與訊號並轉為輸出格式，回傳 (df, out_df)。
+    沒有需要寫入的資料時設定 result['status'] 並回傳 (None, None)。
+    """
+    if incremental and since is not None:
+        # 快取讀取會拿到完整歷史，只保留暖機區間與新資料
+        df = _warmup_slice(df, since, _warmup_bars(compute_indicators))
+        if df.empty:
+            print(f"symbol={symbol} 沒有新資料，略過。")
+            result['status'] = 'up_to_date'
+            return None, None
 
-    df = ind.macd_signal(df)
-    signals.append("MACD交叉")
+    if df.empty:
+        print("沒有資料可分析，程式結束。")
+        result['status'] = 'no_data'
+        return None, None
+    result['rows'] = len(df)
 
-    df = ind.trend_signal(df)
-    signals.append("趨勢判斷")
+    print("開始計算技術指標...")
+    selected = ind.resolve_indicators(indicators)
+    with metrics.stage('calc', rows=len(df)):
+        if compute_indicators:
+            # 由原始 OHLCV 計算基礎指標欄位，取代資料表中預存的指標；
+            # 只計算所選訊號需要的欄位
+            with metrics.stage('compute_base', rows=len(df)):
+                df = compute_base_indicators(
+                    df, columns=ind.required_columns(selected)
+                )
+
+        df = ind.compute_signals(df, indicators=selected, metrics=metrics)
+
+    calc_time = metrics.seconds('calc')
+    result['calc'] = calc_time
+    print(f"指標計算完成，耗時 {calc_time:.2f} 秒，共計算 {len(selected)} 個指標")
+
+    with metrics.stage('signal', rows=len(df)):
+        df = tradesmod.generate_trade_signals(df)
+    signal_time = metrics.seconds('signal')
+    result['signal'] = signal_time
+    print(f"訊號生成完成，耗時 {signal_time:.2f} 秒")
 
-    df = ind.macd_divergence(df)
-    signals.append("MACD背離")
+    if backtest:
+        with metrics.stage('backtest', rows=len(df)):
+            result['backtest'] = btmod.summarize(df, backtest)
 
-    df = ind.anomaly_detection(df)
-    signals.append("異常偵測")
+    if incremental and since is not None:
+        # 暖機區間只用於計算指標，只保留水位線之後的新資料
+        df = df[df['datetime'] > pd.Timestamp(since)].reset_index(drop=True)
+        print(f"增量模式：{since} 之後共有 {len(df)} 筆新資料")
+        result['rows'] = len(df)
+        if df.empty:
+            result['status'] = 'up_to_date'
+            return None, None
 
-    df = ind.rsi_signal(df)
-    signals.append("RSI訊號")
+    # 中文標籤與 Signal_Strength 只在輸出時才展開
+    with metrics.stage('format', rows=len(df)):
+        out_df = tradesmod.format_signals_for_output(df)
+    return df, out_df
 
-    df = ind.kd_signal(df)
-    signals.append("KD訊號")
 
-    df = ind.support_resistance_signal(df)
-    signals.append("壓力支撐位")
+def _write_output(out_df, output_path, append=False, metrics=None):
+    """
+    寫出 CSV 或 Parquet / Feather 資料集分區（依副檔名，見 signals.sinks）；
+    append 為 True 時附加在既有輸出之後。耗時記錄在以格式命名的階段。
+    """
+    with metrics.stage(sinks.output_format(output_path), rows=len(out_df)):
+        path = sinks.write_output(out_df, output_path, append)
+    print(f'分析結果已儲存至 {path}')
 
-    df = ind.volume_anomaly_signal(df)
-    signals.append("成交量異常")
 
-    df = ind.ema_cross_signal(df)
-    signals.append("EMA交叉")
+def analyze_signals_from_db_with_symbol(
+    server,
+    database,
+    table,
+    user,
+    password,
+    output_path=None,
+    symbol=None,
+    df=None,
+    incremental=False,
+    since=None,
+    save_batch_size=10000,
+    cache_dir=None,
+    refresh=False,
+    compute_indicators=False,
+    indicators=None,
+    metrics=None,
+    backend=None,
+    backtest=None,
+    snapshot=None,
+):
+    """
+    分析單一 symbol（或整張表）並寫回資料庫，回傳結果 dict。
 
-    df = ind.cci_signal(df)
-    signals.append("CCI訊號")
+    backend 為 signals.backends 的儲存後端，未傳入時以 server / database /
+    user / password 建立 MSSQLBackend。
 
-    df = ind.willr_signal(df)
-    signals.append("威廉指標")
+    各階段（read、compute_base、indicator:<名稱>、calc、signal、format、
+    save、csv / parquet / feather）的耗時、筆數與記憶體峰值記錄在 metrics（StageMetrics，
+    未傳入時自行建立），並以 result['metrics'] 回傳。
 
-    df = ind.momentum_signal(df)
-    signals.append("動量指標")
+    backtest 為回測的 N 根後報酬（整數或串列，例如 [1, 5, 20]），有值時
+    以 backtest.summarize 計算本次資料的回測統計放在 result['backtest']，
+    由呼叫端以 backtest.combine 合併；增量模式下只含本次讀取的資料。
 
-    calc_time = time.time() - calc_start
-    print(f"指標計算完成，耗時 {calc_time:.2f} 秒，共計算 {len(signals)} 個指標")
+    snapshot 為 signals.snapshot.SignalSnapshot 時，寫入資料庫後以最後
+    一根 K 棒更新快照。
+    """
+    total_start_time = time.time()
+    if backend is None:
+        backend = MSSQLBackend(server, database, user, password)
+    if metrics is None:
+        metrics = StageMetrics(symbol, database=database, table=table)
+    # 回傳給呼叫端（例如 main.py 的平行模式）彙整用的結果
+    result = {
+        'symbol': symbol,
+        'status': 'ok',
+        'rows': 0,
+        'read': 0.0,
+        'calc': 0.0,
+        'signal': 0.0,
+        'save': 0.0,
+        'total': 0.0,
+        'output': output_path,
+    }
 
-    signal_start = time.time()
-    df = tradesmod.generate_trade_signals(df)
-    signal_time = time.time() - signal_start
-    print(f"訊號生成完成，耗時 {signal_time:.2f} 秒")
+    print(f"開始分析 symbol={symbol}" if symbol else "開始分析全部資料")
 
-    # 決定 trade_signals 表名，並儲存
-    def _signals_table_for_data_table(data_table: str) -> str:
-        if not data_table:
-            return 'trade_signals'
-        base = data_table.split('.')[-1]
-        base = base.replace('[', '').replace(']', '')
-        if '_' in base:
-            suffix = base.split('_')[-1]
-            return f'trade_signals_{suffix}'
-        return 'trade_signals'
+    if df is not None:
+        # 呼叫端已預先讀好資料（例如批次讀取），直接使用
+        pass
+    elif symbol and symbol != 'Unknown':
+        try:
+            with metrics.stage('read') as stage:
+                if incremental and since is None:
+                    since = backend.read_signal_watermarks(
+                        _signals_table_for(table, indicators), [symbol],
+                    ).get(symbol)
+                _, df = next(iter(_open_reader(
+                    backend, table, [symbol],
+                    since={symbol: since} if incremental else None,
+                    cache_dir=cache_dir, refresh=refresh,
+                    compute_indicators=compute_indicators,
+                    indicators=indicators,
+                )))
+                stage['rows'] = len(df)
+        except Exception as e:
+            result['status'] = _report_read_error(
+                e, server, database, table, user
+            )
+            return _finish_result(result, total_start_time, metrics)
+        if df.empty:
+            print(f"找不到 symbol={symbol} 的資料，程式結束。")
+            result['status'] = 'no_data'
+            return _finish_result(result, total_start_time, metrics)
+        print(
+            f"讀取 {len(df)} 筆 {symbol} 的資料，"
+            f"耗時 {metrics.seconds('read'):.2f} 秒"
+        )
+    else:
+        with metrics.stage('read') as stage:
+            df = backend.read_ohlcv(table)
+            stage['rows'] = len(df)
+    read_time = metrics.seconds('read')
+    result['read'] = read_time
+
+    df, out_df = _compute_symbol(
+        df, result, metrics, symbol=symbol, incremental=incremental,
+        since=since, compute_indicators=compute_indicators,
+        indicators=indicators, backtest=backtest,
+    )
+    if df is None:
+        return _finish_result(result, total_start_time, metrics)
+    calc_time = result['calc']
+    signal_time = result['signal']
 
-    signals_table = _signals_table_for_data_table(table)
-    save_start = time.time()
+    signals_table = _signals_table_for(table, indicators)
     print(f"開始儲存結果到資料庫（目標表：{signals_table}）...")
-    dbmod.save_signals_to_mssql(
-        df, server, database, user, password, table_name=signals_table
-    )
-    save_time = time.time() - save_start
+    try:
+        with metrics.stage('save', rows=len(out_df)):
+            save_stats = backend.save_signals(
+                out_df, signals_table, batch_size=save_batch_size,
+            )
+    except Exception as e:
+        # 未寫入資料庫的訊號不輸出檔案、不更新快照
+        print(f"[錯誤] 寫入 {signals_table} 時發生錯誤: {str(e)}")
+        result['status'] = 'error'
+        result['error'] = str(e)
+        result['save'] = metrics.seconds('format') + metrics.seconds('save')
+        return _finish_result(result, total_start_time, metrics)
+    save_time = metrics.seconds('format') + metrics.seconds('save')
+    result['save_rows_per_sec'] = save_stats['rows_per_sec']
+    result['save_skipped'] = save_stats.get('skipped', 0)
+    if snapshot is not None:
+        snapshot.update(out_df, signals_table)
 
     if output_path:
-        df.to_csv(output_path, index=False, encoding='utf-8-sig')
-        print(f'分析結果已儲存至 {output_path}')
+        _write_output(
+            out_df, output_path, incremental and since is not None, metrics
+        )
 
     total_time = time.time() - total_start_time
     print(f"\n總執行時間: {total_time:.2f} 秒")
@@ -269,3 +534,172 @@ def analyze_signals_from_db_with_symbol(
     print(f"- 資料儲存: {save_time:.2f}秒 ({save_time/total_time*100:.1f}%)")
 
     tradesmod.print_analysis_summary(df)
+
+    result['save'] = save_time
+    return _finish_result(result, total_start_time, metrics)
+
+
+def analyze_signals_for_symbols(
+    server,
+    database,
+    table,
+    user,
+    password,
+    symbols,
+    output_paths=None,
+    batch_size=500,
+    incremental=False,
+    save_batch_size=10000,
+    cache_dir=None,
+    refresh=False,
+    compute_indicators=False,
+    indicators=None,
+    backend=None,
+    backtest=None,
+    timeframes=None,
+    snapshot=None,
+):
+    """
+    批次讀取多個 symbol 後逐一分析，回傳各 symbol 的結果串列。
+
+    資料以 read_ohlcv_by_symbols 的集合查詢取得，output_paths 為
+    symbol -> 輸出路徑的 dict。每個 symbol 的讀取耗時為等待該筆
+    資料所花的時間（批次中第一個 symbol 會承擔整批查詢的時間）。
+    incremental 為 True 時先以一次查詢取得所有 symbol 的水位線，
+    只讀取並寫回水位線之後的新資料。cache_dir 有值時改由本機
+    OHLCV 快取讀取，只向資料庫要快取水位線之後的新 K 棒。
+    indicators 為要計算的指標（見 indicators.resolve_indicators）。
+    backend 為儲存後端，未傳入時使用 MSSQL。
+    backtest 為回測的 N 根後報酬，見 analyze_signals_from_db_with_symbol。
+    timeframes 為時間週期串列（例如 ['1h', '1d', '1w']）時，每個 symbol
+    只讀取 table 一次，在本機合成較粗的週期並分別寫入
+    trade_signals_<週期>，每個週期各回傳一筆結果（含 'timeframe'）；
+    不支援與 incremental 併用。snapshot 為最新訊號快照（可為 None）。
+    """
+    if backend is None:
+        backend = MSSQLBackend(server, database, user, password)
+    output_paths = output_paths or {}
+    results = []
+    pending = list(dict.fromkeys(str(s) for s in symbols))
+    watermarks = {}
+    if incremental:
+        try:
+            watermarks = backend.read_signal_watermarks(
+                _signals_table_for(table, indicators), pending,
+            )
+        except Exception as e:
+            print(f"讀取水位線時發生錯誤，改為完整重算: {str(e)}")
+        print(
+            f"增量模式：{len(watermarks)}/{len(pending)} 個 symbol 已有訊號紀錄"
+        )
+    reader = _open_reader(
+        backend, table, pending,
+        batch_size=batch_size, since=watermarks,
+        cache_dir=cache_dir, refresh=refresh,
+        compute_indicators=compute_indicators, indicators=indicators,
+        raw=_needs_raw(table, timeframes),
+    )
+    while pending:
+        read_start = time.time()
+        try:
+            symbol, df = next(reader)
+        except StopIteration:
+            break
+        except Exception as e:
+            status = _report_read_error(e, server, database, table, user)
+            for symbol in pending:
+                results.append({
+                    'symbol': symbol,
+                    'status': status,
+                    'error': str(e),
+                    'output': output_paths.get(symbol),
+                })
+            break
+        read_time = time.time() - read_start
+        pending.remove(symbol)
+
+        if df.empty:
+            print(f"找不到 symbol={symbol} 的資料，略過。")
+            results.append({
+                'symbol': symbol,
+                'status': 'no_data',
+                'rows': 0,
+                'read': read_time,
+                'total': read_time,
+                'output': output_paths.get(symbol),
+            })
+            continue
+
+        results.extend(_analyze_read_symbol(
+            server, database, table, user, password, symbol, df, read_time,
+            output_path=output_paths.get(symbol),
+            timeframes=timeframes,
+            compute_indicators=compute_indicators,
+            incremental=incremental,
+            since=watermarks.get(symbol),
+            save_batch_size=save_batch_size,
+            indicators=indicators,
+            backend=backend,
+            backtest=backtest,
+            snapshot=snapshot,
+        ))
+    return results
+
+
+def analyze_signals_for_table(
+    server,
+    database,
+    table,
+    user,
+    password,
+    output_for_symbol=None,
+    page_size=50000,
+    save_batch_size=10000,
+    compute_indicators=False,
+    indicators=None,
+    backend=None,
+    backtest=None,
+    timeframes=None,
+    snapshot=None,
+):
+    """
+    串流分析整張資料表的所有 symbol，回傳各 symbol 的結果串列。
+
+    以 iter_ohlcv_from_mssql 的 keyset 分頁讀取，每讀完一個 symbol 就
+    立即計算並寫回，不需將整張表載入記憶體。output_for_symbol 為
+    symbol -> 輸出路徑的函式（可為 None）。timeframes、snapshot 同
+    analyze_signals_for_symbols。
+    """
+    if backend is None:
+        backend = MSSQLBackend(server, database, user, password)
+    results = []
+    reader = backend.iter_ohlcv(
+        table, page_size=page_size,
+        columns=_read_columns(
+            compute_indicators, indicators, _needs_raw(table, timeframes),
+        ),
+    )
+    while True:
+        read_start = time.time()
+        try:
+            symbol, df = next(reader)
+        except StopIteration:
+            break
+        except Exception as e:
+            status = _report_read_error(e, server, database, table, user)
+            results.append({'symbol': None, 'status': status, 'error': str(e)})
+            break
+        read_time = time.time() - read_start
+        output_path = output_for_symbol(symbol) if output_for_symbol else None
+        results.extend(_analyze_read_symbol(
+            server, database, table, user, password, symbol, df, read_time,
+            output_path=output_path,
+            timeframes=timeframes,
+            compute_indicators=compute_indicators,
+            save_batch_size=save_batch_size,
+            indicators=indicators,
+            backend=backend,
+            backtest=backtest,
+            snapshot=snapshot,
+        ))
+    return results
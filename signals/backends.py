@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+"""儲存後端：將 OHLCV 讀取、訊號寫入與水位線查詢抽象為同一介面
+
+- MSSQLBackend：原本 signals.db 的 MSSQL（pyodbc）實作
+- SQLiteBackend：內嵌 SQLite 檔案，不需資料庫伺服器，適合開發、回測
+  與離線執行；資料表與欄位名稱與 MSSQL 相同
+
+分析流程（signals.analyzer）只透過 StorageBackend 的方法存取資料，
+以 --backend 選擇實作。compact=True（--compact-storage）時兩種後端都
+改寫入精簡模式的窄表（見 signals.compact），呼叫端仍傳入原本的訊號表
+名稱。後端物件可直接傳給平行模式的 worker 行程
+（MSSQLBackend 的連線工作階段序列化時只保留連線參數）。
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from . import compact as compactmod
+from . import db as dbmod
+
+# 明確指定 datetime 的轉換方式（Python 3.12 起預設轉換器已棄用）
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(' '))
+sqlite3.register_adapter(pd.Timestamp, lambda v: v.isoformat(' '))
+
+
+class StorageBackend:
+    """儲存後端介面"""
+
+    name = None
+    compact = False
+
+    def signals_table(self, table_name):
+        """實際寫入的訊號表名稱：精簡模式為 <table_name>_packed"""
+        if self.compact:
+            return compactmod.packed_table(table_name)
+        return table_name
+
+    @property
+    def database_name(self):
+        """本機快取分區等用途的資料庫識別名稱"""
+        raise NotImplementedError
+
+    def read_ohlcv(self, table):
+        """讀取整張資料表，依 datetime 排序"""
+        parts = [df for _, df in self.iter_ohlcv(table)]
+        if not parts:
+            return pd.DataFrame()
+        df = pd.concat(parts, ignore_index=True)
+        return df.sort_values('datetime', kind='stable').reset_index(drop=True)
+
+    def iter_ohlcv(self, table, page_size=50000, columns=None):
+        """依 (symbol, datetime) 順序串流整張資料表，逐一 yield (symbol, DataFrame)"""
+        raise NotImplementedError
+
+    def read_ohlcv_by_symbols(
+        self, table, symbols, batch_size=500, since=None, warmup_bars=0,
+        columns=None,
+    ):
+        """批次讀取多個 symbol，逐一 yield (symbol, DataFrame)；語意同 db.read_ohlcv_by_symbols"""
+        raise NotImplementedError
+
+    def read_symbols(self, table):
+        """列出資料表內所有 symbol（依名稱排序）"""
+        raise NotImplementedError
+
+    def read_signal_watermarks(self, table_name, symbols):
+        """回傳 symbol -> 訊號表中最新 datetime 的 dict"""
+        raise NotImplementedError
+
+    def save_signals(self, df, table_name, batch_size=10000):
+        """
+        依 (symbol, datetime) upsert 訊號，略過 signal_hash 未變更的資料列；
+        回傳 {'rows', 'skipped', 'seconds', 'rows_per_sec'}。寫入失敗時
+        拋出例外（呼叫端據此不推進水位線、不輸出檔案與快照）。
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """釋放後端持有的連線（沒有長期連線的後端不做任何事）"""
+
+
+class MSSQLBackend(StorageBackend):
+    """
+    MSSQL（pyodbc）後端，委派給 signals.db 的函式。
+
+    所有讀寫共用一個 db.MSSQLSession：連線用完放回重複使用，已確認存在
+    的訊號表不再重跑 DDL，多個 symbol 連續寫入時不需每次重新連線。
+    """
+
+    name = 'mssql'
+
+    def __init__(self, server, database, user, password, compact=False):
+        self.server = server
+        self.database = database
+        self.user = user
+        self.password = password
+        self.compact = compact
+        self.session = dbmod.MSSQLSession(server, database, user, password)
+
+    @property
+    def database_name(self):
+        return self.database
+
+    def close(self):
+        self.session.close()
+
+    def read_ohlcv(self, table):
+        return dbmod.read_ohlcv_from_mssql(
+            self.server, self.database, table, self.user, self.password,
+            session=self.session,
+        )
+
+    def iter_ohlcv(self, table, page_size=50000, columns=None):
+        return dbmod.iter_ohlcv_from_mssql(
+            self.server, self.database, table, self.user, self.password,
+            page_size=page_size, columns=columns, session=self.session,
+        )
+
+    def read_ohlcv_by_symbols(
+        self, table, symbols, batch_size=500, since=None, warmup_bars=0,
+        columns=None,
+    ):
+        return dbmod.read_ohlcv_by_symbols(
+            self.server, self.database, table, self.user, self.password,
+            symbols, batch_size=batch_size, since=since,
+            warmup_bars=warmup_bars, columns=columns, session=self.session,
+        )
+
+    def read_symbols(self, table):
+        return dbmod.read_symbols(
+            self.server, self.database, self.user, self.password, table,
+            session=self.session,
+        )
+
+    def read_signal_watermarks(self, table_name, symbols):
+        return dbmod.read_signal_watermarks(
+            self.server, self.database, self.user, self.password,
+            self.signals_table(table_name), symbols, session=self.session,
+        )
+
+    def save_signals(self, df, table_name, batch_size=10000):
+        return dbmod.save_signals_to_mssql(
+            df, self.server, self.database, self.user, self.password,
+            table_name=table_name, batch_size=batch_size,
+            session=self.session, compact=self.compact, raise_errors=True,
+        )
+
+
+_SIGNAL_NUMERIC_COLUMNS = ('close_price', 'Buy_Signals', 'Sell_Signals')
+
+
+def _sqlite_type(col):
+    if col == 'datetime':
+        return 'TIMESTAMP'
+    if col in ('signal_hash', 'signal_bits'):
+        return 'INTEGER'
+    if col in _SIGNAL_NUMERIC_COLUMNS:
+        return 'REAL'
+    return 'TEXT'
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    內嵌 SQLite 後端：OHLCV 與 trade_signals 表存放在同一個檔案。
+
+    datetime 以 'YYYY-MM-DD HH:MM:SS' 文字儲存（與 pandas to_sql 相同），
+    字串比較即為時間先後。每次操作各自開關連線，物件可安全地傳給
+    其他行程。
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, compact=False):
+        self.path = path
+        self.compact = compact
+
+    @property
+    def database_name(self):
+        return os.path.splitext(os.path.basename(self.path))[0] or 'sqlite'
+
+    def connect(self):
+        if not os.path.exists(self.path):
+            # 與 MSSQL 找不到資料庫時相同，視為連線錯誤而非建立空檔
+            raise sqlite3.OperationalError(
+                f"SQLite 資料庫檔案不存在: {self.path}"
+            )
+        return sqlite3.connect(self.path)
+
+    def import_ohlcv(self, df, table, if_exists='append'):
+        """
+        將匯出的歷史 OHLCV（例如 CSV / Parquet 讀成的 DataFrame）寫入
+        table，並建立 (symbol, datetime) 索引。回傳寫入筆數。
+        """
+        df = df.copy()
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        conn = sqlite3.connect(self.path)
+        try:
+            df.to_sql(table, conn, if_exists=if_exists, index=False)
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_symbol_datetime "
+                f"ON {table} (symbol, datetime)"
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return len(df)
+
+    def _read_sql(self, conn, query, params=()):
+        df = pd.read_sql(query, conn, params=list(params))
+        if 'datetime' in df.columns:
+            df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
+        return df
+
+    def iter_ohlcv(self, table, page_size=50000, columns=None):
+        """
+        與 MSSQL 版本相同的 (symbol, datetime) keyset 分頁；每頁讀完即
+        關閉連線，呼叫端在 yield 之間寫入同一個檔案時不會被讀取鎖住。
+        """
+        page_size = max(1, int(page_size))
+        select = dbmod._select_list(columns)
+        first_query = (
+            f"SELECT {select} FROM {table} "
+            f"ORDER BY symbol, datetime LIMIT ?"
+        )
+        next_query = (
+            f"SELECT {select} FROM {table} "
+            f"WHERE symbol > ? OR (symbol = ? AND datetime > ?) "
+            f"ORDER BY symbol, datetime LIMIT ?"
+        )
+        pending = []
+        pending_symbol = None
+        last_key = None
+        while True:
+            conn = self.connect()
+            try:
+                if last_key is None:
+                    page = self._read_sql(conn, first_query, [page_size])
+                else:
+                    symbol, last_dt = last_key
+                    page = self._read_sql(
+                        conn, next_query,
+                        [symbol, symbol, last_dt, page_size],
+                    )
+            finally:
+                conn.close()
+            if page.empty:
+                break
+            last_row = page.iloc[-1]
+            last_key = (last_row['symbol'], pd.Timestamp(last_row['datetime']))
+
+            for symbol, part in page.groupby('symbol', sort=False):
+                if pending_symbol is not None and symbol != pending_symbol:
+                    yield dbmod._flush_pending(pending_symbol, pending)
+                    pending = []
+                pending_symbol = symbol
+                pending.append(part)
+            if len(page) < page_size:
+                break
+        if pending_symbol is not None:
+            yield dbmod._flush_pending(pending_symbol, pending)
+
+    def read_ohlcv_by_symbols(
+        self, table, symbols, batch_size=500, since=None, warmup_bars=0,
+        columns=None,
+    ):
+        # SQLite 參數上限預設為 999（3.32 起為 32766），保守取 900
+        batch_size = max(1, min(int(batch_size), 900))
+        wanted = list(dict.fromkeys(str(s) for s in symbols))
+        since = since or {}
+        select = dbmod._select_list(columns)
+        for i in range(0, len(wanted), batch_size):
+            batch = wanted[i:i + batch_size]
+            full = [s for s in batch if since.get(s) is None]
+            conn = self.connect()
+            try:
+                parts = []
+                if full:
+                    placeholders = ', '.join('?' for _ in full)
+                    parts.append(self._read_sql(
+                        conn,
+                        f"SELECT {select} FROM {table} "
+                        f"WHERE symbol IN ({placeholders}) "
+                        f"ORDER BY symbol, datetime",
+                        full,
+                    ))
+                for symbol in batch:
+                    if since.get(symbol) is None:
+                        continue
+                    # 水位線前 warmup_bars 根暖機與之後的全部新資料
+                    mark = pd.Timestamp(since[symbol])
+                    parts.append(self._read_sql(
+                        conn,
+                        f"SELECT * FROM ("
+                        f"SELECT {select} FROM {table} "
+                        f"WHERE symbol = ? AND datetime <= ? "
+                        f"ORDER BY datetime DESC LIMIT ?) "
+                        f"UNION ALL "
+                        f"SELECT {select} FROM {table} "
+                        f"WHERE symbol = ? AND datetime > ?",
+                        [symbol, mark, int(warmup_bars), symbol, mark],
+                    ))
+            finally:
+                conn.close()
+            parts = [p for p in parts if not p.empty] or parts[:1]
+            df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+            if not df.empty:
+                df = df.sort_values(
+                    ['symbol', 'datetime'], kind='stable'
+                ).reset_index(drop=True)
+            print(f"批次讀取 {len(batch)} 個 symbol，共 {len(df):,} 筆資料")
+            for symbol, part in dbmod._split_by_symbol(df, batch):
+                yield symbol, part
+
+    def read_symbols(self, table):
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                f"SELECT DISTINCT symbol FROM {table} ORDER BY symbol"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [str(row[0]) for row in rows if row[0] is not None]
+
+    def _table_exists(self, conn, table_name):
+        row = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master "
+            "WHERE type = 'table' AND name = ?",
+            (table_name,),
+        ).fetchone()
+        return bool(row[0])
+
+    def read_signal_watermarks(self, table_name, symbols):
+        table_name = self.signals_table(table_name)
+        wanted = list(dict.fromkeys(str(s) for s in symbols))
+        watermarks = {}
+        conn = self.connect()
+        try:
+            if not self._table_exists(conn, table_name):
+                return watermarks
+            for i in range(0, len(wanted), 900):
+                batch = wanted[i:i + 900]
+                placeholders = ', '.join('?' for _ in batch)
+                rows = conn.execute(
+                    f"SELECT symbol, MAX(datetime) FROM {table_name} "
+                    f"WHERE symbol IN ({placeholders}) GROUP BY symbol",
+                    batch,
+                ).fetchall()
+                for symbol, last in rows:
+                    if last is not None:
+                        watermarks[str(symbol)] = pd.Timestamp(last)
+        finally:
+            conn.close()
+        return watermarks
+
+    def ensure_packed_table(self, conn, table_name):
+        """建立精簡模式的窄表與還原寬表的檢視表 <table_name>_wide"""
+        packed = compactmod.packed_table(table_name)
+        columns = ',\n    '.join(
+            f'{c} {_sqlite_type(c)}' for c in compactmod.PACKED_COLUMNS
+        )
+        created = not self._table_exists(conn, packed)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {packed} (\n"
+            f"    id INTEGER PRIMARY KEY AUTOINCREMENT,\n"
+            f"    {columns},\n"
+            f"    UNIQUE (symbol, datetime)\n"
+            f")"
+        )
+        view_exists = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master "
+            "WHERE type = 'view' AND name = ?",
+            (compactmod.wide_view(table_name),),
+        ).fetchone()[0]
+        if created or not view_exists:
+            for sql in compactmod.wide_view_sql(table_name, 'sqlite'):
+                conn.execute(sql)
+
+    def ensure_signals_table(self, conn, table_name):
+        if self.compact:
+            self.ensure_packed_table(conn, table_name)
+            return
+        columns = ',\n    '.join(
+            f'{c} {_sqlite_type(c)}' for c in dbmod.SIGNAL_TABLE_COLUMNS
+        )
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table_name} (\n"
+            f"    id INTEGER PRIMARY KEY AUTOINCREMENT,\n"
+            f"    {columns},\n"
+            f"    UNIQUE (symbol, datetime)\n"
+            f")"
+        )
+        existing = {
+            row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")
+        }
+        if 'signal_hash' not in existing:
+            # 舊版建立的資料表補上變更偵測用的雜湊欄
+            conn.execute(
+                f"ALTER TABLE {table_name} ADD COLUMN signal_hash INTEGER"
+            )
+
+    def save_signals(self, df, table_name, batch_size=10000):
+        """
+        與 save_signals_to_mssql 相同語意的 upsert：依 (symbol, datetime)
+        更新或插入，整批寫入在單一交易內完成；signal_hash 未變更的資料列
+        略過不寫。精簡模式寫入 <table_name>_packed。
+        """
+        start_time = time.time()
+        # 補上缺少的欄位時不修改呼叫端的 DataFrame（之後仍用於輸出檔與快照）
+        df = df.assign(**{
+            col: 'Unknown' if col == 'symbol' else ''
+            for col in dbmod.SIGNAL_TABLE_COLUMNS
+            if col not in df.columns and col != 'signal_hash'
+        })
+        target_table = self.signals_table(table_name)
+        columns = (
+            compactmod.PACKED_COLUMNS if self.compact
+            else dbmod.SIGNAL_TABLE_COLUMNS
+        )
+        placeholders = ', '.join('?' for _ in columns)
+        updates = ', '.join(
+            f'{c} = excluded.{c}' for c in columns
+            if c not in ('symbol', 'datetime')
+        )
+        upsert_sql = (
+            f"INSERT INTO {target_table} ({', '.join(columns)}) "
+            f"VALUES ({placeholders})\n"
+            f"ON CONFLICT (symbol, datetime) DO UPDATE SET {updates}"
+        )
+        batch_size = max(1, int(batch_size))
+        # 訊號表可建立在新檔案中，因此不經過 connect() 的存在檢查
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                self.ensure_signals_table(conn, table_name)
+                df, skipped = dbmod.skip_unchanged(
+                    df,
+                    lambda sql, params: conn.execute(sql, params).fetchall(),
+                    target_table,
+                )
+                if self.compact:
+                    df = compactmod.packed_frame(df)
+                records = dbmod._staging_records(df, columns)
+                for i in range(0, len(records), batch_size):
+                    conn.executemany(upsert_sql, records[i:i + batch_size])
+        finally:
+            conn.close()
+
+        seconds = time.time() - start_time
+        rows = len(df)
+        print(
+            f"已寫入 {rows} 筆資料至 {self.path}:{target_table}"
+            f"（略過 {skipped} 筆未變更）"
+        )
+        return {
+            'rows': rows,
+            'skipped': skipped,
+            'seconds': seconds,
+            'rows_per_sec': rows / seconds if seconds > 0 else 0.0,
+        }
+
+
+BACKENDS = ('mssql', 'sqlite')
+
+
+def make_backend(
+    name, server=None, database=None, user=None, password=None,
+    sqlite_path=None, compact=False,
+):
+    """依 --backend 名稱建立後端物件；compact 為 True 時使用精簡儲存"""
+    name = (name or 'mssql').lower()
+    if name == 'mssql':
+        return MSSQLBackend(server, database, user, password, compact=compact)
+    if name == 'sqlite':
+        if not sqlite_path:
+            raise ValueError("SQLite 後端需要指定資料庫檔案路徑（--sqlite-path）")
+        return SQLiteBackend(sqlite_path, compact=compact)
+    raise ValueError(f"未知的儲存後端: {name}（可用: {', '.join(BACKENDS)}）")
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""向量化回測：評估 Trade_Signal 與多空分數的 N 根後報酬
+
+所有計算皆以 numpy 整欄運算（分組位移、前綴和、bincount）完成，
+不逐筆交易跑 Python 迴圈；多個 symbol 可放在同一個 DataFrame 一次計算。
+
+- 各訊號類別（買入 / 強烈買入 / 賣出 / 強烈賣出 / 無訊號）的筆數、
+  平均 N 根後報酬、勝率（買進類為報酬 > 0，賣出類為報酬 < 0）
+- 依 Buy_Signals / Sell_Signals 分數區間統計平均報酬與勝率
+- 權益曲線：每個訊號以 1/N 資金持有 N 根（買進做多、賣出放空），
+  逐根報酬為持有部位乘上下一根報酬
+
+summarize 回傳可跨 symbol 相加的統計（筆數、報酬總和、勝場數），
+平行模式下各 worker 各自計算後再以 combine 合併。
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .config import SIGNAL_LABELS
+from .indicators import label_code
+
+# 分數區間上限，大於等於此值者併入最後一組（例如 6+）
+MAX_SCORE_BUCKET = 6
+
+_NO_SIGNAL = '無訊號'
+
+
+def _trade_codes(df):
+    """取得 Trade_Signal 的 int8 代碼（Categorical 或已展開的字串欄皆可）"""
+    col = df['Trade_Signal']
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col.cat.codes.to_numpy()
+    return pd.Categorical(
+        col.fillna(''), categories=SIGNAL_LABELS['Trade_Signal']
+    ).codes
+
+
+def _directions(codes):
+    """訊號方向：買進類為 +1、賣出類為 -1、其餘為 0"""
+    buy = np.isin(codes, [
+        label_code('Trade_Signal', '買入'),
+        label_code('Trade_Signal', '強烈買入'),
+    ])
+    sell = np.isin(codes, [
+        label_code('Trade_Signal', '賣出'),
+        label_code('Trade_Signal', '強烈賣出'),
+    ])
+    return buy.astype(np.int8) - sell.astype(np.int8)
+
+
+def parse_horizons(horizons):
+    """解析回測根數：整數、逗號分隔字串或串列，回傳遞增的正整數串列"""
+    if isinstance(horizons, (int, np.integer)):
+        horizons = [horizons]
+    elif isinstance(horizons, str):
+        horizons = horizons.split(',')
+    result = sorted({int(h) for h in horizons})
+    if not result or result[0] < 1:
+        raise ValueError(f"回測根數需為正整數: {horizons}")
+    return result
+
+
+# summarize 重複使用的排序後欄位；fwd 為各 horizon 的 N 根後報酬快取
+Prepared = namedtuple('Prepared', [
+    'times', 'close', 'gid', 'starts', 'order', 'bar_ret',
+    'time_codes', 'time_values', 'time_counts', 'fwd',
+])
+
+
+def prepare(df):
+    """
+    依 (symbol, datetime) 排序並預先計算與訊號無關的欄位（逐根報酬、
+    分組起點、時間代碼），回傳 Prepared；已排序時 order 為 None。
+    同一份資料要以不同訊號反覆回測（例如參數掃描）時只需準備一次，
+    再以 summarize_arrays 計算。
+    """
+    n = len(df)
+    if 'symbol' in df.columns:
+        gid, _ = pd.factorize(df['symbol'], sort=False)
+    else:
+        gid = np.zeros(n, dtype=np.intp)
+    times = pd.to_datetime(df['datetime']).to_numpy()
+    order = None
+    if n > 1:
+        same = gid[1:] == gid[:-1]
+        in_order = (
+            np.all(gid[1:] >= gid[:-1])
+            and np.all(times[1:][same] >= times[:-1][same])
+        )
+        if not in_order:
+            order = np.lexsort((times, gid))
+            gid = gid[order]
+            times = times[order]
+    close = pd.to_numeric(df['close_price'], errors='coerce').to_numpy(
+        dtype=float, na_value=np.nan
+    )
+    if order is not None:
+        close = close[order]
+    boundary = np.ones(n, dtype=bool)
+    boundary[1:] = gid[1:] != gid[:-1]
+    starts = np.maximum.accumulate(np.where(boundary, np.arange(n), 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bar_ret = close / _shift(close, 1, gid) - 1
+    # 同一時間點可能有多個 symbol，以 datetime 代碼加總策略報酬
+    time_codes, time_values = pd.factorize(times, sort=True)
+    time_counts = np.bincount(time_codes, minlength=len(time_values))
+    return Prepared(
+        times, close, gid, starts, order, bar_ret,
+        time_codes, time_values, time_counts, {},
+    )
+
+
+def _forward_returns(prepared, h):
+    fwd = prepared.fwd.get(h)
+    if fwd is None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fwd = _shift(prepared.close, -h, prepared.gid) / prepared.close - 1
+        prepared.fwd[h] = fwd
+    return fwd
+
+
+def _shift(values, k, gid):
+    """分組內位移：k > 0 取前 k 根、k < 0 取後 -k 根，跨組或超出範圍為 NaN"""
+    n = len(values)
+    out = np.full(n, np.nan)
+    if k == 0 or abs(k) >= n:
+        return values.astype(float) if k == 0 else out
+    if k > 0:
+        out[k:] = values[:-k]
+        out[k:][gid[k:] != gid[:-k]] = np.nan
+    else:
+        k = -k
+        out[:-k] = values[k:]
+        out[:-k][gid[:-k] != gid[k:]] = np.nan
+    return out
+
+
+def _bucket_codes(scores):
+    return np.clip(np.floor(np.nan_to_num(scores)), 0, MAX_SCORE_BUCKET).astype(
+        np.intp
+    )
+
+
+_BUCKET_LABELS = (
+    [str(i) for i in range(MAX_SCORE_BUCKET)] + [f'{MAX_SCORE_BUCKET}+']
+)
+_TRADE_GROUP_LABELS = [
+    label or _NO_SIGNAL for label in SIGNAL_LABELS['Trade_Signal']
+]
+
+
+def _aggregate(codes, size, fwd, signed, valid):
+    """以 bincount 依分組代碼加總筆數、報酬與勝場數"""
+    codes = codes[valid]
+    count = np.bincount(codes, minlength=size)
+    ret_sum = np.bincount(codes, weights=fwd[valid], minlength=size)
+    signed_sum = np.bincount(codes, weights=signed[valid], minlength=size)
+    hits = np.bincount(codes, weights=signed[valid] > 0, minlength=size)
+    return count, ret_sum, signed_sum, hits
+
+
+def summarize(df, horizons=(5,)):
+    """
+    計算可相加的回測統計。
+
+    df 需包含 symbol（可省略）、datetime、close_price、Trade_Signal、
+    Buy_Signals、Sell_Signals。回傳 (stats, strategy)：
+    - stats：欄位為 horizon、group_type、group、count、ret_sum、
+      signed_sum（方向調整後的報酬總和）、hits
+    - strategy：欄位為 horizon、datetime、ret_sum、n（該時間點各 symbol
+      策略報酬的總和與 symbol 數）
+    """
+    prepared = prepare(df)
+
+    def column(values):
+        values = np.asarray(values)
+        return values if prepared.order is None else values[prepared.order]
+
+    return summarize_arrays(
+        prepared,
+        column(_trade_codes(df)),
+        column(df['Buy_Signals'].to_numpy(dtype=float)),
+        column(df['Sell_Signals'].to_numpy(dtype=float)),
+        horizons,
+    )
+
+
+def summarize_arrays(prepared, trade_codes, buy_signals, sell_signals,
+                     horizons=(5,)):
+    """
+    同 summarize，但直接以 prepare 排序後的 Trade_Signal 代碼與多空分數
+    陣列計算（順序需與 prepared 一致），省去每次重建 DataFrame。
+    """
+    horizons = parse_horizons(horizons)
+    n = len(prepared.close)
+    trade_codes = np.asarray(trade_codes).astype(np.intp)
+    direction = _directions(trade_codes)
+    groups = (
+        ('signal', trade_codes, _TRADE_GROUP_LABELS, 1),
+        ('buy_score', _bucket_codes(buy_signals), _BUCKET_LABELS, 1),
+        ('sell_score', _bucket_codes(sell_signals), _BUCKET_LABELS, -1),
+    )
+
+    # 方向的前綴和（前補 0）用來求任意區間內的訊號加總
+    prefix = np.concatenate([[0.0], np.cumsum(direction, dtype=float)])
+    index = np.arange(n)
+
+    stats = {k: [] for k in (
+        'horizon', 'group_type', 'group',
+        'count', 'ret_sum', 'signed_sum', 'hits',
+    )}
+    strategy = []
+    for h in horizons:
+        fwd = _forward_returns(prepared, h)
+        valid = np.isfinite(fwd)
+        for group_type, codes, labels, sign in groups:
+            if group_type == 'signal':
+                signed = np.where(direction < 0, -fwd, fwd)
+            else:
+                signed = fwd * sign
+            count, ret_sum, signed_sum, hits = _aggregate(
+                codes, len(labels), fwd, signed, valid
+            )
+            keep = np.flatnonzero(count)
+            stats['horizon'].extend([h] * len(keep))
+            stats['group_type'].extend([group_type] * len(keep))
+            stats['group'].extend(labels[i] for i in keep)
+            stats['count'].append(count[keep])
+            stats['ret_sum'].append(ret_sum[keep])
+            stats['signed_sum'].append(signed_sum[keep])
+            stats['hits'].append(hits[keep].astype(np.int64))
+
+        # 第 t 根的部位：同一 symbol 前 h 根內（t-h .. t-1）各訊號以 1/h 資金持有
+        lo = np.maximum(index - h, prepared.starts)
+        position = (prefix[index] - prefix[lo]) / h
+        strat_ret = np.nan_to_num(position * prepared.bar_ret)
+        strategy.append(pd.DataFrame({
+            'horizon': h,
+            'datetime': prepared.time_values,
+            'ret_sum': np.bincount(
+                prepared.time_codes, weights=strat_ret,
+                minlength=len(prepared.time_values),
+            ),
+            'n': prepared.time_counts,
+        }))
+
+    for key in ('count', 'ret_sum', 'signed_sum', 'hits'):
+        stats[key] = np.concatenate(stats[key])
+    return pd.DataFrame(stats), pd.concat(strategy, ignore_index=True)
+
+
+def combine(parts):
+    """
+    合併多個 summarize 結果（例如各 symbol 或各 worker），回傳 dict：
+    - summary：各組的筆數、平均報酬、方向調整後平均報酬與勝率
+    - equity：各 horizon 依 datetime 的組合權益曲線（各 symbol 等權）
+    """
+    parts = [p for p in parts if p is not None]
+    stats_list = [s for s, _ in parts if s is not None and not s.empty]
+    strategy_list = [r for _, r in parts if r is not None and not r.empty]
+    if not stats_list:
+        return {'summary': pd.DataFrame(), 'equity': pd.DataFrame()}
+
+    stats = pd.concat(stats_list, ignore_index=True).groupby(
+        ['horizon', 'group_type', 'group'], sort=True
+    )[['count', 'ret_sum', 'signed_sum', 'hits']].sum()
+    summary = pd.DataFrame({
+        'count': stats['count'].astype(int),
+        'mean_return': stats['ret_sum'] / stats['count'],
+        'mean_signed_return': stats['signed_sum'] / stats['count'],
+        'hit_rate': stats['hits'] / stats['count'],
+    })
+
+    strategy = pd.concat(strategy_list, ignore_index=True)
+    port = strategy.groupby(['horizon', 'datetime'], sort=True)[
+        ['ret_sum', 'n']
+    ].sum()
+    port = port['ret_sum'] / port['n']
+    equity = (1 + port).groupby(level='horizon').cumprod().rename('equity')
+    equity = equity.reset_index()
+    return {'summary': summary, 'equity': equity}
+
+
+def run_backtest(df, horizons=(5,)):
+    """對單一或多個 symbol 的訊號資料直接回測，回傳 combine 的結果"""
+    return combine([summarize(df, horizons)])
+
+
+def save_backtest(result, path):
+    """將回測統計寫入 path（CSV），權益曲線另存為 <檔名>_equity.csv"""
+    base, ext = os.path.splitext(path)
+    equity_path = f"{base}_equity{ext or '.csv'}"
+    result['summary'].to_csv(path, encoding='utf-8-sig')
+    result['equity'].to_csv(equity_path, index=False, encoding='utf-8-sig')
+    print(f"回測統計已儲存至 {path}，權益曲線已儲存至 {equity_path}")
+    return path, equity_path
+
+
+def print_backtest_report(result):
+    summary = result.get('summary')
+    equity = result.get('equity')
+    print("\n=== 回測報告 ===")
+    if summary is None or summary.empty:
+        print("沒有可回測的資料")
+        return
+
+    titles = {
+        'signal': '依交易訊號',
+        'buy_score': '依多頭分數（報酬 > 0 為勝）',
+        'sell_score': '依空頭分數（報酬 < 0 為勝）',
+    }
+    for horizon in summary.index.get_level_values('horizon').unique():
+        print(f"\n--- {horizon} 根後報酬 ---")
+        for group_type, title in titles.items():
+            try:
+                part = summary.loc[(horizon, group_type)]
+            except KeyError:
+                continue
+            print(f"{title}:")
+            for group, row in part.iterrows():
+                print(
+                    f"  {group:<8}{int(row['count']):>10,} 筆"
+                    f"  平均報酬 {row['mean_return'] * 100:>7.3f}%"
+                    f"  方向調整 {row['mean_signed_return'] * 100:>7.3f}%"
+                    f"  勝率 {row['hit_rate'] * 100:>6.2f}%"
+                )
+        if equity is not None and not equity.empty:
+            curve = equity[equity['horizon'] == horizon]
+            if not curve.empty:
+                final = curve['equity'].iloc[-1]
+                peak = curve['equity'].cummax()
+                drawdown = (curve['equity'] / peak - 1).min()
+                print(
+                    f"權益曲線: 期末 {final:.4f}"
+                    f"（報酬 {(final - 1) * 100:.2f}%），"
+                    f"最大回撤 {drawdown * 100:.2f}%"
+                )
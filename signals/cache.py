@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""本機 OHLCV 快取：依 database/table/symbol 分區的 Parquet 檔與水位線"""
+
+import json
+import os
+import re
+import time
+
+import pandas as pd
+
+
+def _safe_name(name):
+    return re.sub(r'[^0-9A-Za-z_.-]+', '_', str(name))
+
+
+class OHLCVCache:
+    """
+    每個 symbol 一個分區：<cache_dir>/<database>/<table>/<symbol>.parquet，
+    旁邊的 <symbol>.json 記錄水位線（快取中最新的 datetime）、筆數、
+    更新與存取時間。後續執行只向資料庫要水位線之後的新資料。
+
+    max_bytes / max_age_days 為淘汰條件：超過存放天數的分區直接刪除，
+    總容量超過上限時依最後存取時間由舊到新刪除。
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+
+    def _partition(self, database, table, symbol):
+        base = os.path.join(
+            self.cache_dir, _safe_name(database), _safe_name(table)
+        )
+        name = _safe_name(symbol)
+        return (
+            os.path.join(base, f'{name}.parquet'),
+            os.path.join(base, f'{name}.json'),
+        )
+
+    def load(self, database, table, symbol):
+        """讀取快取分區，回傳 (DataFrame, 水位線)；無快取時回傳 (None, None)"""
+        data_path, meta_path = self._partition(database, table, symbol)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            df = pd.read_parquet(data_path)
+        except Exception as e:
+            print(f"快取分區 {data_path} 讀取失敗，將重新下載: {str(e)}")
+            return None, None
+        meta['last_access'] = time.time()
+        self._write_meta(meta_path, meta)
+        return df, pd.Timestamp(meta['watermark'])
+
+    def store(self, database, table, symbol, df):
+        """以原子替換方式寫入分區與水位線"""
+        if df.empty:
+            return
+        data_path, meta_path = self._partition(database, table, symbol)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        tmp_path = data_path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, data_path)
+        now = time.time()
+        self._write_meta(meta_path, {
+            'symbol': symbol,
+            'watermark': pd.Timestamp(df['datetime'].max()).isoformat(),
+            'rows': len(df),
+            'updated_at': now,
+            'last_access': now,
+        })
+
+    @staticmethod
+    def _write_meta(meta_path, meta):
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    def read_symbols(
+        self, backend, table, symbols,
+        batch_size=500, refresh=False, columns=None,
+    ):
+        """
+        與 backend.read_ohlcv_by_symbols 相同介面的快取讀取：逐一 yield
+        (symbol, 完整歷史 DataFrame)。backend 為 signals.backends 的
+        儲存後端，分區依 backend.database_name 區分。
+
+        已快取的 symbol 只向資料庫要最後一根之後（含最後一根，以便更新
+        盤中尚未收盤的 K 棒）的資料；refresh=True 時忽略快取重新下載。
+        只讀部分欄位（columns）時另存於 <table>.raw 分區，與完整欄位分開。
+        """
+        database = backend.database_name
+        part_table = table if not columns else f'{table}.raw'
+        wanted = list(dict.fromkeys(str(s) for s in symbols))
+        cached = {}
+        since = {}
+        for symbol in wanted:
+            if refresh:
+                continue
+            df, _ = self.load(database, part_table, symbol)
+            if df is None or df.empty:
+                continue
+            df = df.sort_values('datetime').reset_index(drop=True)
+            # 捨棄最後一根，並從倒數第二根之後重新抓取
+            if len(df) > 1:
+                since[symbol] = df['datetime'].iloc[-2]
+                cached[symbol] = df.iloc[:-1]
+            # 只有一根時整個重抓
+        hits = len(cached)
+        print(f"快取命中 {hits}/{len(wanted)} 個 symbol")
+
+        reader = backend.read_ohlcv_by_symbols(
+            table, wanted,
+            batch_size=batch_size, since=since, warmup_bars=0,
+            columns=columns,
+        )
+        for symbol, fresh in reader:
+            old = cached.get(symbol)
+            if old is not None:
+                if fresh.empty:
+                    df = old
+                else:
+                    df = pd.concat([old, fresh], ignore_index=True)
+                    df = df.drop_duplicates(
+                        subset=['datetime'], keep='last'
+                    ).reset_index(drop=True)
+            else:
+                df = fresh
+            if not df.empty:
+                self.store(database, part_table, symbol, df)
+            yield symbol, df
+
+    def evict(self):
+        """依存放天數與總容量淘汰分區，回傳刪除的分區數"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        partitions = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.parquet'):
+                    continue
+                data_path = os.path.join(root, name)
+                meta_path = data_path[:-len('.parquet')] + '.json'
+                try:
+                    with open(meta_path, encoding='utf-8') as f:
+                        meta = json.load(f)
+                except Exception:
+                    meta = {}
+                size = os.path.getsize(data_path)
+                partitions.append((
+                    meta.get('last_access', os.path.getmtime(data_path)),
+                    meta.get('updated_at', os.path.getmtime(data_path)),
+                    size, data_path, meta_path,
+                ))
+
+        removed = 0
+        now = time.time()
+        keep = []
+        for item in partitions:
+            updated_at = item[1]
+            if (
+                self.max_age_days is not None
+                and now - updated_at > self.max_age_days * 86400
+            ):
+                self._remove(item)
+                removed += 1
+            else:
+                keep.append(item)
+
+        if self.max_bytes is not None:
+            total = sum(item[2] for item in keep)
+            # 最久未存取的先淘汰
+            for item in sorted(keep):
+                if total <= self.max_bytes:
+                    break
+                self._remove(item)
+                total -= item[2]
+                removed += 1
+
+        if removed:
+            print(f"快取淘汰 {removed} 個分區")
+        return removed
+
+    @staticmethod
+    def _remove(item):
+        for path in item[3:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
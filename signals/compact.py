@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""精簡儲存：將各訊號欄位的代碼打包成單一整數欄 signal_bits
+
+寬表 trade_signals_<週期> 每根 K 棒有 15 個 NVARCHAR 訊號欄與
+Signal_Strength 文字欄，大多是空字串。精簡模式改寫入窄表
+trade_signals_<週期>_packed：
+
+    datetime, symbol, close_price, Buy_Signals, Sell_Signals,
+    signal_bits, signal_hash
+
+各訊號欄位依 config.SIGNAL_LABELS 的代碼（標籤在 tuple 中的位置）各佔
+固定的位元數（3 個標籤佔 2 位元、5 個標籤佔 3 位元），目前共 32 位元。
+另建檢視表 trade_signals_<週期>_wide 以位元運算與 CASE 還原寬表的欄位
+與中文標籤（Signal_Strength 由 Trade_Signal 與分數組出），原本讀取寬表的
+查詢只需改用檢視表名稱。
+
+位元配置只能在尾端追加：新增訊號欄位時接在最後，既有欄位的位移不變，
+已寫入的資料不需轉換。
+"""
+
+import numpy as np
+import pandas as pd
+
+from .config import SIGNAL_LABELS
+
+PACKED_SUFFIX = '_packed'
+VIEW_SUFFIX = '_wide'
+
+# 窄表的欄位（與 staging 表的欄位順序相同）
+PACKED_COLUMNS = [
+    'datetime', 'symbol', 'close_price', 'Buy_Signals', 'Sell_Signals',
+    'signal_bits', 'signal_hash',
+]
+
+# 寬表的欄位順序（檢視表依此順序輸出）
+WIDE_COLUMNS = [
+    'datetime', 'symbol', 'close_price', 'Trade_Signal',
+    'Signal_Strength', 'Buy_Signals', 'Sell_Signals',
+    'MA_Cross', 'BB_Signal', 'MACD_Cross', 'Trend', 'MACD_Div',
+    'RSI_Signal', 'KD_Signal', 'SR_Signal', 'Volume_Anomaly',
+    'EMA_Cross', 'CCI_Signal', 'WILLR_Signal', 'MOM_Signal', 'Anomaly',
+]
+
+
+def _bit_layout():
+    """各訊號欄位的 (欄位, 位移, 位元數)，依 SIGNAL_LABELS 的順序排列"""
+    layout = []
+    shift = 0
+    for column, labels in SIGNAL_LABELS.items():
+        width = max(1, int(len(labels) - 1).bit_length())
+        layout.append((column, shift, width))
+        shift += width
+    if shift > 63:
+        raise ValueError(f"訊號欄位共需 {shift} 位元，超過 BIGINT 的 63 位元")
+    return tuple(layout)
+
+
+SIGNAL_BIT_LAYOUT = _bit_layout()
+_FIELDS = {
+    column: (shift, width) for column, shift, width in SIGNAL_BIT_LAYOUT
+}
+
+
+def packed_table(table_name):
+    """寬表名稱對應的窄表名稱（trade_signals_1h -> trade_signals_1h_packed）"""
+    return f'{table_name}{PACKED_SUFFIX}'
+
+
+def wide_view(table_name):
+    """寬表名稱對應的還原檢視表名稱（-> trade_signals_1h_wide）"""
+    return f'{table_name}{VIEW_SUFFIX}'
+
+
+def pack_signals(df):
+    """
+    將 df 的訊號欄位（中文標籤字串或 Categorical）打包為 int64 陣列；
+    缺少的欄位或不認得的標籤視為代碼 0（無訊號）。
+    """
+    bits = np.zeros(len(df), dtype=np.int64)
+    for column, shift, _ in SIGNAL_BIT_LAYOUT:
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        codes = pd.Categorical(
+            values, categories=SIGNAL_LABELS[column]
+        ).codes.astype(np.int64)
+        bits |= np.where(codes > 0, codes, 0) << shift
+    return bits
+
+
+def unpack_signals(bits):
+    """將 signal_bits 還原為各訊號欄位的 Categorical（dict：欄位 -> Series）"""
+    bits = np.asarray(bits, dtype=np.int64)
+    columns = {}
+    for column, shift, width in SIGNAL_BIT_LAYOUT:
+        codes = ((bits >> shift) & ((1 << width) - 1)).astype(np.int8)
+        labels = SIGNAL_LABELS[column]
+        # 超出標籤數的代碼（不應出現）視為無訊號
+        codes[codes >= len(labels)] = 0
+        columns[column] = pd.Series(
+            pd.Categorical.from_codes(codes, categories=labels)
+        )
+    return columns
+
+
+def packed_frame(df):
+    """由寬表格式（format_signals_for_output 的結果）產生窄表的資料列"""
+    out = pd.DataFrame({
+        col: df[col] if col in df.columns else ''
+        for col in ('datetime', 'symbol', 'close_price', 'Buy_Signals',
+                    'Sell_Signals')
+    }, index=df.index)
+    out['signal_bits'] = pack_signals(df)
+    if 'signal_hash' in df.columns:
+        out['signal_hash'] = df['signal_hash']
+    return out.reset_index(drop=True)
+
+
+def _quote(text, dialect):
+    text = text.replace("'", "''")
+    return f"N'{text}'" if dialect == 'mssql' else f"'{text}'"
+
+
+def _field(shift, width):
+    # 以整數除法與餘數取出位元，MSSQL 與 SQLite 皆適用
+    return f"((signal_bits / {1 << shift}) % {1 << width})"
+
+
+def _label_case(column, shift, width, dialect):
+    labels = SIGNAL_LABELS[column]
+    whens = ' '.join(
+        f"WHEN {code} THEN {_quote(label, dialect)}"
+        for code, label in enumerate(labels) if code > 0
+    )
+    return (
+        f"CASE {_field(shift, width)} {whens} "
+        f"ELSE {_quote('', dialect)} END"
+    )
+
+
+def _strength_sql(dialect):
+    """Signal_Strength：買入 / 強烈買入為「多頭x.x分」，賣出類為「空頭x.x分」"""
+    labels = SIGNAL_LABELS['Trade_Signal']
+    buy = ', '.join(str(labels.index(v)) for v in ('買入', '強烈買入'))
+    sell = ', '.join(str(labels.index(v)) for v in ('賣出', '強烈賣出'))
+    field = _field(*_FIELDS['Trade_Signal'])
+
+    def text(prefix, col):
+        if dialect == 'mssql':
+            score = f"CAST(CAST({col} AS DECIMAL(10, 1)) AS NVARCHAR(20))"
+            concat = ' + '
+        else:
+            score = f"printf('%.1f', {col})"
+            concat = ' || '
+        return concat.join([
+            _quote(prefix, dialect), score, _quote('分', dialect),
+        ])
+
+    return (
+        f"CASE WHEN {field} IN ({buy}) THEN {text('多頭', 'Buy_Signals')} "
+        f"WHEN {field} IN ({sell}) THEN {text('空頭', 'Sell_Signals')} "
+        f"ELSE {_quote('', dialect)} END"
+    )
+
+
+def wide_view_sql(table_name, dialect='mssql'):
+    """
+    建立（或重建）還原寬表的檢視表的 SQL 陳述式串列，dialect 為 'mssql'
+    或 'sqlite'。MSSQL 使用 CREATE OR ALTER VIEW（SQL Server 2016 SP1 起
+    支援），SQLite 先刪除再建立；位元配置追加欄位後重建即可。
+    """
+    select = ['id']
+    for column in WIDE_COLUMNS:
+        if column in _FIELDS:
+            case = _label_case(column, *_FIELDS[column], dialect)
+            select.append(f"{case} AS {column}")
+        elif column == 'Signal_Strength':
+            select.append(f"{_strength_sql(dialect)} AS Signal_Strength")
+        else:
+            select.append(column)
+    select.append('signal_bits')
+    view = wide_view(table_name)
+    columns = ',\n    '.join(select)
+    body = (
+        f"{view} AS\n"
+        f"SELECT\n    {columns}\n"
+        f"FROM {packed_table(table_name)}"
+    )
+    if dialect == 'mssql':
+        return [f"CREATE OR ALTER VIEW {body}"]
+    return [f"DROP VIEW IF EXISTS {view}", f"CREATE VIEW {body}"]
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""由原始 OHLCV 計算基礎技術指標欄位（取代資料表中預先存好的指標）
+
+計算方式與來源資料表一致（TA-Lib 慣例）：EMA 以前 N 根的簡單平均
+作為起始值、MACD 的快線與慢線同時起算、RSI 使用 Wilder 平滑、KD 以
+第一個 RSV 作為 K / D 起始值。遞迴平滑皆交給 pandas ewm（編譯實作）
+計算，不使用 Python 迴圈。
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 計算所需的原始欄位
+RAW_COLUMNS = [
+    'symbol', 'datetime', 'open_price', 'high_price', 'low_price',
+    'close_price', 'volume',
+]
+
+# compute_base_indicators 產生的欄位
+BASE_INDICATOR_COLUMNS = [
+    'ma5', 'ma20', 'bb_upper', 'bb_middle', 'bb_lower', 'ema12', 'ema26',
+    'dif', 'macd', 'rsi_14', 'rsv', 'k_value', 'd_value', 'cci', 'willr',
+    'mom',
+]
+
+
+def _seeded_ema(values, alpha, seed_end, seed_len):
+    """
+    以 values[seed_end-seed_len+1 : seed_end+1] 的平均為起始值的遞迴平滑，
+    seed_end 之前輸出 NaN。
+    """
+    out = np.full(len(values), np.nan)
+    if seed_end >= len(values) or seed_end - seed_len + 1 < 0:
+        return out
+    tail = values[seed_end:].astype(float)
+    tail[0] = values[seed_end - seed_len + 1:seed_end + 1].mean()
+    out[seed_end:] = (
+        pd.Series(tail).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    )
+    return out
+
+
+def ema(values, period):
+    """EMA（alpha = 2 / (period + 1)），以前 period 根的簡單平均起算"""
+    values = np.asarray(values, dtype=float)
+    return _seeded_ema(values, 2.0 / (period + 1), period - 1, period)
+
+
+def macd(values, fast=12, slow=26, signal=9):
+    """回傳 (dif, macd)；快慢線皆於第 slow 根起算，兩者自第 slow+signal-1 根起有值"""
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    start = slow - 1
+    fast_ema = _seeded_ema(values, 2.0 / (fast + 1), start, fast)
+    slow_ema = _seeded_ema(values, 2.0 / (slow + 1), start, slow)
+    dif = fast_ema - slow_ema
+    sig = np.full(n, np.nan)
+    if n > start:
+        sig[start:] = _seeded_ema(
+            dif[start:], 2.0 / (signal + 1), signal - 1, signal
+        )
+    dif = np.where(np.isnan(sig), np.nan, dif)
+    return dif, sig
+
+
+def rsi(values, period=14):
+    """Wilder RSI：前 period 個漲跌幅的平均起算，之後以 1/period 平滑"""
+    values = np.asarray(values, dtype=float)
+    delta = np.diff(values, prepend=np.nan)
+    gain = np.clip(delta, 0, None)
+    loss = np.clip(-delta, 0, None)
+    avg_gain = np.full(len(values), np.nan)
+    avg_loss = np.full(len(values), np.nan)
+    if len(values) > period:
+        avg_gain[1:] = _seeded_ema(gain[1:], 1.0 / period, period - 1, period)
+        avg_loss[1:] = _seeded_ema(loss[1:], 1.0 / period, period - 1, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        out = 100 - 100 / (1 + rs)
+    # 全數上漲（無下跌）時 RSI 為 100
+    out = np.where((avg_loss == 0) & (avg_gain > 0), 100.0, out)
+    return out
+
+
+def _rolling_mean_abs_dev(values, period):
+    """滾動平均絕對離差，分段以 sliding_window_view 計算以控制記憶體"""
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+    windows = sliding_window_view(values, period)
+    step = 1_000_000
+    for i in range(0, len(windows), step):
+        w = windows[i:i + step]
+        out[period - 1 + i:period - 1 + i + len(w)] = np.abs(
+            w - w.mean(axis=1, keepdims=True)
+        ).mean(axis=1)
+    return out
+
+
+def compute_base_indicators(
+    df,
+    ma_short=5,
+    ma_long=20,
+    bb_period=20,
+    bb_k=2.0,
+    kd_period=9,
+    cci_period=14,
+    willr_period=20,
+    mom_period=10,
+    columns=None,
+):
+    """
+    由 open/high/low/close/volume 計算 signals.indicators 所需的指標欄位，
+    直接寫入 df 並回傳。df 應為單一 symbol、依 datetime 排序的資料。
+
+    columns 指定時只計算產生這些欄位所需的指標（例如
+    indicators.required_columns 的結果），其餘完全略過。
+    """
+    wanted = set(BASE_INDICATOR_COLUMNS if columns is None else columns)
+
+    def need(*names):
+        return not wanted.isdisjoint(names)
+
+    close = df['close_price'].astype(float)
+    high = df['high_price'].astype(float)
+    low = df['low_price'].astype(float)
+    c = close.to_numpy()
+
+    if need('ma5'):
+        df['ma5'] = close.rolling(ma_short).mean().to_numpy()
+    if need('ma20'):
+        df['ma20'] = close.rolling(ma_long).mean().to_numpy()
+
+    if need('bb_upper', 'bb_middle', 'bb_lower'):
+        mid = close.rolling(bb_period).mean()
+        std = close.rolling(bb_period).std(ddof=0)
+        df['bb_middle'] = mid.to_numpy()
+        df['bb_upper'] = (mid + bb_k * std).to_numpy()
+        df['bb_lower'] = (mid - bb_k * std).to_numpy()
+
+    if need('ema12'):
+        df['ema12'] = ema(c, 12)
+    if need('ema26'):
+        df['ema26'] = ema(c, 26)
+    if need('dif', 'macd'):
+        df['dif'], df['macd'] = macd(c)
+    if need('rsi_14'):
+        df['rsi_14'] = rsi(c, 14)
+
+    if need('rsv', 'k_value', 'd_value'):
+        lowest = low.rolling(kd_period).min()
+        highest = high.rolling(kd_period).max()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsv = ((close - lowest) / (highest - lowest) * 100).to_numpy()
+        df['rsv'] = rsv
+        valid = np.flatnonzero(~np.isnan(rsv))
+        k = np.full(len(df), np.nan)
+        d = np.full(len(df), np.nan)
+        if len(valid):
+            first = valid[0]
+            k[first:] = _seeded_ema(rsv[first:], 1.0 / 3, 0, 1)
+            d[first:] = _seeded_ema(k[first:], 1.0 / 3, 0, 1)
+        df['k_value'] = k
+        df['d_value'] = d
+
+    if need('cci'):
+        tp = ((high + low + close) / 3).to_numpy()
+        tp_mean = pd.Series(tp).rolling(cci_period).mean().to_numpy()
+        mad = _rolling_mean_abs_dev(tp, cci_period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['cci'] = (tp - tp_mean) / (0.015 * mad)
+
+    if need('willr'):
+        hh = high.rolling(willr_period).max()
+        ll = low.rolling(willr_period).min()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['willr'] = ((hh - close) / (hh - ll) * -100).to_numpy()
+
+    if need('mom'):
+        df['mom'] = (close - close.shift(mom_period)).to_numpy()
+    return df
@@ -16,3 +16,71 @@ SIGNAL_WEIGHTS = {
     'Trend': 0.5,
     'RSI_Near': 0.4,
 }
+
+# 指標所需的最長回看 K 棒數（anomaly_detection 與 volume_anomaly_signal
+# 的 20 根視窗）；增量模式需在新資料之前多讀這麼多根作為暖機
+LOOKBACK_BARS = 20
+# 另加 1 根給 shift(1) / pct_change 使用
+INCREMENTAL_WARMUP_BARS = LOOKBACK_BARS + 1
+
+# 各訊號欄位的標籤表：指標以 int8 代碼（標籤在 tuple 中的位置）儲存為
+# pandas Categorical，代碼 0 固定為空字串（無訊號）；
+# 中文標籤只在輸出 CSV / 資料庫時才展開
+SIGNAL_LABELS = {
+    'MA_Cross': ('', '突破MA20', '跌破MA20'),
+    'BB_Signal': ('', '突破上軌', '突破下軌'),
+    'MACD_Cross': ('', '黃金交叉', '死亡交叉'),
+    'Trend': ('', '偏多', '偏空'),
+    'MACD_Div': ('', '底背離', '頂背離'),
+    'Anomaly': ('', 'Anomaly'),
+    'RSI_Signal': ('', '超買', '超賣', '接近超買', '接近超賣'),
+    'KD_Signal': ('', 'K上穿D', 'K下穿D', 'KD超買', 'KD超賣'),
+    'SR_Signal': ('', '接近壓力位', '接近支撐位'),
+    'Volume_Anomaly': ('', '量能異常'),
+    'EMA_Cross': ('', 'EMA黃金交叉', 'EMA死亡交叉'),
+    'CCI_Signal': ('', 'CCI超買', 'CCI超賣', 'CCI上穿零軸', 'CCI下穿零軸'),
+    'WILLR_Signal': ('', 'WILLR超買', 'WILLR超賣'),
+    'MOM_Signal': ('', '動量轉正', '動量轉負'),
+    'Trade_Signal': ('', '買入', '強烈買入', '賣出', '強烈賣出'),
+}
+
+# 計分規則：(訊號欄位, 標籤, 方向, SIGNAL_WEIGHTS 鍵)。
+# 由 trades.compile_signal_rules 預先編譯為各欄位「代碼 -> 權重」查表，
+# 新增規則只需在此加一列，不會增加整張表的掃描次數。
+# 同一方向內的順序即分數累加順序，調整順序可能改變浮點加總結果。
+SIGNAL_RULES = [
+    ('MA_Cross', '突破MA20', 'buy', 'MA_Cross'),
+    ('MACD_Cross', '黃金交叉', 'buy', 'MACD_Cross'),
+    ('EMA_Cross', 'EMA黃金交叉', 'buy', 'EMA_Cross'),
+    ('KD_Signal', 'K上穿D', 'buy', 'KD_Cross'),
+    ('RSI_Signal', '超賣', 'buy', 'RSI_Oversold'),
+    ('RSI_Signal', '接近超賣', 'buy', 'RSI_Near'),
+    ('BB_Signal', '突破下軌', 'buy', 'BB_Break'),
+    ('MACD_Div', '底背離', 'buy', 'MACD_Div'),
+    ('Trend', '偏多', 'buy', 'Trend'),
+    ('Volume_Anomaly', '量能異常', 'buy', 'Volume'),
+    ('CCI_Signal', 'CCI超賣', 'buy', 'CCI'),
+    ('CCI_Signal', 'CCI上穿零軸', 'buy', 'CCI'),
+    ('WILLR_Signal', 'WILLR超賣', 'buy', 'WILLR'),
+    ('MOM_Signal', '動量轉正', 'buy', 'MOM'),
+    ('KD_Signal', 'KD超賣', 'buy', 'KD_Cross'),
+
+    ('MA_Cross', '跌破MA20', 'sell', 'MA_Cross'),
+    ('MACD_Cross', '死亡交叉', 'sell', 'MACD_Cross'),
+    ('EMA_Cross', 'EMA死亡交叉', 'sell', 'EMA_Cross'),
+    ('KD_Signal', 'K下穿D', 'sell', 'KD_Cross'),
+    ('RSI_Signal', '超買', 'sell', 'RSI_Oversold'),
+    ('RSI_Signal', '接近超買', 'sell', 'RSI_Near'),
+    ('BB_Signal', '突破上軌', 'sell', 'BB_Break'),
+    ('MACD_Div', '頂背離', 'sell', 'MACD_Div'),
+    ('Trend', '偏空', 'sell', 'Trend'),
+    ('KD_Signal', 'KD超買', 'sell', 'KD_Cross'),
+    ('CCI_Signal', 'CCI超買', 'sell', 'CCI'),
+    ('CCI_Signal', 'CCI下穿零軸', 'sell', 'CCI'),
+    ('WILLR_Signal', 'WILLR超買', 'sell', 'WILLR'),
+    ('MOM_Signal', '動量轉負', 'sell', 'MOM'),
+]
+
+# 由原始 OHLCV 自行計算指標（--compute-indicators）時，EMA / RSI / KD 等
+# 遞迴指標需要較長的暖機才能收斂（(1 - 2/27) ** 250 約為 5e-9）
+COMPUTE_WARMUP_BARS = 250
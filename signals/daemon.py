@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""常駐模式：保留各 symbol 的近期歷史，依週期輪詢新 K 棒並只處理新資料
+
+與排程每次重新啟動 main.py 不同，常駐行程只在啟動時匯入套件、建立
+儲存後端並讀取一次資料，之後：
+- 各 symbol 保留最近 N 根輸入欄位（暖機所需的根數）於記憶體
+- 依資料表週期（1h / 1d / 1w）對齊的時間輪詢，只向資料庫要最後處理的
+  K 棒之後的新資料
+- 新資料接在記憶體中的歷史之後計算指標與訊號，所有 symbol 的新訊號
+  一次寫回 trade_signals_<週期>，寫入成功後才推進水位線
+- 收到 SIGINT / SIGTERM 時完成目前這一輪後結束
+- 狀態檔（JSON，原子替換）記錄各 symbol 最後處理的 K 棒與輪詢狀態
+- 傳入 snapshot（signals.snapshot.SignalSnapshot）時，每輪以各 symbol
+  最後一根 K 棒的訊號更新最新訊號快照
+"""
+
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from . import indicators as ind
+from . import trades as tradesmod
+from .analyzer import _read_columns, _signals_table_for
+from .compute import compute_base_indicators
+from .config import COMPUTE_WARMUP_BARS, INCREMENTAL_WARMUP_BARS
+from .metrics import StageMetrics, write_jsonl, write_prometheus
+from .timeframes import table_timeframe
+
+# 各週期的輪詢間隔（秒）；週線以週一 00:00 對齊
+PERIOD_SECONDS = {'1h': 3600, '1d': 86400, '1w': 7 * 86400}
+# 1970-01-01 為週四，週一對齊需位移 4 天
+_PERIOD_ORIGIN = {'1w': 4 * 86400}
+
+
+def next_run_time(now, interval, delay=0.0, origin=0.0):
+    """
+    回傳 now 之後第一個對齊時間（epoch 秒）：origin + k * interval + delay。
+    delay 為週期結束後等待資料寫入來源表的時間。
+    """
+    k = (now - origin - delay) // interval + 1
+    return origin + k * interval + delay
+
+
+def _iso(value):
+    if value is None:
+        return None
+    if isinstance(value, float):
+        value = datetime.fromtimestamp(value)
+    return pd.Timestamp(value).isoformat()
+
+
+class SignalDaemon:
+    """
+    常駐的訊號計算行程。
+
+    symbols 為 None 時於啟動時以 SELECT DISTINCT 取得資料表的所有
+    symbol；之後新增的 symbol 需重新啟動才會納入。
+    interval 未指定時依資料表名稱的週期決定，delay 為每個週期結束後
+    延後輪詢的秒數。snapshot 為最新訊號快照（可為 None）。
+    """
+
+    def __init__(
+        self,
+        backend,
+        table,
+        symbols=None,
+        compute_indicators=False,
+        indicators=None,
+        interval=None,
+        delay=60.0,
+        status_path=None,
+        batch_size=500,
+        save_batch_size=10000,
+        metrics_jsonl=None,
+        metrics_prom=None,
+        snapshot=None,
+    ):
+        self.backend = backend
+        self.table = table
+        self.signals_table = _signals_table_for(table, indicators)
+        self.symbols = list(dict.fromkeys(str(s) for s in symbols or ()))
+        self.discover = not self.symbols
+        self.compute_indicators = compute_indicators
+        self.selected = ind.resolve_indicators(indicators)
+        self.columns = _read_columns(compute_indicators, indicators)
+        self.history_bars = (
+            COMPUTE_WARMUP_BARS if compute_indicators
+            else INCREMENTAL_WARMUP_BARS
+        )
+
+        period = table_timeframe(table)
+        if interval is None:
+            if period is None:
+                raise ValueError(
+                    f"無法由資料表名稱 {table} 判斷週期，請指定輪詢間隔"
+                )
+            interval = PERIOD_SECONDS[period]
+        self.interval = float(interval)
+        self.delay = float(delay)
+        self.origin = float(_PERIOD_ORIGIN.get(period, 0.0))
+        if interval != PERIOD_SECONDS.get(period):
+            self.origin = 0.0
+
+        self.status_path = status_path
+        self.batch_size = batch_size
+        self.save_batch_size = save_batch_size
+        self.metrics_jsonl = metrics_jsonl
+        self.metrics_prom = metrics_prom
+        self.snapshot = snapshot
+
+        # 各 symbol 的近期輸入欄位與最後處理的 K 棒
+        self.history = {}
+        self.last_bar = {}
+        self._stop = threading.Event()
+        self.status = {
+            'pid': os.getpid(),
+            'database': backend.database_name,
+            'table': table,
+            'signals_table': self.signals_table,
+            'state': 'starting',
+            'started_at': _iso(time.time()),
+            'interval_seconds': self.interval,
+            'polls': 0,
+            'last_poll': None,
+            'last_poll_seconds': None,
+            'last_poll_rows': 0,
+            'next_poll': None,
+            'last_error': None,
+            'symbols': {},
+        }
+
+    # --- 生命週期 ---
+
+    def request_stop(self, signum=None, frame=None):
+        """要求結束：目前這一輪完成後即離開 run()"""
+        if not self._stop.is_set():
+            print("\n收到結束訊號，完成目前工作後結束...")
+        self._stop.set()
+
+    def install_signal_handlers(self):
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+            signum = getattr(signal, name, None)
+            if signum is not None:
+                try:
+                    signal.signal(signum, self.request_stop)
+                except (ValueError, OSError):
+                    # 非主執行緒或平台不支援時略過
+                    pass
+
+    def run(self):
+        """啟動暖機後依週期輪詢，直到收到結束訊號"""
+        self.install_signal_handlers()
+        print(
+            f"常駐模式：資料表 {self.table}，"
+            f"每 {self.interval:g} 秒輪詢（週期結束後延遲 {self.delay:g} 秒）"
+        )
+        self._cycle(self.warm_up)
+        self.status['state'] = 'running'
+        while not self._stop.is_set():
+            next_time = next_run_time(
+                time.time(), self.interval, self.delay, self.origin
+            )
+            self.status['next_poll'] = _iso(next_time)
+            self.write_status()
+            print(f"下次輪詢時間: {self.status['next_poll']}")
+            if self._stop.wait(max(0.0, next_time - time.time())):
+                break
+            self._cycle(self.poll_once)
+        self.status['state'] = 'stopped'
+        self.status['next_poll'] = None
+        self.write_status()
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.backend.close()
+        print("常駐模式已結束")
+
+    def _cycle(self, func):
+        """執行一輪工作；任何例外只記錄在狀態中，下一輪重試"""
+        start = time.time()
+        try:
+            rows = func()
+            self.status['last_error'] = None
+        except Exception as e:
+            print(f"[錯誤] 輪詢時發生錯誤（下一輪重試）: {str(e)}")
+            self.status['last_error'] = {'at': _iso(time.time()), 'error': str(e)}
+            rows = 0
+        self.status['polls'] += 1
+        self.status['last_poll'] = _iso(start)
+        self.status['last_poll_seconds'] = time.time() - start
+        self.status['last_poll_rows'] = rows
+        self.write_status()
+
+    # --- 讀取 ---
+
+    def warm_up(self):
+        """
+        啟動時讀取各 symbol 的暖機歷史：已有訊號的 symbol 只讀取水位線前
+        history_bars 根與之後的新資料，並補算水位線之後的訊號；沒有訊號
+        紀錄的 symbol 讀取完整歷史並全部計算。回傳寫入的筆數。
+        """
+        if self.discover:
+            self.symbols = self.backend.read_symbols(self.table)
+            print(f"資料表共有 {len(self.symbols)} 個 symbol")
+        watermarks = self.backend.read_signal_watermarks(
+            self.signals_table, self.symbols
+        )
+        reader = self.backend.read_ohlcv_by_symbols(
+            self.table, self.symbols,
+            batch_size=self.batch_size, since=watermarks,
+            warmup_bars=self.history_bars, columns=self.columns,
+        )
+        pending = {
+            symbol: (df, watermarks.get(symbol))
+            for symbol, df in reader if not df.empty
+        }
+        return self._process(pending, metrics_name='warm_up')
+
+    def poll_once(self):
+        """只讀取各 symbol 最後處理的 K 棒之後的新資料並計算，回傳寫入筆數"""
+        metrics = StageMetrics(None, table=self.table)
+        with metrics.stage('read') as stage:
+            since = {s: self.last_bar.get(s) for s in self.symbols}
+            reader = self.backend.read_ohlcv_by_symbols(
+                self.table, self.symbols,
+                batch_size=self.batch_size, since=since,
+                warmup_bars=0, columns=self.columns,
+            )
+            pending = {}
+            for symbol, new in reader:
+                if new.empty:
+                    continue
+                history = self.history.get(symbol)
+                if history is not None:
+                    new = pd.concat([history, new], ignore_index=True)
+                pending[symbol] = (new, self.last_bar.get(symbol))
+            stage['rows'] = sum(len(df) for df, _ in pending.values())
+        if not pending:
+            print("沒有新的 K 棒")
+            return 0
+        return self._process(pending, metrics=metrics)
+
+    # --- 計算與寫入 ---
+
+    def _process(self, pending, metrics=None, metrics_name='poll'):
+        """計算 pending（symbol -> (資料, 水位線)）的訊號，寫回新資料列"""
+        start = time.time()
+        if metrics is None:
+            metrics = StageMetrics(None, table=self.table)
+        outputs = []
+        latest = []
+        history = {}
+        last_bar = {}
+        for symbol, (df, since) in pending.items():
+            df = df.reset_index(drop=True)
+            history[symbol] = df.tail(self.history_bars).reset_index(drop=True)
+            with metrics.stage('calc', rows=len(df)):
+                if self.compute_indicators:
+                    df = compute_base_indicators(
+                        df, columns=ind.required_columns(self.selected)
+                    )
+                df = ind.compute_signals(df, indicators=self.selected)
+            with metrics.stage('signal', rows=len(df)):
+                df = tradesmod.generate_trade_signals(df)
+            if self.snapshot is not None:
+                # 沒有新 K 棒的 symbol 也以最後一根列入快照
+                latest.append(df.tail(1))
+            if since is not None:
+                df = df[df['datetime'] > pd.Timestamp(since)]
+            last_bar[symbol] = pd.Timestamp(history[symbol]['datetime'].iloc[-1])
+            if not df.empty:
+                outputs.append(df)
+
+        rows = 0
+        if outputs:
+            with metrics.stage('format') as stage:
+                out_df = tradesmod.format_signals_for_output(
+                    pd.concat(outputs, ignore_index=True)
+                )
+                stage['rows'] = len(out_df)
+            with metrics.stage('save', rows=len(out_df)):
+                self.backend.save_signals(
+                    out_df, self.signals_table,
+                    batch_size=self.save_batch_size,
+                )
+            rows = len(out_df)
+
+        # 寫入成功後才更新記憶體中的歷史與水位線：save_signals 失敗時拋出
+        # 例外（由 _cycle 記錄），不會執行到這裡，下一輪重新處理
+        self.history.update(history)
+        self.last_bar.update(last_bar)
+        if latest:
+            self.snapshot.update(
+                tradesmod.format_signals_for_output(
+                    pd.concat(latest, ignore_index=True)
+                ),
+                self.signals_table,
+            )
+        now = _iso(time.time())
+        for symbol, bar in last_bar.items():
+            entry = self.status['symbols'].setdefault(symbol, {'rows': 0})
+            entry['last_bar'] = _iso(bar)
+            entry['updated_at'] = now
+        for df in outputs:
+            symbol = str(df['symbol'].iloc[0])
+            self.status['symbols'][symbol]['rows'] += len(df)
+        print(
+            f"處理 {len(pending)} 個 symbol，寫入 {rows:,} 筆訊號，"
+            f"耗時 {time.time() - start:.2f} 秒"
+        )
+        self._write_metrics(metrics_name, rows, time.time() - start, metrics)
+        return rows
+
+    # --- 狀態與指標 ---
+
+    def _write_metrics(self, name, rows, seconds, metrics):
+        if not (self.metrics_jsonl or self.metrics_prom):
+            return
+        results = [{
+            'symbol': name,
+            'status': 'ok',
+            'rows': rows,
+            'total': seconds,
+            'metrics': metrics.as_dict(),
+        }]
+        if self.metrics_jsonl:
+            write_jsonl(results, self.metrics_jsonl)
+        if self.metrics_prom:
+            write_prometheus(
+                results, self.metrics_prom,
+                database=self.backend.database_name, table=self.table,
+            )
+
+    def write_status(self):
+        """以原子替換方式寫入狀態檔（未設定路徑時略過）"""
+        if not self.status_path:
+            return
+        tmp_path = self.status_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.status, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.status_path)
@@ -1,71 +1,191 @@
 # -*- coding: utf-8 -*-
 """資料庫相關讀寫函式（MSSQL）"""
 
+import threading
+from contextlib import contextmanager
+
+import numpy as np
 import pandas as pd
 
+from . import compact as compactmod
 
-def read_ohlcv_from_mssql(
-    server, database, table, user, password, chunk_size=50000
-):
-    import pyodbc
+# 已執行過建表 / 欄位遷移 DDL 的 trade_signals 資料表：
+# (server, database) -> 資料表名稱集合，同一行程內的 MSSQLSession 共用，
+# 避免重複執行 DDL
+_known_signal_tables = {}
+# 只確認過存在（水位線查詢）、尚未執行遷移的資料表，格式同上；
+# 寫入時仍需執行一次 DDL 補上舊版資料表缺少的欄位
+_existing_signal_tables = {}
+
+# 全域連線名額限制（平行模式下由 worker 初始化時設定），None 表示不限制
+_connection_limiter = None
+
+
+def set_connection_limiter(limiter):
+    """設定同時開啟 MSSQL 連線數的上限（可跨行程共用的 Semaphore）"""
+    global _connection_limiter
+    _connection_limiter = limiter
+
+
+@contextmanager
+def connection_slot():
+    """取得一個連線名額，離開區塊時釋放；未設定上限時不做任何事"""
+    limiter = _connection_limiter
+    if limiter is None:
+        yield
+        return
+    limiter.acquire()
+    try:
+        yield
+    finally:
+        limiter.release()
 
-    conn_str = (
+
+def _connection_string(server, database, user, password):
+    return (
         f"DRIVER={{ODBC Driver 17 for SQL Server}};"
         f"SERVER={server};DATABASE={database};UID={user};PWD={password};"
         f"Trusted_Connection=no;Connection Timeout=30;"
         f"Application Name=TechnicalAnalysis"
     )
 
-    try:
-        with pyodbc.connect(conn_str) as conn:
-            conn.setdecoding(pyodbc.SQL_CHAR, encoding='utf-8')
-            conn.setdecoding(pyodbc.SQL_WCHAR, encoding='utf-8')
-
-            count_query = f"SELECT COUNT(*) FROM {table}"
-            cursor = conn.cursor()
-            row_count = cursor.execute(count_query).fetchval()
-            print(f"資料表 {table} 共有 {row_count:,} 筆資料")
-
-            if row_count <= chunk_size:
-                query = f"SELECT * FROM {table} ORDER BY datetime"
-                df = pd.read_sql(query, conn)
-                print(f"已一次讀取全部 {len(df):,} 筆資料")
-            else:
-                print("資料量較大，使用分塊讀取...")
-                date_range_query = (
-                    f"SELECT MIN(datetime) as min_date, "
-                    f"MAX(datetime) as max_date FROM {table}"
-                )
-                date_range = pd.read_sql(date_range_query, conn)
-                min_date = date_range['min_date'].iloc[0]
-                max_date = date_range['max_date'].iloc[0]
-
-                chunks = []
-                current_date = min_date
-                end_date = max_date
-
-                while current_date <= end_date:
-                    next_date = (
-                        pd.to_datetime(current_date) + pd.DateOffset(months=3)
-                    )
-                    chunk_query = (
-                        "SELECT * FROM {} WHERE datetime >= '{}' "
-                        "AND datetime < '{}' ORDER BY datetime"
-                    ).format(table, current_date, next_date)
-                    chunk = pd.read_sql(chunk_query, conn)
-                    chunks.append(chunk)
-                    print(
-                        f"已讀取 {current_date} 至 {next_date} 期間的 "
-                        f"{len(chunk):,} 筆資料"
-                    )
-                    current_date = next_date
-
-                df = pd.concat(chunks, ignore_index=True)
-                print(f"共讀取 {len(df):,} 筆資料")
 
-        if 'datetime' in df.columns:
-            df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-        df = df.sort_values('datetime').reset_index(drop=True)
+class MSSQLSession:
+    """
+    可重複使用的 MSSQL 連線工作階段。
+
+    讀取、水位線查詢與 upsert 共用同一組長期連線，不再每個 symbol 各自
+    重新連線：
+    - connection() 借出一條連線（沒有閒置連線時才新建），用完放回，最多
+      保留 max_idle 條閒置連線；區塊內發生例外時直接關閉該連線
+    - known_tables 記錄已執行過建表 / 遷移 DDL 的 trade_signals 資料表，
+      existing_tables 記錄水位線查詢確認存在的資料表；DDL 與 sys.tables
+      查詢每個資料表只做一次
+    - 每條連線保留 staging 暫存表與 staging 插入專用的 cursor，重複執行
+      同一段插入 SQL 時 pyodbc 沿用已 prepare 的陳述式，不需每次重新解析
+
+    max_idle=0 或已設定連線名額上限（set_connection_limiter）時用完即
+    關閉（等同未傳入 session 時的行為）。可在多個執行緒間共用；序列化
+    （傳給平行模式的 worker）時只保留連線參數。
+    """
+
+    def __init__(self, server, database, user, password, max_idle=4):
+        self.server = server
+        self.database = database
+        self.user = user
+        self.password = password
+        self.max_idle = max(0, int(max_idle))
+        self.known_tables = _known_signal_tables.setdefault(
+            (server, database), set()
+        )
+        self.existing_tables = _existing_signal_tables.setdefault(
+            (server, database), set()
+        )
+        self._lock = threading.Lock()
+        self._idle = []
+        # 連線 -> staging 插入用的 cursor，以及連線 -> 已建立的暫存表名稱
+        self._cursors = {}
+        self._staging = {}
+
+    def __getstate__(self):
+        return {
+            'server': self.server,
+            'database': self.database,
+            'user': self.user,
+            'password': self.password,
+            'max_idle': self.max_idle,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self):
+        import pyodbc
+
+        conn = pyodbc.connect(_connection_string(
+            self.server, self.database, self.user, self.password
+        ))
+        conn.setdecoding(pyodbc.SQL_CHAR, encoding='utf-8')
+        conn.setdecoding(pyodbc.SQL_WCHAR, encoding='utf-8')
+        return conn
+
+    def _discard(self, conn):
+        self._cursors.pop(conn, None)
+        self._staging.pop(conn, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """借出一條連線（佔用一個連線名額），離開區塊時放回或關閉"""
+        with connection_slot():
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            except BaseException:
+                # 連線狀態不明（可能已斷線或交易未結束），不放回
+                self._discard(conn)
+                raise
+            # 設有連線名額上限時不保留閒置連線：名額只在使用期間佔用，
+            # 放回閒置池的連線仍開著，會讓實際連線數超過上限
+            with self._lock:
+                if (_connection_limiter is None
+                        and len(self._idle) < self.max_idle):
+                    self._idle.append(conn)
+                    return
+            self._discard(conn)
+
+    def cursor(self, conn):
+        """取得該連線上 staging 插入重複使用的 cursor"""
+        cursor = self._cursors.get(conn)
+        if cursor is None:
+            cursor = self._cursors[conn] = conn.cursor()
+        return cursor
+
+    def close(self):
+        """關閉所有閒置連線"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+
+def _session(session, server, database, user, password):
+    """未傳入 session 時建立用完即關閉的暫時工作階段"""
+    if session is not None:
+        return session
+    return MSSQLSession(server, database, user, password, max_idle=0)
+
+
+def _select_list(columns, alias=None):
+    """組出 SELECT 欄位清單；columns 為 None 時為 *"""
+    prefix = f"{alias}." if alias else ''
+    if not columns:
+        return f"{prefix}*"
+    return ', '.join(f"{prefix}{col}" for col in columns)
+
+
+def read_ohlcv_from_mssql(
+    server, database, table, user, password, chunk_size=50000, session=None,
+):
+    """讀取整張資料表（依 datetime 排序）；內部以 keyset 分頁逐頁讀取"""
+    try:
+        parts = [
+            df for _, df in iter_ohlcv_from_mssql(
+                server, database, table, user, password,
+                page_size=chunk_size, session=session,
+            )
+        ]
+        if not parts:
+            return pd.DataFrame()
+        df = pd.concat(parts, ignore_index=True)
+        print(f"共讀取 {len(df):,} 筆資料")
+        df = df.sort_values('datetime', kind='stable').reset_index(drop=True)
         return df
 
     except Exception as e:
@@ -73,24 +193,346 @@ def read_ohlcv_from_mssql(
         return pd.DataFrame()
 
 
-def save_signals_to_mssql(
-    df, server, database, user, password, table_name='trade_signals'
+def iter_ohlcv_from_mssql(
+    server, database, table, user, password, page_size=50000, columns=None,
+    session=None,
 ):
-    import time
-    import pyodbc
-    start_time = time.time()
+    """
+    以 (symbol, datetime) keyset 分頁串流讀取整張資料表，逐一 yield
+    (symbol, DataFrame)。
 
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={server};DATABASE={database};UID={user};PWD={password};"
-        f"Trusted_Connection=no"
+    每頁以參數化查詢取 TOP (page_size) 筆，從上一頁最後一筆的
+    (symbol, datetime) 之後接續，不需 COUNT 或 MIN/MAX 掃描；某個 symbol
+    的資料讀完（下一頁已換到其他 symbol）時立即 yield，記憶體用量約為
+    一頁加上單一 symbol 的資料量。假設 (symbol, datetime) 不重複。
+    columns 指定只讀取部分欄位，None 表示全部。session 為 MSSQLSession，
+    未傳入時自行建立連線並於讀完後關閉。
+    """
+    session = _session(session, server, database, user, password)
+    page_size = max(1, int(page_size))
+    select = _select_list(columns)
+    first_query = (
+        f"SELECT TOP (?) {select} FROM {table} ORDER BY symbol, datetime"
+    )
+    next_query = (
+        f"SELECT TOP (?) {select} FROM {table} "
+        f"WHERE symbol > ? OR (symbol = ? AND datetime > ?) "
+        f"ORDER BY symbol, datetime"
     )
 
-    conn = pyodbc.connect(conn_str, timeout=30)
-    cursor = conn.cursor()
+    pending = []
+    pending_symbol = None
+    last_key = None
+    pages = 0
+    with session.connection() as conn:
+        while True:
+            if last_key is None:
+                page = pd.read_sql(first_query, conn, params=[page_size])
+            else:
+                symbol, last_dt = last_key
+                page = pd.read_sql(
+                    next_query, conn,
+                    params=[page_size, symbol, symbol, last_dt],
+                )
+            pages += 1
+            if page.empty:
+                break
+            page['datetime'] = pd.to_datetime(
+                page['datetime'], errors='coerce'
+            )
+            last_row = page.iloc[-1]
+            last_key = (
+                last_row['symbol'],
+                pd.Timestamp(last_row['datetime']).to_pydatetime(),
+            )
 
-    try:
-        check_table_query = f"""
+            for symbol, part in page.groupby('symbol', sort=False):
+                if pending_symbol is not None and symbol != pending_symbol:
+                    yield _flush_pending(pending_symbol, pending)
+                    pending = []
+                pending_symbol = symbol
+                pending.append(part)
+            print(f"已讀取第 {pages} 頁，{len(page):,} 筆資料")
+
+            if len(page) < page_size:
+                break
+
+    if pending_symbol is not None:
+        yield _flush_pending(pending_symbol, pending)
+
+
+def _flush_pending(symbol, parts):
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return str(symbol).strip(), df.reset_index(drop=True)
+
+
+def read_ohlcv_by_symbols(
+    server, database, table, user, password, symbols, batch_size=500,
+    since=None, warmup_bars=0, columns=None, session=None,
+):
+    """
+    以集合查詢批次讀取多個 symbol 的資料，逐一 yield (symbol, DataFrame)。
+
+    symbols 依 batch_size 切成多段 IN 清單（參數化查詢，單段不超過
+    SQL Server 2100 個參數上限），每批只需一次連線與一次查詢，
+    再以 groupby 拆成各 symbol 的資料。查無資料的 symbol 會 yield
+    空的 DataFrame，不需另外執行 COUNT。
+
+    since 為 symbol -> datetime 的 dict（增量模式）：有值的 symbol 只讀取
+    該時間點之後的新資料，外加之前 warmup_bars 根作為指標暖機。
+    columns 指定只讀取部分欄位（例如只讀原始 OHLCV），None 表示全部。
+    session 為 MSSQLSession，未傳入時每批各自連線。
+    """
+    session = _session(session, server, database, user, password)
+    batch_size = max(1, min(int(batch_size), 2000))
+
+    # 保留原始順序並去除重複
+    wanted = list(dict.fromkeys(str(s) for s in symbols))
+
+    since = since or {}
+    full = [s for s in wanted if since.get(s) is None]
+    partial = [s for s in wanted if since.get(s) is not None]
+    # 增量查詢每個 symbol 需 2 個參數
+    batches = [
+        (full[i:i + batch_size], False)
+        for i in range(0, len(full), batch_size)
+    ] + [
+        (partial[i:i + batch_size // 2], True)
+        for i in range(0, len(partial), max(1, batch_size // 2))
+    ]
+
+    for batch, incremental in batches:
+        if incremental:
+            query, params = _incremental_query(
+                table, batch, since, warmup_bars, columns
+            )
+        else:
+            placeholders = ', '.join('?' for _ in batch)
+            query = (
+                f"SELECT {_select_list(columns)} FROM {table} "
+                f"WHERE symbol IN ({placeholders}) "
+                f"ORDER BY symbol, datetime"
+            )
+            params = batch
+        # 每批查完即歸還連線，呼叫端計算指標期間不佔用連線名額
+        with session.connection() as conn:
+            df = pd.read_sql(query, conn, params=params)
+        print(f"批次讀取 {len(batch)} 個 symbol，共 {len(df):,} 筆資料")
+        for symbol, part in _split_by_symbol(df, batch):
+            yield symbol, part
+
+
+def _incremental_query(table, batch, since, warmup_bars, columns=None):
+    """組出增量讀取查詢：每個 symbol 取水位線前 warmup_bars 根與之後的全部資料"""
+    values = ', '.join('(?, ?)' for _ in batch)
+    pairs = []
+    for symbol in batch:
+        pairs.extend([symbol, pd.Timestamp(since[symbol]).to_pydatetime()])
+    # 參數順序需與查詢中 ? 出現的順序一致
+    params = pairs + [int(warmup_bars)] + pairs
+    query = (
+        f"SELECT * FROM ("
+        f"SELECT {_select_list(columns, 'd')} "
+        f"FROM (VALUES {values}) AS wm(symbol, since) "
+        f"CROSS APPLY (SELECT TOP (?) {_select_list(columns, 't')} "
+        f"FROM {table} t "
+        f"WHERE t.symbol = wm.symbol AND t.datetime <= wm.since "
+        f"ORDER BY t.datetime DESC) d "
+        f"UNION ALL "
+        f"SELECT {_select_list(columns, 't')} FROM {table} t "
+        f"JOIN (VALUES {values}) AS wm(symbol, since) "
+        f"ON t.symbol = wm.symbol AND t.datetime > wm.since"
+        f") u ORDER BY symbol, datetime"
+    )
+    return query, params
+
+
+def read_symbols(server, database, user, password, table, session=None):
+    """以 SELECT DISTINCT 列出資料表內所有 symbol（依名稱排序）"""
+    session = _session(session, server, database, user, password)
+    with session.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            rows = cursor.execute(
+                f"SELECT DISTINCT symbol FROM {table} ORDER BY symbol"
+            ).fetchall()
+        finally:
+            cursor.close()
+    return [str(row[0]).strip() for row in rows if row[0] is not None]
+
+
+def read_signal_watermarks(
+    server, database, user, password, table_name, symbols, batch_size=1000,
+    session=None,
+):
+    """
+    查詢 trade_signals 表中各 symbol 已儲存的最新 datetime（水位線）。
+
+    回傳 symbol -> Timestamp 的 dict；資料表不存在或尚無資料的 symbol
+    不會出現在結果中（呼叫端應視為需要完整重算）。
+    """
+    session = _session(session, server, database, user, password)
+    wanted = list(dict.fromkeys(str(s) for s in symbols))
+    batch_size = max(1, min(int(batch_size), 2000))
+    watermarks = {}
+
+    with session.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if not (
+                table_name in session.known_tables
+                or table_name in session.existing_tables
+            ):
+                exists = cursor.execute(
+                    "SELECT COUNT(*) FROM sys.tables WHERE name = ?",
+                    table_name,
+                ).fetchval()
+                if not exists:
+                    return watermarks
+                # 只記錄存在；signal_hash 等欄位的遷移由寫入時的 DDL 負責
+                session.existing_tables.add(table_name)
+            for i in range(0, len(wanted), batch_size):
+                batch = wanted[i:i + batch_size]
+                placeholders = ', '.join('?' for _ in batch)
+                rows = cursor.execute(
+                    f"SELECT symbol, MAX(datetime) FROM {table_name} "
+                    f"WHERE symbol IN ({placeholders}) GROUP BY symbol",
+                    *batch,
+                ).fetchall()
+                for symbol, last in rows:
+                    if last is not None:
+                        watermarks[str(symbol).strip()] = pd.Timestamp(last)
+        finally:
+            cursor.close()
+
+    # 與 _split_by_symbol 相同，找不到時以 casefold 對回呼叫端的寫法
+    folded = {k.casefold(): k for k in watermarks}
+    result = {}
+    for symbol in wanted:
+        key = symbol if symbol in watermarks else folded.get(symbol.casefold())
+        if key is not None:
+            result[symbol] = watermarks[key]
+    return result
+
+
+def _split_by_symbol(df, batch):
+    """將批次查詢結果依 symbol 拆開；查無資料的 symbol 回傳空 DataFrame"""
+    groups = {}
+    if not df.empty and 'symbol' in df.columns:
+        if 'datetime' in df.columns:
+            df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
+        for key, part in df.groupby('symbol', sort=False):
+            groups[str(key).strip()] = part
+    # 資料庫定序通常不分大小寫，找不到時改以 casefold 比對
+    folded = {k.casefold(): k for k in groups}
+
+    for symbol in batch:
+        key = symbol if symbol in groups else folded.get(symbol.casefold())
+        if key is None:
+            yield symbol, df.iloc[0:0].copy()
+        else:
+            yield symbol, groups[key].reset_index(drop=True)
+
+
+# trade_signals 系列表格寫入的欄位（與 staging 表的欄位順序相同）
+SIGNAL_TABLE_COLUMNS = [
+    'datetime', 'symbol', 'close_price', 'Trade_Signal',
+    'Signal_Strength', 'Buy_Signals', 'Sell_Signals',
+    'MA_Cross', 'BB_Signal', 'MACD_Cross', 'Trend', 'MACD_Div',
+    'RSI_Signal', 'KD_Signal', 'SR_Signal', 'Volume_Anomaly',
+    'EMA_Cross', 'CCI_Signal', 'WILLR_Signal', 'MOM_Signal', 'Anomaly',
+    'signal_hash',
+]
+
+# 變更偵測：signal_hash 為 (symbol, datetime) 以外 19 個欄位的 64 位元雜湊，
+# 寫入前與資料表中已存的雜湊比對，未變更的資料列不送進 staging / MERGE
+SIGNAL_HASH_SOURCE = [
+    c for c in SIGNAL_TABLE_COLUMNS
+    if c not in ('datetime', 'symbol', 'signal_hash')
+]
+_NUMERIC_SIGNAL_COLUMNS = ('close_price', 'Buy_Signals', 'Sell_Signals')
+
+
+def signal_hashes(df):
+    """
+    各列訊號欄位的 64 位元雜湊（int64，可存入 BIGINT）。數值欄統一轉為
+    float64、文字欄統一轉為字串，同一筆訊號在不同次執行得到相同的雜湊。
+    """
+    values = {}
+    for col in SIGNAL_HASH_SOURCE:
+        series = df[col] if col in df.columns else pd.Series('', index=df.index)
+        if col in _NUMERIC_SIGNAL_COLUMNS:
+            values[col] = pd.to_numeric(series, errors='coerce').astype('float64')
+        else:
+            values[col] = series.astype(object).where(series.notna(), '').astype(str)
+    hashed = pd.util.hash_pandas_object(pd.DataFrame(values), index=False)
+    return hashed.to_numpy().view(np.int64)
+
+
+def _stored_hashes(execute, table_name, df, batch_size=1000):
+    """
+    讀取 df 涵蓋的 symbol 與時間範圍內已存的 (symbol, datetime, signal_hash)。
+    execute(sql, params) 執行查詢並回傳資料列，讓 MSSQL 與 SQLite 共用。
+    """
+    times = pd.to_datetime(df['datetime'])
+    params_range = [
+        pd.Timestamp(times.min()).to_pydatetime(),
+        pd.Timestamp(times.max()).to_pydatetime(),
+    ]
+    symbols = list(dict.fromkeys(df['symbol'].astype(str)))
+    rows = []
+    for i in range(0, len(symbols), batch_size):
+        batch = symbols[i:i + batch_size]
+        placeholders = ', '.join('?' for _ in batch)
+        # 舊資料沒有雜湊（NULL）時以 0 代替，視為已變更並補上雜湊
+        rows.extend(execute(
+            f"SELECT symbol, datetime, COALESCE(signal_hash, 0) "
+            f"FROM {table_name} WHERE symbol IN ({placeholders}) "
+            f"AND datetime >= ? AND datetime <= ?",
+            batch + params_range,
+        ))
+    return pd.DataFrame(
+        [tuple(r) for r in rows],
+        columns=['symbol', 'datetime', 'signal_hash'],
+    )
+
+
+def skip_unchanged(df, execute, table_name):
+    """
+    加上 signal_hash 欄並去掉與資料表中雜湊相同的資料列，
+    回傳 (需要寫入的 DataFrame, 略過筆數)。
+    """
+    df = df.assign(signal_hash=signal_hashes(df))
+    if df.empty:
+        return df, 0
+    stored = _stored_hashes(execute, table_name, df)
+    if stored.empty:
+        return df, 0
+    stored_keys = pd.MultiIndex.from_arrays([
+        stored['symbol'].astype(str).str.strip().str.casefold(),
+        pd.to_datetime(stored['datetime']),
+    ])
+    keys = pd.MultiIndex.from_arrays([
+        df['symbol'].astype(str).str.strip().str.casefold(),
+        pd.to_datetime(df['datetime']),
+    ])
+    keep = ~stored_keys.duplicated()
+    stored_keys = stored_keys[keep]
+    stored_hash = stored['signal_hash'].to_numpy(dtype=np.int64)[keep]
+    pos = stored_keys.get_indexer(keys)
+    found = pos >= 0
+    unchanged = np.zeros(len(df), dtype=bool)
+    unchanged[found] = (
+        stored_hash[pos[found]] == df['signal_hash'].to_numpy()[found]
+    )
+    skipped = int(unchanged.sum())
+    if skipped:
+        df = df[~unchanged].reset_index(drop=True)
+    return df, skipped
+
+
+def _create_signals_table_sql(table_name):
+    return f"""
         IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = '{table_name}')
         BEGIN
             CREATE TABLE {table_name} (
@@ -116,170 +558,331 @@ def save_signals_to_mssql(
                 WILLR_Signal NVARCHAR(50),
                 MOM_Signal NVARCHAR(50),
                 Anomaly NVARCHAR(50),
+                signal_hash BIGINT,
                 INDEX idx_datetime (datetime),
                 INDEX idx_symbol (symbol)
             )
         END
+        ELSE IF COL_LENGTH('{table_name}', 'signal_hash') IS NULL
+        BEGIN
+            -- 舊版建立的資料表補上變更偵測用的雜湊欄
+            ALTER TABLE {table_name} ADD signal_hash BIGINT NULL
+        END
         """
-        cursor.execute(check_table_query)
-        conn.commit()
-
-        required_columns = [
-            'datetime', 'symbol', 'close_price', 'Trade_Signal',
-            'Signal_Strength', 'Buy_Signals', 'Sell_Signals',
-            'MA_Cross', 'BB_Signal', 'MACD_Cross', 'Trend', 'MACD_Div',
-            'RSI_Signal', 'KD_Signal', 'SR_Signal', 'Volume_Anomaly',
-            'EMA_Cross', 'CCI_Signal', 'WILLR_Signal', 'MOM_Signal', 'Anomaly'
-        ]
 
-        for col in required_columns:
-            if col not in df.columns:
-                if col == 'symbol' and 'symbol' not in df.columns:
-                    df['symbol'] = 'Unknown'
-                else:
-                    df[col] = ''
-
-        # 不執行預刪除，改為使用 staging + MERGE 做 upsert
-        # 這樣會保留歷史紀錄，只對相同 (symbol, datetime) 做更新或插入
-        print("使用 MERGE 進行 upsert，不會先刪除歷史紀錄")
-
-        # 使用暫存 staging table 與 MERGE 做 upsert（更新或插入）
-        batch_size = 1000
-        total_rows = len(df)
-
-        # 建立暫存表 #staging（與主表結構相符，不建立索引）
-        create_staging_sql = (
-            "IF OBJECT_ID('tempdb..#staging') IS NOT NULL DROP TABLE #staging;"
-            "CREATE TABLE #staging ("
-            "datetime DATETIME,"
-            "symbol NVARCHAR(20),"
-            "close_price FLOAT,"
-            "Trade_Signal NVARCHAR(50),"
-            "Signal_Strength NVARCHAR(50),"
-            "Buy_Signals FLOAT,"
-            "Sell_Signals FLOAT,"
-            "MA_Cross NVARCHAR(50),"
-            "BB_Signal NVARCHAR(50),"
-            "MACD_Cross NVARCHAR(50),"
-            "Trend NVARCHAR(50),"
-            "MACD_Div NVARCHAR(50),"
-            "RSI_Signal NVARCHAR(50),"
-            "KD_Signal NVARCHAR(50),"
-            "SR_Signal NVARCHAR(50),"
-            "Volume_Anomaly NVARCHAR(50),"
-            "EMA_Cross NVARCHAR(50),"
-            "CCI_Signal NVARCHAR(50),"
-            "WILLR_Signal NVARCHAR(50),"
-            "MOM_Signal NVARCHAR(50),"
-            "Anomaly NVARCHAR(50)"
-            ");"
-        )
-        cursor.execute(create_staging_sql)
-
-        insert_staging_sql = (
-            "INSERT INTO #staging (datetime, symbol, close_price, "
-            "Trade_Signal, Signal_Strength, Buy_Signals, Sell_Signals,"
-            " MA_Cross,"
-            " BB_Signal, MACD_Cross, Trend, MACD_Div, RSI_Signal,"
-            " KD_Signal, SR_Signal, Volume_Anomaly, EMA_Cross,"
-            " CCI_Signal, WILLR_Signal, MOM_Signal, Anomaly) VALUES ("
-            "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?"
-            ")"
-        )
 
-        # 插入 staging（分批）
-        for i in range(0, total_rows, batch_size):
-            batch_df = df.iloc[i:i+batch_size]
-            batch_data = []
-            for _, row in batch_df.iterrows():
-                record = (
-                    row['datetime'],
-                    row.get('symbol', 'Unknown'),
-                    row['close_price'],
-                    row['Trade_Signal'],
-                    row['Signal_Strength'],
-                    row['Buy_Signals'],
-                    row['Sell_Signals'],
-                    row['MA_Cross'],
-                    row['BB_Signal'],
-                    row['MACD_Cross'],
-                    row['Trend'],
-                    row['MACD_Div'],
-                    row['RSI_Signal'],
-                    row['KD_Signal'],
-                    row['SR_Signal'],
-                    row['Volume_Anomaly'],
-                    row['EMA_Cross'],
-                    row['CCI_Signal'],
-                    row['WILLR_Signal'],
-                    row['MOM_Signal'],
-                    row.get('Anomaly', '')
-                )
-                batch_data.append(record)
+# 暫存表 #staging（與主表結構相符，不建立索引）；屬於連線，
+# 長期連線上只建立一次，之後每次寫入前清空
+_CREATE_STAGING_SQL = (
+    "IF OBJECT_ID('tempdb..#staging') IS NOT NULL DROP TABLE #staging;"
+    "CREATE TABLE #staging ("
+    "datetime DATETIME,"
+    "symbol NVARCHAR(20),"
+    "close_price FLOAT,"
+    "Trade_Signal NVARCHAR(50),"
+    "Signal_Strength NVARCHAR(50),"
+    "Buy_Signals FLOAT,"
+    "Sell_Signals FLOAT,"
+    "MA_Cross NVARCHAR(50),"
+    "BB_Signal NVARCHAR(50),"
+    "MACD_Cross NVARCHAR(50),"
+    "Trend NVARCHAR(50),"
+    "MACD_Div NVARCHAR(50),"
+    "RSI_Signal NVARCHAR(50),"
+    "KD_Signal NVARCHAR(50),"
+    "SR_Signal NVARCHAR(50),"
+    "Volume_Anomaly NVARCHAR(50),"
+    "EMA_Cross NVARCHAR(50),"
+    "CCI_Signal NVARCHAR(50),"
+    "WILLR_Signal NVARCHAR(50),"
+    "MOM_Signal NVARCHAR(50),"
+    "Anomaly NVARCHAR(50),"
+    "signal_hash BIGINT"
+    ");"
+)
 
-            cursor.fast_executemany = True
-            cursor.executemany(insert_staging_sql, batch_data)
-            conn.commit()
 
-            progress = min(i + batch_size, total_rows)
-            print(
-                f"已處理 {progress}/{total_rows} 筆資料 (已寫入暫存表) "
-                f"({progress/total_rows*100:.1f}%)"
+def _create_packed_table_sql(table_name):
+    """精簡模式的窄表（欄位見 signals.compact）"""
+    return f"""
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = '{table_name}')
+        BEGIN
+            CREATE TABLE {table_name} (
+                id INT IDENTITY(1,1) PRIMARY KEY,
+                datetime DATETIME,
+                symbol NVARCHAR(20),
+                close_price FLOAT,
+                Buy_Signals FLOAT,
+                Sell_Signals FLOAT,
+                signal_bits BIGINT,
+                signal_hash BIGINT,
+                INDEX idx_datetime (datetime),
+                INDEX idx_symbol (symbol)
             )
+        END
+        """
+
+
+_CREATE_PACKED_STAGING_SQL = (
+    "IF OBJECT_ID('tempdb..#staging_packed') IS NOT NULL "
+    "DROP TABLE #staging_packed;"
+    "CREATE TABLE #staging_packed ("
+    "datetime DATETIME,"
+    "symbol NVARCHAR(20),"
+    "close_price FLOAT,"
+    "Buy_Signals FLOAT,"
+    "Sell_Signals FLOAT,"
+    "signal_bits BIGINT,"
+    "signal_hash BIGINT"
+    ");"
+)
+
+# pyodbc 以同一個 SQL 字串物件判斷能否沿用已 prepare 的陳述式，
+# 因此定義為模組常數，每次 executemany 傳入同一個物件
+_INSERT_STAGING_SQL = (
+    "INSERT INTO #staging (datetime, symbol, close_price, "
+    "Trade_Signal, Signal_Strength, Buy_Signals, Sell_Signals,"
+    " MA_Cross,"
+    " BB_Signal, MACD_Cross, Trend, MACD_Div, RSI_Signal,"
+    " KD_Signal, SR_Signal, Volume_Anomaly, EMA_Cross,"
+    " CCI_Signal, WILLR_Signal, MOM_Signal, Anomaly, signal_hash) VALUES ("
+    "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?"
+    ")"
+)
+
+# 使用 MERGE 從 #staging 合併到主表，根據 symbol + datetime 做匹配
+_MERGE_SQL = (
+    "MERGE INTO {table} AS target\n"
+    "USING #staging AS src\n"
+    "ON target.symbol = src.symbol "
+    "AND target.datetime = src.datetime\n"
+    "WHEN MATCHED THEN\n"
+    "    UPDATE SET\n"
+    "        close_price = src.close_price,\n"
+    "        Trade_Signal = src.Trade_Signal,\n"
+    "        Signal_Strength = src.Signal_Strength,\n"
+    "        Buy_Signals = src.Buy_Signals,\n"
+    "        Sell_Signals = src.Sell_Signals,\n"
+    "        MA_Cross = src.MA_Cross,\n"
+    "        BB_Signal = src.BB_Signal,\n"
+    "        MACD_Cross = src.MACD_Cross,\n"
+    "        Trend = src.Trend,\n"
+    "        MACD_Div = src.MACD_Div,\n"
+    "        RSI_Signal = src.RSI_Signal,\n"
+    "        KD_Signal = src.KD_Signal,\n"
+    "        SR_Signal = src.SR_Signal,\n"
+    "        Volume_Anomaly = src.Volume_Anomaly,\n"
+    "        EMA_Cross = src.EMA_Cross,\n"
+    "        CCI_Signal = src.CCI_Signal,\n"
+    "        WILLR_Signal = src.WILLR_Signal,\n"
+    "        MOM_Signal = src.MOM_Signal,\n"
+    "        Anomaly = src.Anomaly,\n"
+    "        signal_hash = src.signal_hash\n"
+    "WHEN NOT MATCHED BY TARGET THEN\n"
+    "    INSERT (datetime, symbol, close_price, Trade_Signal,\n"
+    "        Signal_Strength, Buy_Signals, Sell_Signals, MA_Cross,\n"
+    "        BB_Signal, MACD_Cross, Trend, MACD_Div, RSI_Signal,\n"
+    "        KD_Signal, SR_Signal, Volume_Anomaly, EMA_Cross,\n"
+    "        CCI_Signal, WILLR_Signal, MOM_Signal, Anomaly, signal_hash)\n"
+    "    VALUES (src.datetime, src.symbol, src.close_price, "
+    "src.Trade_Signal, src.Signal_Strength, src.Buy_Signals, "
+    "src.Sell_Signals, src.MA_Cross, src.BB_Signal, src.MACD_Cross, "
+    "src.Trend, src.MACD_Div, src.RSI_Signal, src.KD_Signal, "
+    "src.SR_Signal, src.Volume_Anomaly, src.EMA_Cross, "
+    "src.CCI_Signal, src.WILLR_Signal, src.MOM_Signal, src.Anomaly, "
+    "src.signal_hash);"
+)
+
+_INSERT_PACKED_STAGING_SQL = (
+    "INSERT INTO #staging_packed (datetime, symbol, close_price, "
+    "Buy_Signals, Sell_Signals, signal_bits, signal_hash) VALUES ("
+    "?, ?, ?, ?, ?, ?, ?)"
+)
+
+_MERGE_PACKED_SQL = (
+    "MERGE INTO {table} AS target\n"
+    "USING #staging_packed AS src\n"
+    "ON target.symbol = src.symbol "
+    "AND target.datetime = src.datetime\n"
+    "WHEN MATCHED THEN\n"
+    "    UPDATE SET\n"
+    "        close_price = src.close_price,\n"
+    "        Buy_Signals = src.Buy_Signals,\n"
+    "        Sell_Signals = src.Sell_Signals,\n"
+    "        signal_bits = src.signal_bits,\n"
+    "        signal_hash = src.signal_hash\n"
+    "WHEN NOT MATCHED BY TARGET THEN\n"
+    "    INSERT (datetime, symbol, close_price, Buy_Signals,\n"
+    "        Sell_Signals, signal_bits, signal_hash)\n"
+    "    VALUES (src.datetime, src.symbol, src.close_price, "
+    "src.Buy_Signals, src.Sell_Signals, src.signal_bits, "
+    "src.signal_hash);"
+)
+
+# 一般（寬表）與精簡模式（窄表）寫入時使用的暫存表與 SQL：
+# (暫存表名稱, 建立暫存表, 插入暫存表, MERGE, 欄位)
+_UPSERT_SQL = {
+    False: (
+        '#staging', _CREATE_STAGING_SQL, _INSERT_STAGING_SQL, _MERGE_SQL,
+        SIGNAL_TABLE_COLUMNS,
+    ),
+    True: (
+        '#staging_packed', _CREATE_PACKED_STAGING_SQL,
+        _INSERT_PACKED_STAGING_SQL, _MERGE_PACKED_SQL,
+        compactmod.PACKED_COLUMNS,
+    ),
+}
 
-        # 使用 MERGE 從 #staging 合併到主表，根據 symbol + datetime 做匹配
-        merge_sql = (
-            "MERGE INTO {table} AS target\n"
-            "USING #staging AS src\n"
-            "ON target.symbol = src.symbol "
-            "AND target.datetime = src.datetime\n"
-            "WHEN MATCHED THEN\n"
-            "    UPDATE SET\n"
-            "        close_price = src.close_price,\n"
-            "        Trade_Signal = src.Trade_Signal,\n"
-            "        Signal_Strength = src.Signal_Strength,\n"
-            "        Buy_Signals = src.Buy_Signals,\n"
-            "        Sell_Signals = src.Sell_Signals,\n"
-            "        MA_Cross = src.MA_Cross,\n"
-            "        BB_Signal = src.BB_Signal,\n"
-            "        MACD_Cross = src.MACD_Cross,\n"
-            "        Trend = src.Trend,\n"
-            "        MACD_Div = src.MACD_Div,\n"
-            "        RSI_Signal = src.RSI_Signal,\n"
-            "        KD_Signal = src.KD_Signal,\n"
-            "        SR_Signal = src.SR_Signal,\n"
-            "        Volume_Anomaly = src.Volume_Anomaly,\n"
-            "        EMA_Cross = src.EMA_Cross,\n"
-            "        CCI_Signal = src.CCI_Signal,\n"
-            "        WILLR_Signal = src.WILLR_Signal,\n"
-            "        MOM_Signal = src.MOM_Signal,\n"
-            "        Anomaly = src.Anomaly\n"
-            "WHEN NOT MATCHED BY TARGET THEN\n"
-            "    INSERT (datetime, symbol, close_price, Trade_Signal,\n"
-            "        Signal_Strength, Buy_Signals, Sell_Signals, MA_Cross,\n"
-            "        BB_Signal, MACD_Cross, Trend, MACD_Div, RSI_Signal,\n"
-            "        KD_Signal, SR_Signal, Volume_Anomaly, EMA_Cross,\n"
-            "        CCI_Signal, WILLR_Signal, MOM_Signal, Anomaly)\n"
-            "    VALUES (src.datetime, src.symbol, src.close_price, "
-            "src.Trade_Signal, src.Signal_Strength, src.Buy_Signals, "
-            "src.Sell_Signals, src.MA_Cross, src.BB_Signal, src.MACD_Cross, "
-            "src.Trend, src.MACD_Div, src.RSI_Signal, src.KD_Signal, "
-            "src.SR_Signal, src.Volume_Anomaly, src.EMA_Cross, "
-            "src.CCI_Signal, src.WILLR_Signal, src.MOM_Signal, src.Anomaly);"
-        )
-        cursor.execute(merge_sql.format(table=table_name))
-        conn.commit()
+
+def save_signals_to_mssql(
+    df, server, database, user, password, table_name='trade_signals',
+    batch_size=10000, session=None, compact=False, raise_errors=False,
+):
+    """
+    以 staging + MERGE 將訊號 upsert 至 table_name。
+
+    資料一次轉為欄式 tuple 串列後以 fast_executemany 分批寫入 #staging，
+    整個寫入（staging 與 MERGE）在單一交易內完成；資料表存在檢查在同一
+    行程內每個資料表只做一次。session 為 MSSQLSession 時沿用其長期連線、
+    #staging 暫存表與 staging 插入用的 cursor。
+
+    寫入前先計算各列的 signal_hash，並讀取資料表中同一批 symbol、同一
+    時間範圍已存的雜湊；內容未變更的資料列直接略過（重跑歷史資料時
+    通常是大多數），不產生交易紀錄與索引更新。
+
+    compact 為 True 時改寫入精簡模式的窄表 <table_name>_packed（訊號欄
+    打包為 signal_bits），並建立還原寬表的檢視表 <table_name>_wide。
+    回傳 {'rows', 'skipped', 'seconds', 'rows_per_sec'}，rows 為實際寫入筆數。
+    寫入失敗時印出錯誤並回傳筆數為 0 的統計；raise_errors 為 True 時
+    改為拋出例外，讓呼叫端不推進水位線、不輸出檔案。
+    """
+    import time
+    start_time = time.time()
+
+    session = _session(session, server, database, user, password)
+    stats = {'rows': 0, 'skipped': 0, 'seconds': 0.0, 'rows_per_sec': 0.0}
+    staging, create_staging_sql, insert_sql, merge_sql, staging_columns = (
+        _UPSERT_SQL[bool(compact)]
+    )
+    target_table = (
+        compactmod.packed_table(table_name) if compact else table_name
+    )
+
+    try:
+        with session.connection() as conn:
+            conn.autocommit = False
+            try:
+                if target_table not in session.known_tables:
+                    if compact:
+                        conn.execute(_create_packed_table_sql(target_table))
+                        # CREATE VIEW 必須是批次中的第一個陳述式，分開執行
+                        for sql in compactmod.wide_view_sql(table_name):
+                            conn.execute(sql)
+                    else:
+                        conn.execute(_create_signals_table_sql(table_name))
+                    conn.commit()
+                    session.known_tables.add(target_table)
+
+                required_columns = SIGNAL_TABLE_COLUMNS
+
+                for col in required_columns:
+                    if col not in df.columns and col != 'signal_hash':
+                        if col == 'symbol' and 'symbol' not in df.columns:
+                            df['symbol'] = 'Unknown'
+                        else:
+                            df[col] = ''
+
+                # 與已存的雜湊比對，只有新增或內容變更的資料列需要寫入
+                df, skipped = skip_unchanged(
+                    df,
+                    lambda sql, params: conn.execute(sql, *params).fetchall(),
+                    target_table,
+                )
+                if skipped:
+                    print(f"略過 {skipped:,} 筆未變更的資料")
+
+                # 不執行預刪除，改為使用 staging + MERGE 做 upsert
+                # 這樣會保留歷史紀錄，只對相同 (symbol, datetime) 做更新或插入
+                batch_size = max(1, int(batch_size))
+                total_rows = len(df)
+
+                if total_rows:
+                    print("使用 MERGE 進行 upsert，不會先刪除歷史紀錄")
+                    created = session._staging.setdefault(conn, set())
+                    if staging in created:
+                        conn.execute(f"TRUNCATE TABLE {staging}")
+                    else:
+                        conn.execute(create_staging_sql)
+                        created.add(staging)
+
+                    # 一次將整張表轉為 tuple 串列（欄式轉換，不逐列 iterrows）
+                    if compact:
+                        df = compactmod.packed_frame(df)
+                    records = _staging_records(df, staging_columns)
+
+                    # 插入 staging（分批，不逐批 commit，與 MERGE 同一個交易）
+                    cursor = session.cursor(conn)
+                    cursor.fast_executemany = True
+                    for i in range(0, total_rows, batch_size):
+                        cursor.executemany(
+                            insert_sql, records[i:i + batch_size]
+                        )
+
+                        progress = min(i + batch_size, total_rows)
+                        print(
+                            f"已處理 {progress}/{total_rows} 筆資料 "
+                            f"(已寫入暫存表) ({progress/total_rows*100:.1f}%)"
+                        )
+
+                    conn.execute(merge_sql.format(table=target_table))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
 
         elapsed_time = time.time() - start_time
+        stats = {
+            'rows': total_rows,
+            'skipped': skipped,
+            'seconds': elapsed_time,
+            'rows_per_sec': total_rows / elapsed_time if elapsed_time else 0.0,
+        }
         print(
-            "成功將 {} 筆資料 upsert 至 {} 資料表，耗時 {:.2f} 秒".format(
-                total_rows, table_name, elapsed_time
+            "成功將 {} 筆資料 upsert 至 {} 資料表（略過 {} 筆未變更），"
+            "耗時 {:.2f} 秒（{:,.0f} 筆/秒）".format(
+                total_rows, target_table, skipped, elapsed_time,
+                stats['rows_per_sec'],
             )
         )
 
     except Exception as e:
-        conn.rollback()
+        # 資料表可能已被刪除，下次重新檢查
+        session.known_tables.discard(target_table)
+        session.existing_tables.discard(target_table)
         print(f"\n[錯誤] 儲存資料至MSSQL時發生錯誤: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        if raise_errors:
+            raise
+    return stats
+
+
+def _staging_records(df, columns):
+    """
+    將 df 的指定欄位一次轉成 executemany 用的 tuple 串列。
+
+    datetime 轉為原生 datetime，NaN / NaT 轉為 None（SQL NULL），
+    Categorical 訊號欄展開為字串。
+    """
+    arrays = []
+    for col in columns:
+        series = df[col]
+        if col == 'datetime':
+            series = pd.to_datetime(series, errors='coerce')
+            values = np.array(series.dt.to_pydatetime(), dtype=object)
+        else:
+            values = series.to_numpy(dtype=object)
+        mask = series.isna().to_numpy()
+        if mask.any():
+            values = values.copy()
+            values[mask] = None
+        arrays.append(values)
+    return list(zip(*arrays))
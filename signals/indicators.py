@@ -1,164 +1,424 @@
 # -*- coding: utf-8 -*-
-"""技術指標與訊號計算函式集合"""
+"""技術指標與訊號計算函式集合
+
+各訊號欄位以 int8 代碼的 pandas Categorical 儲存（標籤表見
+config.SIGNAL_LABELS），比對與記憶體用量都比字串欄位小得多；
+Categorical 與字串比較、輸出 CSV 時仍會呈現原本的中文標籤。
+
+每個指標的計算核心（_xxx_codes）只讀取 _Columns 中快取的 NumPy 陣列
+與位移陣列並回傳代碼，並登錄於 REGISTRY；compute_signals 以同一份
+_Columns 一次算完所選指標，各欄只轉換一次、每個 shift(1) 只算一次，
+也不複製整張表。
+個別的 xxx_signal(df) 函式保留原本的呼叫方式。
+"""
+
+from collections import namedtuple
 
 import numpy as np
+import pandas as pd
 
+from .config import SIGNAL_LABELS
 
-def ma_cross_signal(df):
-    signal = (df['ma5'] > df['ma20']) & (
-        df['ma5'].shift(1) <= df['ma20'].shift(1))
-    df['MA_Cross'] = np.where(signal, '突破MA20', '')
-    signal = (df['ma5'] < df['ma20']) & (
-        df['ma5'].shift(1) >= df['ma20'].shift(1))
-    df['MA_Cross'] = np.where(signal, '跌破MA20', df['MA_Cross'])
+
+def label_code(col, label):
+    """取得訊號欄位中某個標籤對應的代碼"""
+    return SIGNAL_LABELS[col].index(label)
+
+
+def _set_codes(df, col, codes):
+    """將 int8 代碼陣列寫入 df[col]（Categorical，共用標籤表）"""
+    df[col] = pd.Categorical.from_codes(codes, categories=SIGNAL_LABELS[col])
     return df
 
 
-def bollinger_signal(df):
-    df['BB_Signal'] = ''
-    df.loc[df['close_price'] > df['bb_upper'], 'BB_Signal'] = '突破上軌'
-    df.loc[df['close_price'] < df['bb_lower'], 'BB_Signal'] = '突破下軌'
+def _mark(codes, col, cond, label):
+    """在 cond 成立的位置寫入 label 的代碼（後寫入者覆蓋先前的結果）"""
+    codes[np.asarray(cond, dtype=bool)] = label_code(col, label)
+
+
+class _Columns:
+    """df 欄位的 float64 NumPy 陣列與 shift(1) 陣列快取"""
+
+    def __init__(self, df):
+        self.df = df
+        self.n = len(df)
+        self._values = {}
+        self._lags = {}
+
+    def __getitem__(self, name):
+        values = self._values.get(name)
+        if values is None:
+            col = self.df[name]
+            if col.dtype == object:
+                # 資料庫 DECIMAL 欄位可能讀成 Decimal 物件
+                col = pd.to_numeric(col, errors='coerce')
+            values = col.to_numpy(dtype=float, na_value=np.nan)
+            self._values[name] = values
+        return values
+
+    def lag(self, name):
+        """相當於 df[name].shift(1)"""
+        lagged = self._lags.get(name)
+        if lagged is None:
+            values = self[name]
+            lagged = np.empty_like(values)
+            if self.n:
+                lagged[0] = np.nan
+                lagged[1:] = values[:-1]
+            self._lags[name] = lagged
+        return lagged
+
+    def codes(self):
+        return np.zeros(self.n, dtype=np.int8)
+
+
+def _rolling_extreme(values, window, func):
+    """rolling(window, min_periods=window) 的 min / max；視窗內有 NaN 即為 NaN"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        view = np.lib.stride_tricks.sliding_window_view(values, window)
+        out[window - 1:] = func(view, axis=1)
+    return out
+
+
+def _cross_codes(cols, col, fast, slow, up_label, down_label):
+    codes = cols.codes()
+    a, b = cols[fast], cols[slow]
+    pa, pb = cols.lag(fast), cols.lag(slow)
+    _mark(codes, col, (a > b) & (pa <= pb), up_label)
+    _mark(codes, col, (a < b) & (pa >= pb), down_label)
+    return codes
+
+
+def _ma_cross_codes(cols):
+    return _cross_codes(
+        cols, 'MA_Cross', 'ma5', 'ma20', '突破MA20', '跌破MA20'
+    )
+
+
+def _bollinger_codes(cols):
+    codes = cols.codes()
+    close = cols['close_price']
+    _mark(codes, 'BB_Signal', close > cols['bb_upper'], '突破上軌')
+    _mark(codes, 'BB_Signal', close < cols['bb_lower'], '突破下軌')
+    return codes
+
+
+def _macd_codes(cols):
+    return _cross_codes(
+        cols, 'MACD_Cross', 'dif', 'macd', '黃金交叉', '死亡交叉'
+    )
+
+
+def _trend_codes(cols):
+    return np.where(
+        cols['close_price'] > cols['ma20'],
+        label_code('Trend', '偏多'),
+        label_code('Trend', '偏空'),
+    ).astype(np.int8)
+
+
+def _macd_divergence_codes(cols, lookback=10):
+    codes = cols.codes()
+    close, dif = cols['close_price'], cols['dif']
+    price_shift, dif_shift = cols.lag('close_price'), cols.lag('dif')
+    price_min = _rolling_extreme(price_shift, lookback, np.min)
+    price_max = _rolling_extreme(price_shift, lookback, np.max)
+    macd_min = _rolling_extreme(dif_shift, lookback, np.min)
+    macd_max = _rolling_extreme(dif_shift, lookback, np.max)
+
+    cond_bottom = (close < price_min) & (dif > macd_min)
+    cond_top = (close > price_max) & (dif < macd_max)
+
+    _mark(codes, 'MACD_Div', cond_bottom, '底背離')
+    _mark(codes, 'MACD_Div', cond_top, '頂背離')
+    return codes
+
+
+def _anomaly_codes(cols, window=20, threshold=3):
+    close = cols['close_price']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = close / cols.lag('close_price') - 1
+    rolling = pd.Series(ret).rolling(window=window, min_periods=window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = (
+            (ret - rolling.mean().to_numpy()) / rolling.std().to_numpy()
+        )
+    zscore[~np.isfinite(zscore)] = 0
+    codes = cols.codes()
+    _mark(codes, 'Anomaly', np.abs(zscore) > threshold, 'Anomaly')
+    return codes
+
+
+def _rsi_codes(cols, rsi_col='rsi_14', overbought=70, oversold=30, near=5):
+    codes = cols.codes()
+    rsi = cols[rsi_col]
+    _mark(codes, 'RSI_Signal', rsi >= overbought, '超買')
+    _mark(codes, 'RSI_Signal', rsi <= oversold, '超賣')
+    _mark(
+        codes, 'RSI_Signal',
+        (rsi < overbought) & (rsi >= overbought - near),
+        '接近超買',
+    )
+    _mark(
+        codes, 'RSI_Signal',
+        (rsi > oversold) & (rsi <= oversold + near),
+        '接近超賣',
+    )
+    return codes
+
+
+def _kd_codes(cols, k_col='k_value', d_col='d_value'):
+    codes = _cross_codes(cols, 'KD_Signal', k_col, d_col, 'K上穿D', 'K下穿D')
+    k, d = cols[k_col], cols[d_col]
+    _mark(codes, 'KD_Signal', (k > 80) & (d > 80), 'KD超買')
+    _mark(codes, 'KD_Signal', (k < 20) & (d < 20), 'KD超賣')
+    return codes
+
+
+def _support_resistance_codes(cols):
+    codes = cols.codes()
+    close = cols['close_price']
+    _mark(
+        codes, 'SR_Signal', close >= cols['bb_upper'] * 0.98, '接近壓力位'
+    )
+    _mark(
+        codes, 'SR_Signal', close <= cols['bb_lower'] * 1.02, '接近支撐位'
+    )
+    return codes
+
+
+def _volume_anomaly_codes(cols, window=20, threshold=1.5):
+    volume = cols['volume']
+    vol_ma = pd.Series(volume).rolling(
+        window=window, min_periods=1
+    ).mean().to_numpy()
+    codes = cols.codes()
+    _mark(
+        codes, 'Volume_Anomaly', volume > vol_ma * threshold, '量能異常'
+    )
+    return codes
+
+
+def _ema_cross_codes(cols):
+    return _cross_codes(
+        cols, 'EMA_Cross', 'ema12', 'ema26', 'EMA黃金交叉', 'EMA死亡交叉'
+    )
+
+
+def _cci_codes(cols, cci_col='cci', overbought=100, oversold=-100):
+    codes = cols.codes()
+    cci, prev = cols[cci_col], cols.lag(cci_col)
+    _mark(codes, 'CCI_Signal', cci >= overbought, 'CCI超買')
+    _mark(codes, 'CCI_Signal', cci <= oversold, 'CCI超賣')
+    _mark(codes, 'CCI_Signal', (cci > 0) & (prev <= 0), 'CCI上穿零軸')
+    _mark(codes, 'CCI_Signal', (cci < 0) & (prev >= 0), 'CCI下穿零軸')
+    return codes
+
+
+def _willr_codes(cols, willr_col='willr', overbought=-20, oversold=-80):
+    codes = cols.codes()
+    willr = cols[willr_col]
+    _mark(codes, 'WILLR_Signal', willr >= overbought, 'WILLR超買')
+    _mark(codes, 'WILLR_Signal', willr <= oversold, 'WILLR超賣')
+    return codes
+
+
+def _momentum_codes(cols, mom_col='mom'):
+    codes = cols.codes()
+    mom, prev = cols[mom_col], cols.lag(mom_col)
+    _mark(codes, 'MOM_Signal', (mom > 0) & (prev <= 0), '動量轉正')
+    _mark(codes, 'MOM_Signal', (mom < 0) & (prev >= 0), '動量轉負')
+    return codes
+
+
+# 指標登錄表：name 供 --indicators 選擇；inputs 為計算核心讀取的欄位，
+# weight_keys 為其訊號在 SIGNAL_RULES 中對應的 SIGNAL_WEIGHTS 鍵
+# （空 tuple 表示不參與計分）。順序即完整流程的計算順序。
+Indicator = namedtuple(
+    'Indicator', ['name', 'column', 'kernel', 'inputs', 'weight_keys', 'display']
+)
+
+REGISTRY = (
+    Indicator('ma', 'MA_Cross', _ma_cross_codes,
+              ('ma5', 'ma20'), ('MA_Cross',), 'MA交叉'),
+    Indicator('bb', 'BB_Signal', _bollinger_codes,
+              ('close_price', 'bb_upper', 'bb_lower'), ('BB_Break',),
+              '布林通道'),
+    Indicator('macd', 'MACD_Cross', _macd_codes,
+              ('dif', 'macd'), ('MACD_Cross',), 'MACD交叉'),
+    Indicator('trend', 'Trend', _trend_codes,
+              ('close_price', 'ma20'), ('Trend',), '趨勢判斷'),
+    Indicator('macd_div', 'MACD_Div', _macd_divergence_codes,
+              ('close_price', 'dif'), ('MACD_Div',), 'MACD背離'),
+    Indicator('anomaly', 'Anomaly', _anomaly_codes,
+              ('close_price',), (), '異常偵測'),
+    Indicator('rsi', 'RSI_Signal', _rsi_codes,
+              ('rsi_14',), ('RSI_Oversold', 'RSI_Near'), 'RSI訊號'),
+    Indicator('kd', 'KD_Signal', _kd_codes,
+              ('k_value', 'd_value'), ('KD_Cross',), 'KD訊號'),
+    Indicator('sr', 'SR_Signal', _support_resistance_codes,
+              ('close_price', 'bb_upper', 'bb_lower'), (), '壓力支撐位'),
+    Indicator('volume', 'Volume_Anomaly', _volume_anomaly_codes,
+              ('volume',), ('Volume',), '成交量異常'),
+    Indicator('ema', 'EMA_Cross', _ema_cross_codes,
+              ('ema12', 'ema26'), ('EMA_Cross',), 'EMA交叉'),
+    Indicator('cci', 'CCI_Signal', _cci_codes,
+              ('cci',), ('CCI',), 'CCI訊號'),
+    Indicator('willr', 'WILLR_Signal', _willr_codes,
+              ('willr',), ('WILLR',), '威廉指標'),
+    Indicator('mom', 'MOM_Signal', _momentum_codes,
+              ('mom',), ('MOM',), '動量指標'),
+)
+
+# 特殊名稱：all 為全部指標，scoring 為所有參與計分的指標
+_GROUPS = {
+    'all': lambda entry: True,
+    'scoring': lambda entry: bool(entry.weight_keys),
+}
+
+
+def resolve_indicators(names=None):
+    """
+    將 --indicators 的值（逗號分隔字串或串列，可用 name 或輸出欄位名，
+    不分大小寫）解析為 REGISTRY 中的項目，依計算順序回傳。
+    names 為 None 或空值時回傳全部指標；未知名稱會拋出 ValueError。
+    """
+    if names is None:
+        return REGISTRY
+    if isinstance(names, str):
+        names = names.split(',')
+    wanted = [
+        n.name if isinstance(n, Indicator) else str(n).strip().lower()
+        for n in names
+    ]
+    wanted = [n for n in wanted if n]
+    if not wanted:
+        return REGISTRY
+    selected = set()
+    for name in wanted:
+        if name in _GROUPS:
+            selected.update(e.name for e in REGISTRY if _GROUPS[name](e))
+            continue
+        match = [
+            e for e in REGISTRY
+            if name in (e.name, e.column.lower())
+        ]
+        if not match:
+            available = ', '.join(e.name for e in REGISTRY)
+            raise ValueError(
+                f"未知的指標: {name}（可用: {available}, all, scoring）"
+            )
+        selected.add(match[0].name)
+    return tuple(e for e in REGISTRY if e.name in selected)
+
+
+def is_partial(indicators=None):
+    """
+    所選指標未涵蓋全部指標時為 True：Trade_Signal 與多空分數只由部分
+    規則計分，未選的訊號欄為空，不能覆蓋完整計算的訊號表。
+    """
+    return len(resolve_indicators(indicators)) < len(REGISTRY)
+
+
+def required_columns(indicators=None):
+    """回傳所選指標需要的輸入欄位（依首次出現順序）"""
+    columns = []
+    for entry in resolve_indicators(indicators):
+        for col in entry.inputs:
+            if col not in columns:
+                columns.append(col)
+    return columns
+
+
+def compute_signals(df, params=None, indicators=None, metrics=None):
+    """
+    計算所選指標的訊號欄位並寫入 df（就地新增欄位，不複製整張表）。
+
+    indicators 同 resolve_indicators 的參數，未選的指標完全不計算，
+    其欄位也不會出現在 df 中（計分時視為無訊號）。
+    params 可為 {輸出欄位: {參數名: 值}}，例如
+    {'RSI_Signal': {'overbought': 75}}，傳給對應的計算核心。
+    metrics 為 signals.metrics.StageMetrics 時，逐一記錄各指標的耗時
+    （階段名稱為 indicator:<名稱>）。
+    """
+    params = params or {}
+    cols = _Columns(df)
+    for entry in resolve_indicators(indicators):
+        if metrics is None:
+            codes = entry.kernel(cols, **params.get(entry.column, {}))
+        else:
+            with metrics.stage(f'indicator:{entry.name}', rows=cols.n):
+                codes = entry.kernel(cols, **params.get(entry.column, {}))
+        _set_codes(df, entry.column, codes)
     return df
 
 
+def ma_cross_signal(df):
+    return _set_codes(df, 'MA_Cross', _ma_cross_codes(_Columns(df)))
+
+
+def bollinger_signal(df):
+    return _set_codes(df, 'BB_Signal', _bollinger_codes(_Columns(df)))
+
+
 def macd_signal(df):
-    df['MACD_Cross'] = ''
-    cross_up = (df['dif'] > df['macd']) & (
-        df['dif'].shift(1) <= df['macd'].shift(1))
-    cross_down = (df['dif'] < df['macd']) & (
-        df['dif'].shift(1) >= df['macd'].shift(1))
-    df.loc[cross_up, 'MACD_Cross'] = '黃金交叉'
-    df.loc[cross_down, 'MACD_Cross'] = '死亡交叉'
-    return df
+    return _set_codes(df, 'MACD_Cross', _macd_codes(_Columns(df)))
 
 
 def trend_signal(df):
-    df['Trend'] = np.where(df['close_price'] > df['ma20'], '偏多', '偏空')
-    return df
+    return _set_codes(df, 'Trend', _trend_codes(_Columns(df)))
 
 
 def macd_divergence(df, lookback=10):
-    df = df.copy()
-    df['MACD_Div'] = ''
-    price_shift = df['close_price'].shift(1)
-    dif_shift = df['dif'].shift(1)
-    price_min = price_shift.rolling(
-        window=lookback, min_periods=lookback
-    ).min()
-    price_max = price_shift.rolling(
-        window=lookback, min_periods=lookback
-    ).max()
-    macd_min = dif_shift.rolling(
-        window=lookback, min_periods=lookback
-    ).min()
-    macd_max = dif_shift.rolling(
-        window=lookback, min_periods=lookback
-    ).max()
-
-    cond_bottom = (df['close_price'] < price_min) & (df['dif'] > macd_min)
-    cond_top = (df['close_price'] > price_max) & (df['dif'] < macd_max)
-
-    df.loc[cond_bottom, 'MACD_Div'] = '底背離'
-    df.loc[cond_top, 'MACD_Div'] = '頂背離'
-    return df
+    return _set_codes(
+        df, 'MACD_Div', _macd_divergence_codes(_Columns(df), lookback)
+    )
 
 
 def anomaly_detection(df, window=20, threshold=3):
-    df = df.copy()
-    df['Return'] = df['close_price'].pct_change()
-    roll_mean = df['Return'].rolling(window=window, min_periods=window).mean()
-    roll_std = df['Return'].rolling(window=window, min_periods=window).std()
-    df['ZScore'] = (df['Return'] - roll_mean) / roll_std
-    df['ZScore'] = df['ZScore'].replace([np.inf, -np.inf], np.nan).fillna(0)
-    df['Anomaly'] = np.where(abs(df['ZScore']) > threshold, 'Anomaly', '')
-    df.drop(columns=['Return', 'ZScore'], inplace=True, errors='ignore')
-    return df
+    return _set_codes(
+        df, 'Anomaly', _anomaly_codes(_Columns(df), window, threshold)
+    )
 
 
 def rsi_signal(df, rsi_col='rsi_14', overbought=70, oversold=30, near=5):
-    df['RSI_Signal'] = ''
-    df.loc[df[rsi_col] >= overbought, 'RSI_Signal'] = '超買'
-    df.loc[df[rsi_col] <= oversold, 'RSI_Signal'] = '超賣'
-    df.loc[
-        (df[rsi_col] < overbought) & (df[rsi_col] >= overbought - near),
-        'RSI_Signal'
-    ] = '接近超買'
-    df.loc[
-        (df[rsi_col] > oversold) & (df[rsi_col] <= oversold + near),
-        'RSI_Signal'
-    ] = '接近超賣'
-    return df
+    return _set_codes(df, 'RSI_Signal', _rsi_codes(
+        _Columns(df), rsi_col, overbought, oversold, near
+    ))
 
 
 def kd_signal(df, k_col='k_value', d_col='d_value'):
-    df['KD_Signal'] = ''
-    cross_up = (
-        (df[k_col] > df[d_col])
-        & (df[k_col].shift(1) <= df[d_col].shift(1))
-    )
-    cross_down = (
-        (df[k_col] < df[d_col])
-        & (df[k_col].shift(1) >= df[d_col].shift(1))
-    )
-    df.loc[cross_up, 'KD_Signal'] = 'K上穿D'
-    df.loc[cross_down, 'KD_Signal'] = 'K下穿D'
-    df.loc[(df[k_col] > 80) & (df[d_col] > 80), 'KD_Signal'] = 'KD超買'
-    df.loc[(df[k_col] < 20) & (df[d_col] < 20), 'KD_Signal'] = 'KD超賣'
-    return df
+    return _set_codes(df, 'KD_Signal', _kd_codes(_Columns(df), k_col, d_col))
 
 
 def support_resistance_signal(df):
-    df['SR_Signal'] = ''
-    df.loc[(df['close_price'] >= df['bb_upper'] * 0.98), 'SR_Signal'] = '接近壓力位'
-    df.loc[(df['close_price'] <= df['bb_lower'] * 1.02), 'SR_Signal'] = '接近支撐位'
-    return df
+    return _set_codes(
+        df, 'SR_Signal', _support_resistance_codes(_Columns(df))
+    )
 
 
 def volume_anomaly_signal(df, window=20, threshold=1.5):
-    df = df.copy()
-    vol_ma = df['volume'].rolling(window=window, min_periods=1).mean()
-    cond = df['volume'] > vol_ma * threshold
-    df['Volume_Anomaly'] = np.where(cond, '量能異常', '')
-    return df
+    return _set_codes(df, 'Volume_Anomaly', _volume_anomaly_codes(
+        _Columns(df), window, threshold
+    ))
 
 
 def ema_cross_signal(df):
-    df['EMA_Cross'] = ''
-    cross_up = (
-        (df['ema12'] > df['ema26'])
-        & (df['ema12'].shift(1) <= df['ema26'].shift(1))
-    )
-    cross_down = (
-        (df['ema12'] < df['ema26'])
-        & (df['ema12'].shift(1) >= df['ema26'].shift(1))
-    )
-    df.loc[cross_up, 'EMA_Cross'] = 'EMA黃金交叉'
-    df.loc[cross_down, 'EMA_Cross'] = 'EMA死亡交叉'
-    return df
+    return _set_codes(df, 'EMA_Cross', _ema_cross_codes(_Columns(df)))
 
 
 def cci_signal(df, cci_col='cci', overbought=100, oversold=-100):
-    df['CCI_Signal'] = ''
-    df.loc[df[cci_col] >= overbought, 'CCI_Signal'] = 'CCI超買'
-    df.loc[df[cci_col] <= oversold, 'CCI_Signal'] = 'CCI超賣'
-    cross_up = (df[cci_col] > 0) & (df[cci_col].shift(1) <= 0)
-    cross_down = (df[cci_col] < 0) & (df[cci_col].shift(1) >= 0)
-    df.loc[cross_up, 'CCI_Signal'] = 'CCI上穿零軸'
-    df.loc[cross_down, 'CCI_Signal'] = 'CCI下穿零軸'
-    return df
+    return _set_codes(df, 'CCI_Signal', _cci_codes(
+        _Columns(df), cci_col, overbought, oversold
+    ))
 
 
 def willr_signal(df, willr_col='willr', overbought=-20, oversold=-80):
-    df['WILLR_Signal'] = ''
-    df.loc[df[willr_col] >= overbought, 'WILLR_Signal'] = 'WILLR超買'
-    df.loc[df[willr_col] <= oversold, 'WILLR_Signal'] = 'WILLR超賣'
-    return df
+    return _set_codes(df, 'WILLR_Signal', _willr_codes(
+        _Columns(df), willr_col, overbought, oversold
+    ))
 
 
 def momentum_signal(df, mom_col='mom'):
-    df['MOM_Signal'] = ''
-    cross_up = (df[mom_col] > 0) & (df[mom_col].shift(1) <= 0)
-    cross_down = (df[mom_col] < 0) & (df[mom_col].shift(1) >= 0)
-    df.loc[cross_up, 'MOM_Signal'] = '動量轉正'
-    df.loc[cross_down, 'MOM_Signal'] = '動量轉負'
-    return df
+    return _set_codes(df, 'MOM_Signal', _momentum_codes(_Columns(df), mom_col))
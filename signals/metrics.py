@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""各階段的結構化效能指標：耗時、處理筆數、記憶體峰值
+
+每個 symbol 建立一個 StageMetrics，以 stage(名稱, rows) 包住讀取、
+指標計算、訊號生成、資料庫寫入、CSV 等階段；結果放在分析結果 dict 的
+'metrics' 欄，由呼叫端（main.py）統一輸出為 JSON-lines 與 Prometheus
+textfile 格式，平行模式下各 worker 不需共用檔案。
+
+tracemalloc 追蹤會拖慢計算，只在 enable_memory_tracing() 後才記錄
+Python 配置的記憶體峰值；行程 RSS 峰值則一律記錄（取不到時為 None）。
+"""
+
+import contextlib
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+_trace_memory = False
+
+
+def enable_memory_tracing():
+    """開始以 tracemalloc 追蹤各階段的 Python 記憶體峰值"""
+    global _trace_memory
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _trace_memory = True
+
+
+def peak_rss_bytes():
+    """目前行程的 RSS 峰值（bytes），無法取得時回傳 None"""
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 單位為 KB，macOS 為 bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except Exception:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', None) or info.rss
+    except Exception:
+        return None
+
+
+class StageMetrics:
+    """單一 symbol 各階段的耗時、筆數與記憶體峰值"""
+
+    def __init__(self, symbol=None, **labels):
+        self.symbol = symbol
+        self.labels = labels
+        self.stages = {}
+        self._peaks = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        量測一個階段；同名階段會累加（例如逐批寫入）。
+        rows 可於離開前以 yield 出的 dict 更新：
+            with m.stage('save') as s:
+                s['rows'] = len(df)
+        """
+        info = {'rows': rows}
+        tracing = _trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # 外層階段的峰值先記下，再重設以量測本階段
+            peak = tracemalloc.get_traced_memory()[1]
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            elapsed = time.perf_counter() - start
+            traced = None
+            if tracing:
+                traced = max(
+                    self._peaks.pop(), tracemalloc.get_traced_memory()[1]
+                )
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], traced)
+            self._record(name, elapsed, info.get('rows'), traced)
+
+    def timed(self, name):
+        """將函式包成一個階段的裝飾器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add(self, name, seconds, rows=None):
+        """記錄在 stage() 之外量測的階段（例如批次讀取中的等待時間）"""
+        self._record(name, seconds, rows, None)
+
+    def _record(self, name, seconds, rows, traced):
+        entry = self.stages.setdefault(
+            name, {'seconds': 0.0, 'rows': 0, 'calls': 0}
+        )
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        if rows is not None:
+            entry['rows'] += int(rows)
+        if traced is not None:
+            entry['py_peak_bytes'] = max(
+                entry.get('py_peak_bytes', 0), traced
+            )
+
+    def seconds(self, name):
+        return self.stages.get(name, {}).get('seconds', 0.0)
+
+    def as_dict(self):
+        stages = {}
+        for name, entry in self.stages.items():
+            entry = dict(entry)
+            entry['rows_per_sec'] = (
+                entry['rows'] / entry['seconds']
+                if entry['rows'] and entry['seconds'] > 0 else None
+            )
+            stages[name] = entry
+        return {
+            'symbol': self.symbol,
+            **self.labels,
+            'stages': stages,
+            'rss_peak_bytes': peak_rss_bytes(),
+        }
+
+
+def write_jsonl(results, path):
+    """將各 symbol 的結果（含 metrics）以 JSON-lines 附加寫入 path"""
+    ts = time.time()
+    with open(path, 'a', encoding='utf-8') as f:
+        for r in results:
+            metrics = r.get('metrics') or {}
+            line = {
+                'ts': ts,
+                'symbol': r.get('symbol'),
+                'status': r.get('status'),
+                'rows': r.get('rows', 0),
+                'total_seconds': r.get('total', 0.0),
+                **{
+                    k: v for k, v in metrics.items()
+                    if k not in ('symbol',)
+                },
+            }
+            f.write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
+
+
+def _prom_labels(**labels):
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def prometheus_text(results, prefix='trade_signals', **labels):
+    """
+    將多個 symbol 的結果彙總為 Prometheus text exposition 格式：
+    各階段的耗時總和 / 最大值、處理筆數、記憶體峰值與各狀態的 symbol 數。
+    """
+    totals = {}
+    maxima = {}
+    rows = {}
+    traced = {}
+    rss = None
+    status_counts = {}
+    for r in results:
+        status = r.get('status') or 'unknown'
+        status_counts[status] = status_counts.get(status, 0) + 1
+        metrics = r.get('metrics') or {}
+        for name, entry in (metrics.get('stages') or {}).items():
+            totals[name] = totals.get(name, 0.0) + entry['seconds']
+            maxima[name] = max(maxima.get(name, 0.0), entry['seconds'])
+            rows[name] = rows.get(name, 0) + entry.get('rows', 0)
+            if entry.get('py_peak_bytes') is not None:
+                traced[name] = max(traced.get(name, 0), entry['py_peak_bytes'])
+        if metrics.get('rss_peak_bytes') is not None:
+            rss = max(rss or 0, metrics['rss_peak_bytes'])
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {prefix}_{name} {help_text}')
+        lines.append(f'# TYPE {prefix}_{name} {kind}')
+        for sample_labels, value in samples:
+            lines.append(
+                f'{prefix}_{name}{_prom_labels(**labels, **sample_labels)} '
+                f'{value}'
+            )
+
+    metric('stage_seconds_total', 'gauge', 'Total wall time per stage', [
+        ({'stage': s}, f'{v:.6f}') for s, v in sorted(totals.items())
+    ])
+    metric('stage_seconds_max', 'gauge', 'Slowest symbol per stage', [
+        ({'stage': s}, f'{v:.6f}') for s, v in sorted(maxima.items())
+    ])
+    metric('stage_rows_total', 'gauge', 'Rows processed per stage', [
+        ({'stage': s}, v) for s, v in sorted(rows.items())
+    ])
+    if traced:
+        metric('stage_py_peak_bytes', 'gauge', 'tracemalloc peak per stage', [
+            ({'stage': s}, v) for s, v in sorted(traced.items())
+        ])
+    if rss is not None:
+        metric('rss_peak_bytes', 'gauge', 'Peak resident set size', [
+            ({}, rss),
+        ])
+    metric('symbols', 'gauge', 'Symbols by result status', [
+        ({'status': s}, v) for s, v in sorted(status_counts.items())
+    ])
+    metric('last_run_timestamp_seconds', 'gauge', 'Run finish time', [
+        ({}, f'{time.time():.3f}'),
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(results, path, **labels):
+    """以原子替換方式寫入 Prometheus textfile（供 node_exporter 收集）"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(results, **labels))
+    os.replace(tmp_path, path)
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""線上（逐根）訊號引擎：每根新 K 棒以 O(1) 更新各 symbol 的指標狀態
+
+規則與 signals.indicators / signals.trades 的批次計算完全相同，
+以歷史資料逐根重播時應得到與批次流程一致的結果。
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+from .config import SIGNAL_LABELS
+from .indicators import label_code
+from .trades import compile_signal_rules
+
+_NAN = float('nan')
+
+
+def _num(bar, key):
+    """取出 bar 中的數值欄位，缺值或 None 一律視為 NaN"""
+    value = bar.get(key) if hasattr(bar, 'get') else bar[key]
+    if value is None:
+        return _NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return _NAN
+
+
+def _cross(cur_a, cur_b, prev_a, prev_b):
+    """回傳 (上穿, 下穿)；任一值為 NaN 時比較結果為 False，與 pandas 相同"""
+    up = cur_a > cur_b and prev_a <= prev_b
+    down = cur_a < cur_b and prev_a >= prev_b
+    return up, down
+
+
+class _Window:
+    """固定長度的環狀緩衝區，記錄最近 n 個值"""
+
+    def __init__(self, size):
+        self.values = deque(maxlen=size)
+
+    def push(self, value):
+        self.values.append(value)
+
+    def full_valid(self):
+        """視窗已滿且沒有 NaN（對應 rolling(min_periods=window)）"""
+        return (
+            len(self.values) == self.values.maxlen
+            and not any(math.isnan(v) for v in self.values)
+        )
+
+
+class _SymbolState:
+    """單一 symbol 的指標狀態"""
+
+    def __init__(self, lookback=10, anomaly_window=20, volume_window=20):
+        self.prev = {}
+        self.prev_close = _NAN
+        # macd_divergence：前 lookback 根的收盤價與 dif
+        self.close_window = _Window(lookback)
+        self.dif_window = _Window(lookback)
+        # anomaly_detection：最近 anomaly_window 根的報酬率
+        self.return_window = _Window(anomaly_window)
+        # volume_anomaly_signal：最近 volume_window 根的成交量
+        self.volume_window = _Window(volume_window)
+        self.last_datetime = None
+        self.bars = 0
+
+    def prev_value(self, key):
+        return self.prev.get(key, _NAN)
+
+
+class OnlineSignalEngine:
+    """
+    逐根更新的訊號引擎。
+
+    每個 symbol 保留前一根的 ma5/ma20、dif/macd、ema12/26、k/d、cci、
+    mom，macd_divergence 用的前 10 根收盤價 / dif 環狀緩衝，以及
+    anomaly_detection 與 volume_anomaly_signal 的 20 根視窗；
+    update(bar) 只處理新的一根，回傳該根的訊號與多空分數。
+    參數預設值與 signals.indicators 各函式相同。
+    """
+
+    def __init__(
+        self,
+        min_signals=3,
+        scoring=None,
+        divergence_lookback=10,
+        anomaly_window=20,
+        anomaly_threshold=3,
+        volume_window=20,
+        volume_threshold=1.5,
+        rsi_overbought=70,
+        rsi_oversold=30,
+        rsi_near=5,
+    ):
+        self.min_signals = min_signals
+        self.scoring = scoring or compile_signal_rules()
+        self.divergence_lookback = divergence_lookback
+        self.anomaly_window = anomaly_window
+        self.anomaly_threshold = anomaly_threshold
+        self.volume_window = volume_window
+        self.volume_threshold = volume_threshold
+        self.rsi_overbought = rsi_overbought
+        self.rsi_oversold = rsi_oversold
+        self.rsi_near = rsi_near
+        self._states = {}
+
+    def state(self, symbol):
+        """取得（必要時建立）symbol 的狀態"""
+        state = self._states.get(symbol)
+        if state is None:
+            state = _SymbolState(
+                self.divergence_lookback,
+                self.anomaly_window,
+                self.volume_window,
+            )
+            self._states[symbol] = state
+        return state
+
+    def symbols(self):
+        return list(self._states)
+
+    def replay(self, df, symbol=None):
+        """以歷史資料逐根暖機，回傳每根的結果串列"""
+        return [
+            self.update(row, symbol=symbol)
+            for row in df.to_dict('records')
+        ]
+
+    def update(self, bar, symbol=None):
+        """
+        以一根新 K 棒更新狀態並回傳該根的訊號。
+
+        bar 為 dict（或 pandas Series），需包含 close_price、volume 與
+        ma5、ma20、bb_upper、bb_lower、dif、macd、ema12、ema26、rsi_14、
+        k_value、d_value、cci、willr、mom 等欄位。
+        """
+        symbol = symbol if symbol is not None else bar.get('symbol')
+        st = self.state(symbol)
+        v = {
+            key: _num(bar, key)
+            for key in (
+                'close_price', 'volume', 'ma5', 'ma20', 'bb_upper',
+                'bb_lower', 'dif', 'macd', 'ema12', 'ema26', 'rsi_14',
+                'k_value', 'd_value', 'cci', 'willr', 'mom',
+            )
+        }
+        codes = {}
+        close = v['close_price']
+
+        # MA 交叉
+        up, down = _cross(
+            v['ma5'], v['ma20'], st.prev_value('ma5'), st.prev_value('ma20')
+        )
+        codes['MA_Cross'] = self._pick('MA_Cross', [
+            (up, '突破MA20'), (down, '跌破MA20'),
+        ])
+
+        # 布林通道
+        codes['BB_Signal'] = self._pick('BB_Signal', [
+            (close > v['bb_upper'], '突破上軌'),
+            (close < v['bb_lower'], '突破下軌'),
+        ])
+
+        # MACD 交叉
+        up, down = _cross(
+            v['dif'], v['macd'], st.prev_value('dif'), st.prev_value('macd')
+        )
+        codes['MACD_Cross'] = self._pick('MACD_Cross', [
+            (up, '黃金交叉'), (down, '死亡交叉'),
+        ])
+
+        # 趨勢
+        codes['Trend'] = label_code(
+            'Trend', '偏多' if close > v['ma20'] else '偏空'
+        )
+
+        # MACD 背離：與前 lookback 根（不含本根）的最低 / 最高比較
+        bottom = top = False
+        if st.close_window.full_valid() and st.dif_window.full_valid():
+            closes = st.close_window.values
+            difs = st.dif_window.values
+            bottom = close < min(closes) and v['dif'] > min(difs)
+            top = close > max(closes) and v['dif'] < max(difs)
+        codes['MACD_Div'] = self._pick('MACD_Div', [
+            (bottom, '底背離'), (top, '頂背離'),
+        ])
+
+        # 報酬率異常（z-score）
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = float(np.float64(close) / st.prev_close - 1)
+        st.return_window.push(ret)
+        zscore = 0.0
+        if st.return_window.full_valid():
+            window = np.array(st.return_window.values)
+            std = window.std(ddof=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                zscore = (ret - window.mean()) / std
+            if not np.isfinite(zscore):
+                zscore = 0.0
+        codes['Anomaly'] = self._pick('Anomaly', [
+            (abs(zscore) > self.anomaly_threshold, 'Anomaly'),
+        ])
+
+        # RSI
+        rsi = v['rsi_14']
+        ob, os_, near = self.rsi_overbought, self.rsi_oversold, self.rsi_near
+        codes['RSI_Signal'] = self._pick('RSI_Signal', [
+            (rsi >= ob, '超買'),
+            (rsi <= os_, '超賣'),
+            (ob - near <= rsi < ob, '接近超買'),
+            (os_ < rsi <= os_ + near, '接近超賣'),
+        ])
+
+        # KD
+        k, d = v['k_value'], v['d_value']
+        up, down = _cross(k, d, st.prev_value('k'), st.prev_value('d'))
+        codes['KD_Signal'] = self._pick('KD_Signal', [
+            (up, 'K上穿D'),
+            (down, 'K下穿D'),
+            (k > 80 and d > 80, 'KD超買'),
+            (k < 20 and d < 20, 'KD超賣'),
+        ])
+
+        # 壓力支撐
+        codes['SR_Signal'] = self._pick('SR_Signal', [
+            (close >= v['bb_upper'] * 0.98, '接近壓力位'),
+            (close <= v['bb_lower'] * 1.02, '接近支撐位'),
+        ])
+
+        # 成交量異常：含本根在內最近 volume_window 根的平均（忽略 NaN）
+        st.volume_window.push(v['volume'])
+        valid = [x for x in st.volume_window.values if not math.isnan(x)]
+        vol_ma = sum(valid) / len(valid) if valid else _NAN
+        codes['Volume_Anomaly'] = self._pick('Volume_Anomaly', [
+            (v['volume'] > vol_ma * self.volume_threshold, '量能異常'),
+        ])
+
+        # EMA 交叉
+        up, down = _cross(
+            v['ema12'], v['ema26'],
+            st.prev_value('ema12'), st.prev_value('ema26'),
+        )
+        codes['EMA_Cross'] = self._pick('EMA_Cross', [
+            (up, 'EMA黃金交叉'), (down, 'EMA死亡交叉'),
+        ])
+
+        # CCI
+        cci, prev_cci = v['cci'], st.prev_value('cci')
+        codes['CCI_Signal'] = self._pick('CCI_Signal', [
+            (cci >= 100, 'CCI超買'),
+            (cci <= -100, 'CCI超賣'),
+            (cci > 0 and prev_cci <= 0, 'CCI上穿零軸'),
+            (cci < 0 and prev_cci >= 0, 'CCI下穿零軸'),
+        ])
+
+        # 威廉指標
+        codes['WILLR_Signal'] = self._pick('WILLR_Signal', [
+            (v['willr'] >= -20, 'WILLR超買'),
+            (v['willr'] <= -80, 'WILLR超賣'),
+        ])
+
+        # 動量
+        mom, prev_mom = v['mom'], st.prev_value('mom')
+        codes['MOM_Signal'] = self._pick('MOM_Signal', [
+            (mom > 0 and prev_mom <= 0, '動量轉正'),
+            (mom < 0 and prev_mom >= 0, '動量轉負'),
+        ])
+
+        # 更新狀態供下一根使用
+        st.close_window.push(close)
+        st.dif_window.push(v['dif'])
+        st.prev_close = close
+        st.prev = {
+            'ma5': v['ma5'], 'ma20': v['ma20'],
+            'dif': v['dif'], 'macd': v['macd'],
+            'ema12': v['ema12'], 'ema26': v['ema26'],
+            'k': k, 'd': d, 'cci': cci, 'mom': mom,
+        }
+        st.last_datetime = bar.get('datetime')
+        st.bars += 1
+
+        return self._result(symbol, bar, close, codes)
+
+    @staticmethod
+    def _pick(col, rules):
+        """依序套用規則，後成立者覆蓋先前結果，回傳代碼"""
+        code = 0
+        for cond, label in rules:
+            if cond:
+                code = label_code(col, label)
+        return code
+
+    def _result(self, symbol, bar, close, codes):
+        totals = {}
+        for side in ('buy', 'sell'):
+            total = 0.0
+            for col, table in self.scoring[side]:
+                total += table[codes[col]]
+            totals[side] = float(total)
+        buy, sell = totals['buy'], totals['sell']
+
+        min_signals = self.min_signals
+        trade = ''
+        if buy >= min_signals + 1:
+            trade = '強烈買入'
+        elif buy >= min_signals:
+            trade = '買入'
+        if sell >= min_signals + 1:
+            trade = '強烈賣出'
+        elif sell >= min_signals:
+            trade = '賣出'
+
+        if trade in ('買入', '強烈買入'):
+            strength = f'多頭{buy:.1f}分'
+        elif trade in ('賣出', '強烈賣出'):
+            strength = f'空頭{sell:.1f}分'
+        else:
+            strength = ''
+
+        row = {
+            'symbol': symbol,
+            'datetime': bar.get('datetime'),
+            'close_price': close,
+        }
+        for col, code in codes.items():
+            row[col] = SIGNAL_LABELS[col][code]
+        row.update({
+            'Buy_Signals': buy,
+            'Sell_Signals': sell,
+            'Trade_Signal': trade,
+            'Signal_Strength': strength,
+        })
+        return row
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""多商品平行分析：以行程池分派 symbol，並限制同時開啟的資料庫連線數"""
+
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import analyzer
+from . import db as dbmod
+from . import metrics as metricsmod
+
+
+def _init_worker(limiter, trace_memory=False):
+    """worker 行程初始化：套用共用的連線名額限制"""
+    dbmod.set_connection_limiter(limiter)
+    if trace_memory:
+        metricsmod.enable_memory_tracing()
+
+
+def _run_job(job):
+    """在 worker 中分析一批 symbol，任何例外都轉為失敗結果回傳"""
+    start = time.time()
+    try:
+        return analyzer.analyze_signals_for_symbols(**job)
+    except Exception as e:
+        traceback.print_exc()
+        output_paths = job.get('output_paths') or {}
+        return [
+            {
+                'symbol': symbol,
+                'status': 'error',
+                'error': str(e),
+                'total': time.time() - start,
+                'output': output_paths.get(symbol),
+            }
+            for symbol in job.get('symbols', [])
+        ]
+
+
+def chunk_symbols(symbols, workers, batch_size):
+    """將 symbol 切成批次：每批不超過 batch_size，且盡量讓每個 worker 都分到工作"""
+    if not symbols:
+        return []
+    per_worker = -(-len(symbols) // max(1, workers))
+    size = max(1, min(batch_size, per_worker))
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+
+def run_jobs_parallel(jobs, workers, max_connections=None, trace_memory=False):
+    """
+    以 ProcessPoolExecutor 平行執行多批分析工作。
+
+    jobs 為 analyze_signals_for_symbols 的關鍵字參數 dict 串列（每個 dict
+    代表一批 symbol）；max_connections 限制所有 worker 同時開啟的
+    MSSQL 連線數；trace_memory 為 True 時各 worker 以 tracemalloc 記錄
+    各階段記憶體峰值。回傳依 jobs 原始順序攤平的各 symbol 結果串列。
+    """
+    if max_connections is None or max_connections <= 0:
+        max_connections = workers
+    limiter = multiprocessing.BoundedSemaphore(max_connections)
+
+    total = sum(len(job.get('symbols', [])) for job in jobs)
+    batches = [None] * len(jobs)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(limiter, trace_memory),
+    ) as executor:
+        futures = {
+            executor.submit(_run_job, job): idx
+            for idx, job in enumerate(jobs)
+        }
+        done = 0
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                batches[idx] = future.result()
+            except Exception as e:
+                # worker 行程異常終止（例如 BrokenProcessPool）
+                batches[idx] = [
+                    {'symbol': symbol, 'status': 'error', 'error': str(e)}
+                    for symbol in jobs[idx].get('symbols', [])
+                ]
+            for r in batches[idx]:
+                done += 1
+                print(
+                    f"[{done}/{total}] {r.get('symbol')} {r.get('status')}"
+                )
+    return [r for batch in batches for r in batch]
+
+
+def print_results_table(results):
+    """輸出各 symbol 的階段耗時與成功/失敗彙整表"""
+    print("\n=== 執行結果彙整 ===")
+    header = (
+        f"{'symbol':<12}{'狀態':<12}{'筆數':>10}{'讀取':>9}{'計算':>9}"
+        f"{'訊號':>9}{'儲存':>9}{'總計':>9}"
+    )
+    print(header)
+    ok = 0
+    for r in results:
+        if r.get('status') == 'ok':
+            ok += 1
+        label = str(r.get('symbol'))
+        if r.get('timeframe'):
+            label = f"{label} {r['timeframe']}"
+        print(
+            f"{label:<12}{str(r.get('status')):<12}"
+            f"{r.get('rows', 0):>10,}"
+            f"{r.get('read', 0.0):>9.2f}{r.get('calc', 0.0):>9.2f}"
+            f"{r.get('signal', 0.0):>9.2f}{r.get('save', 0.0):>9.2f}"
+            f"{r.get('total', 0.0):>9.2f}"
+        )
+    failed = len(results) - ok
+    print(f"\n成功 {ok} 個，失敗 {failed} 個，共 {len(results)} 個 symbol")
+    for r in results:
+        if r.get('error'):
+            print(f"  {r.get('symbol')}: {r['error']}")
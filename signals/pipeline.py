@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""讀取 / 計算 / 寫入重疊執行的管線模式
+
+analyze_signals_for_symbols 對每個 symbol 依序讀取、計算、寫入，
+資料庫 I/O 時 CPU 閒置、計算時資料庫閒置。管線模式以有界佇列串起
+三種執行緒：
+- 讀取執行緒：預先讀取後續的 symbol（集合查詢或 keyset 分頁）
+- 計算執行緒（可多個）：計算指標、訊號並轉為輸出格式
+- 寫入執行緒：累積多個 symbol 的結果後一次 upsert，並寫出 CSV
+
+佇列已滿時上游會等待，記憶體中最多只有 queue_size 個 symbol 在排隊。
+資料庫 I/O 與 numpy / pandas 的運算大多會釋放 GIL，吞吐量接近最慢的
+一個階段，而非各階段耗時的總和。寫入執行緒在佇列沒有待寫資料或累積
+達 write_batch_rows 筆時寫入，計算較快時自然合併成較大的批次。
+"""
+
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from . import analyzer
+from .metrics import StageMetrics
+from .timeframes import TIMEFRAMES
+
+_DONE = object()
+
+
+def _put(q, item, stop):
+    """放入有界佇列；下游已停止時放棄，避免卡住"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_pipeline(
+    server,
+    database,
+    table,
+    user,
+    password,
+    symbols=None,
+    output_paths=None,
+    output_for_symbol=None,
+    batch_size=500,
+    page_size=50000,
+    incremental=False,
+    save_batch_size=10000,
+    cache_dir=None,
+    refresh=False,
+    compute_indicators=False,
+    indicators=None,
+    backend=None,
+    backtest=None,
+    timeframes=None,
+    compute_workers=1,
+    queue_size=8,
+    write_batch_rows=50000,
+    snapshot=None,
+):
+    """
+    以管線方式分析多個 symbol，回傳各 symbol（各時間週期）的結果串列。
+
+    symbols 為 None 時以 keyset 分頁串流整張資料表（同
+    analyze_signals_for_table，output_for_symbol 為 symbol -> 輸出路徑的
+    函式）；否則以集合查詢讀取（同 analyze_signals_for_symbols，
+    output_paths 為 symbol -> 輸出路徑的 dict）。其餘參數與兩者相同；
+    compute_workers 為計算執行緒數，queue_size 為各佇列的上限。
+    snapshot 為最新訊號快照，只在 upsert 成功後由寫入執行緒更新；
+    upsert 失敗時該批 symbol 標記為 error，不輸出檔案。
+    """
+    if backend is None:
+        backend = analyzer.MSSQLBackend(server, database, user, password)
+    output_paths = output_paths or {}
+    if output_for_symbol is None:
+        output_for_symbol = output_paths.get
+    compute_workers = max(1, int(compute_workers))
+
+    results = []
+    read_order = []
+    results_lock = threading.Lock()
+    stop = threading.Event()
+    read_q = queue.Queue(maxsize=max(1, queue_size))
+    write_q = queue.Queue(maxsize=max(1, queue_size))
+
+    def add_results(items):
+        with results_lock:
+            results.extend(items)
+
+    # --- 讀取 ---
+    watermarks = {}
+    pending = None
+    if symbols is not None:
+        pending = list(dict.fromkeys(str(s) for s in symbols))
+        if incremental:
+            try:
+                watermarks = backend.read_signal_watermarks(
+                    analyzer._signals_table_for(table, indicators), pending,
+                )
+            except Exception as e:
+                print(f"讀取水位線時發生錯誤，改為完整重算: {str(e)}")
+            print(
+                f"增量模式：{len(watermarks)}/{len(pending)} 個 symbol "
+                f"已有訊號紀錄"
+            )
+
+    def reader():
+        raw = analyzer._needs_raw(table, timeframes)
+        remaining = set(pending or ())
+        try:
+            if pending is None:
+                source = backend.iter_ohlcv(
+                    table, page_size=page_size,
+                    columns=analyzer._read_columns(
+                        compute_indicators, indicators, raw,
+                    ),
+                )
+            else:
+                source = analyzer._open_reader(
+                    backend, table, pending,
+                    batch_size=batch_size, since=watermarks,
+                    cache_dir=cache_dir, refresh=refresh,
+                    compute_indicators=compute_indicators,
+                    indicators=indicators, raw=raw,
+                )
+            while not stop.is_set():
+                start = time.time()
+                try:
+                    symbol, df = next(source)
+                except StopIteration:
+                    break
+                remaining.discard(symbol)
+                read_order.append(symbol)
+                if not _put(read_q, (symbol, df, time.time() - start), stop):
+                    break
+        except Exception as e:
+            status = analyzer._report_read_error(
+                e, server, database, table, user
+            )
+            failed = sorted(remaining) if pending is not None else [None]
+            add_results([
+                {
+                    'symbol': symbol,
+                    'status': status,
+                    'error': str(e),
+                    'output': output_for_symbol(symbol) if symbol else None,
+                }
+                for symbol in failed
+            ])
+        finally:
+            for _ in range(compute_workers):
+                read_q.put(_DONE)
+
+    # --- 計算 ---
+    def compute_one(symbol, df, read_time):
+        if df.empty:
+            print(f"找不到 symbol={symbol} 的資料，略過。")
+            return [], [{
+                'symbol': symbol,
+                'status': 'no_data',
+                'rows': 0,
+                'read': read_time,
+                'total': read_time,
+                'output': output_for_symbol(symbol),
+            }]
+        writes = []
+        finished = []
+        output_path = output_for_symbol(symbol)
+        for timeframe, tf_table, tf_df, tf_compute, resample_time in (
+            analyzer._timeframe_frames(
+                df, table, timeframes, compute_indicators
+            )
+        ):
+            start = time.time()
+            metrics = StageMetrics(symbol, database=database, table=tf_table)
+            result = {
+                'symbol': symbol,
+                'status': 'ok',
+                'rows': 0,
+                'read': 0.0,
+                'calc': 0.0,
+                'signal': 0.0,
+                'save': 0.0,
+                'total': 0.0,
+                'output': analyzer._timeframe_output(
+                    output_path, timeframe, table, indicators
+                ),
+            }
+            if timeframe is not None:
+                result['timeframe'] = timeframe
+            if not writes and not finished:
+                # 讀取耗時計入第一個時間週期
+                metrics.add('read', read_time, rows=len(df))
+                result['read'] = read_time
+                result['total'] = read_time
+            if resample_time:
+                metrics.add('resample', resample_time, rows=len(df))
+            try:
+                _, out_df = analyzer._compute_symbol(
+                    tf_df, result, metrics, symbol=symbol,
+                    incremental=incremental,
+                    since=watermarks.get(symbol),
+                    compute_indicators=tf_compute,
+                    indicators=indicators, backtest=backtest,
+                )
+            except Exception as e:
+                print(f"[錯誤] 分析 symbol={symbol} 時發生錯誤: {str(e)}")
+                result['status'] = 'error'
+                result['error'] = str(e)
+                out_df = None
+            result['total'] += time.time() - start
+            if out_df is None:
+                result['metrics'] = metrics.as_dict()
+                finished.append(result)
+            else:
+                writes.append((
+                    result, metrics, out_df,
+                    analyzer._signals_table_for(tf_table, indicators),
+                ))
+        return writes, finished
+
+    def computer():
+        try:
+            while True:
+                item = read_q.get()
+                if item is _DONE:
+                    break
+                if stop.is_set():
+                    # 下游已停止：只清空佇列，讓讀取執行緒能結束
+                    continue
+                writes, finished = compute_one(*item)
+                add_results(finished)
+                for write in writes:
+                    if not _put(write_q, write, stop):
+                        break
+        finally:
+            _put(write_q, _DONE, stop)
+
+    # --- 寫入 ---
+    def flush(batch):
+        """依目標表合併成一次 upsert，耗時依筆數分攤給各 symbol"""
+        by_table = {}
+        for item in batch:
+            by_table.setdefault(item[3], []).append(item)
+        for signals_table, items in by_table.items():
+            start = time.time()
+            frames = [out_df for _, _, out_df, _ in items]
+            total_rows = sum(len(f) for f in frames)
+            error = None
+            stats = {}
+            try:
+                combined = pd.concat(frames, ignore_index=True)
+                print(
+                    f"寫入 {len(items)} 個 symbol、{total_rows:,} 筆訊號"
+                    f"（目標表：{signals_table}）..."
+                )
+                # 寫入失敗時 save_signals 拋出例外，整批標記為錯誤，
+                # 不輸出檔案也不更新快照
+                stats = backend.save_signals(
+                    combined, signals_table, batch_size=save_batch_size,
+                )
+            except Exception as e:
+                print(f"[錯誤] 寫入 {signals_table} 時發生錯誤: {str(e)}")
+                error = str(e)
+            if error is None and snapshot is not None:
+                try:
+                    snapshot.update(combined, signals_table)
+                except Exception as e:
+                    # 快照檔寫入失敗不影響已寫入資料庫的結果
+                    print(f"[錯誤] 更新訊號快照時發生錯誤: {str(e)}")
+            elapsed = time.time() - start
+            for result, metrics, out_df, _ in items:
+                share = elapsed * len(out_df) / total_rows if total_rows else 0
+                metrics.add('save', share, rows=len(out_df))
+                result['save'] = share + metrics.seconds('format')
+                result['total'] += share
+                if error:
+                    result['status'] = 'error'
+                    result['error'] = error
+                else:
+                    result['save_rows_per_sec'] = stats.get('rows_per_sec', 0)
+                    if result['output']:
+                        start_csv = time.time()
+                        try:
+                            analyzer._write_output(
+                                out_df, result['output'],
+                                incremental and result['symbol'] in watermarks,
+                                metrics,
+                            )
+                        except Exception as e:
+                            print(
+                                f"[錯誤] 寫入 {result['output']} 時發生錯誤: "
+                                f"{str(e)}"
+                            )
+                            result['status'] = 'error'
+                            result['error'] = str(e)
+                        result['total'] += time.time() - start_csv
+                result['metrics'] = metrics.as_dict()
+            add_results([result for result, _, _, _ in items])
+
+    def writer():
+        active = compute_workers
+        batch = []
+        rows = 0
+        try:
+            while active:
+                item = write_q.get()
+                if item is _DONE:
+                    active -= 1
+                else:
+                    batch.append(item)
+                    rows += len(item[2])
+                if batch and (
+                    rows >= write_batch_rows or write_q.empty() or not active
+                ):
+                    flush(batch)
+                    batch = []
+                    rows = 0
+        except Exception:
+            stop.set()
+            raise
+
+    threads = [threading.Thread(target=reader, name='pipeline-reader')]
+    threads += [
+        threading.Thread(target=computer, name=f'pipeline-compute-{i}')
+        for i in range(compute_workers)
+    ]
+    threads.append(threading.Thread(target=writer, name='pipeline-writer'))
+    for t in threads:
+        t.daemon = True
+        t.start()
+    try:
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        raise
+
+    # 寫入批次會打亂完成順序，依讀取順序與時間週期排回
+    order = {symbol: i for i, symbol in enumerate(read_order)}
+    results.sort(key=lambda r: (
+        order.get(r.get('symbol'), len(order)),
+        TIMEFRAMES.index(r['timeframe']) if r.get('timeframe') else -1,
+    ))
+    return results
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""分析結果的檔案輸出：CSV，或依 table / symbol 分區的 Parquet / Feather 資料集
+
+CSV 為每個 symbol 一個 utf-8-sig 文字檔。Parquet / Feather 則寫成單一
+Hive 風格的分區資料集：
+
+    <root>/table=<資料表>/symbol=<symbol>/part-0.parquet
+
+欄位保留型別（datetime、float），訊號欄以 Categorical 寫入（字典編碼），
+並以 zstd 壓縮；下游以 pyarrow.dataset 或 pandas.read_parquet(<root>)
+讀取時可依 table / symbol 分區過濾，不需解析文字。分區鍵只存在目錄名稱，
+檔案本身不含 symbol 欄。
+
+輸出路徑一律以字串傳遞，格式由副檔名判斷（.parquet / .feather，其餘為
+CSV），因此多商品、平行與管線模式不需額外參數。
+"""
+
+import os
+import re
+from urllib.parse import quote
+
+import pandas as pd
+
+from .config import SIGNAL_LABELS
+
+FORMATS = ('csv', 'parquet', 'feather')
+COMPRESSION = 'zstd'
+
+_PART_RE = re.compile(r'^part-(\d+)\.(parquet|feather)$')
+
+
+def output_format(path):
+    """由輸出路徑的副檔名判斷格式"""
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    return ext if ext in ('parquet', 'feather') else 'csv'
+
+
+def dataset_path(root, table, symbol, fmt):
+    """資料集中 table / symbol 分區的第一個檔案路徑（分區值以 URI 編碼）"""
+    return os.path.join(
+        root,
+        f"table={quote(str(table), safe='')}",
+        f"symbol={quote(str(symbol), safe='')}",
+        f'part-0.{fmt}',
+    )
+
+
+def with_table(path, table):
+    """將資料集路徑的 table 分區換成 table（多時間週期用）"""
+    partition_dir = os.path.dirname(path)
+    table_dir = os.path.dirname(partition_dir)
+    return os.path.join(
+        os.path.dirname(table_dir),
+        f"table={quote(str(table), safe='')}",
+        os.path.basename(partition_dir),
+        os.path.basename(path),
+    )
+
+
+def _columnar_frame(df):
+    """轉為欄式格式用的 DataFrame：訊號欄轉回 Categorical，去掉分區鍵"""
+    out = df.drop(columns=['symbol'], errors='ignore')
+    for col in out.columns:
+        if col in SIGNAL_LABELS:
+            labels = SIGNAL_LABELS[col]
+            out[col] = pd.Categorical(
+                out[col].fillna(''), categories=labels
+            )
+        elif col == 'Signal_Strength' or out[col].dtype == object:
+            out[col] = out[col].astype('category')
+    return out.reset_index(drop=True)
+
+
+def _part_numbers(directory, fmt):
+    numbers = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = _PART_RE.match(name)
+            if match and match.group(2) == fmt:
+                numbers.append(int(match.group(1)))
+    return numbers
+
+
+def write_dataset_part(df, path, append=False):
+    """
+    寫入一個分區檔案。append 為 False 時取代分區內所有檔案（完整重算），
+    為 True 時新增下一個編號的 part 檔（增量模式），皆以原子替換寫入。
+    回傳實際寫入的檔案路徑。
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    fmt = output_format(path)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    existing = _part_numbers(directory, fmt)
+    number = max(existing) + 1 if append and existing else 0
+    target = os.path.join(directory, f'part-{number}.{fmt}')
+
+    table = pa.Table.from_pandas(_columnar_frame(df), preserve_index=False)
+    # 以 . 開頭的暫存檔不會被 pyarrow.dataset 當成資料檔讀取
+    tmp_path = os.path.join(directory, f'.part-{number}.{fmt}.tmp')
+    if fmt == 'parquet':
+        pq.write_table(table, tmp_path, compression=COMPRESSION)
+    else:
+        feather.write_feather(table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, target)
+
+    if not append:
+        for n in existing:
+            if n != number:
+                os.remove(os.path.join(directory, f'part-{n}.{fmt}'))
+    return target
+
+
+def write_csv(df, path, append=False):
+    """寫出 CSV；append 為 True 且檔案已存在時附加在既有檔案之後"""
+    if append and os.path.exists(path):
+        # 增量模式附加到既有 CSV 之後
+        df.to_csv(path, mode='a', header=False, index=False, encoding='utf-8')
+    else:
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+
+def write_output(df, path, append=False):
+    """依副檔名寫出 CSV 或資料集分區，回傳實際寫入的路徑"""
+    if output_format(path) == 'csv':
+        return write_csv(df, path, append)
+    return write_dataset_part(df, path, append)
+
+
+def load_dataset(root, fmt='parquet', table=None, symbols=None):
+    """
+    讀取分區資料集為 DataFrame（含 table、symbol 欄）。table / symbols
+    有值時只讀取符合的分區。
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+
+    # 分區值一律視為字串（避免 2330 之類的 symbol 被推斷為整數）
+    partitioning = pads.partitioning(
+        pa.schema([('table', pa.string()), ('symbol', pa.string())]),
+        flavor='hive',
+    )
+    dataset = pads.dataset(
+        root, format='ipc' if fmt == 'feather' else fmt,
+        partitioning=partitioning,
+    )
+    condition = None
+    if table is not None:
+        condition = pads.field('table') == table
+    if symbols is not None:
+        in_symbols = pads.field('symbol').isin([str(s) for s in symbols])
+        condition = in_symbols if condition is None else condition & in_symbols
+    return dataset.to_table(filter=condition).to_pandas()
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""最新訊號快照：每個 symbol 最後一根 K 棒的訊號，常駐記憶體並存成 JSON
+
+回答「哪些商品最後一根 K 棒出現強烈買入」不需再掃描 trade_signals_<週期>
+大表或逐一讀取 CSV。每個 symbol 分析完成（寫入資料庫後）即以該批結果
+的最後一列更新快照：
+
+    datetime, symbol, table, close_price, Trade_Signal, Signal_Strength,
+    Buy_Signals, Sell_Signals, signals（有訊號的指標欄位 -> 中文標籤）
+
+快照以 (訊號表, symbol) 為鍵，查詢只走訪一次所有 symbol（O(symbols)），
+不經過資料庫。JSON 檔以原子替換寫入，下次啟動時先載入，增量模式沒有
+新 K 棒的 symbol 仍保留上次的紀錄。
+
+serve_snapshot 以 http.server 提供本機 JSON 查詢端點：
+
+    GET /health                    快照筆數與更新時間
+    GET /signals?signal=強烈買入&sort=buy&limit=20
+    GET /signals/<symbol>          單一 symbol 各週期的最新訊號
+
+/signals 的查詢參數見 SignalSnapshot.query；指標欄位名稱（例如
+RSI_Signal=超賣）可直接作為過濾條件。也可單獨以
+python -m signals.snapshot <快照檔> 提供其他行程寫出的快照檔查詢。
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+
+from .config import SIGNAL_LABELS
+
+BUY_LABELS = ('買入', '強烈買入')
+SELL_LABELS = ('賣出', '強烈賣出')
+SIDES = {'buy': BUY_LABELS, 'sell': SELL_LABELS}
+
+# 構成 Trade_Signal 的各指標訊號欄位
+INDICATOR_COLUMNS = [c for c in SIGNAL_LABELS if c != 'Trade_Signal']
+
+# 排序鍵：名稱 -> (取值函式, 是否由大到小)
+SORT_KEYS = {
+    'buy': (lambda r: r['Buy_Signals'] or 0.0, True),
+    'sell': (lambda r: r['Sell_Signals'] or 0.0, True),
+    'net': (
+        lambda r: (r['Buy_Signals'] or 0.0) - (r['Sell_Signals'] or 0.0),
+        True,
+    ),
+    'datetime': (lambda r: r['datetime'] or '', True),
+    'symbol': (lambda r: r['symbol'], False),
+}
+
+
+def _iso(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, float):
+        value = datetime.fromtimestamp(value)
+    return pd.Timestamp(value).isoformat()
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _text(value):
+    return '' if value is None or pd.isna(value) else str(value)
+
+
+def latest_records(out_df, table):
+    """
+    由寫入資料庫的訊號表（format_signals_for_output 的結果）取出每個
+    symbol 最後一根 K 棒，轉為快照紀錄（dict）串列。
+    """
+    if out_df is None or out_df.empty:
+        return []
+    df = out_df.sort_values('datetime', kind='stable')
+    df = df.drop_duplicates('symbol', keep='last')
+    records = []
+    for row in df.to_dict('records'):
+        records.append({
+            'symbol': str(row['symbol']),
+            'table': table,
+            'datetime': _iso(row.get('datetime')),
+            'close_price': _number(row.get('close_price')),
+            'Trade_Signal': _text(row.get('Trade_Signal')),
+            'Signal_Strength': _text(row.get('Signal_Strength')),
+            'Buy_Signals': _number(row.get('Buy_Signals')),
+            'Sell_Signals': _number(row.get('Sell_Signals')),
+            'signals': {
+                col: _text(row.get(col)) for col in INDICATOR_COLUMNS
+                if _text(row.get(col))
+            },
+        })
+    return records
+
+
+def _split(value):
+    """查詢參數：None、字串（逗號分隔）或串列轉為標籤集合"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    values = {str(v).strip() for v in value if str(v).strip()}
+    return values or None
+
+
+class SignalSnapshot:
+    """
+    各 symbol 最新訊號的快照，可在多個執行緒間共用。
+
+    path 有值時啟動即載入既有的快照檔，update 後最多每 save_interval 秒
+    寫回一次（原子替換），close / save 時一定寫回。
+    """
+
+    def __init__(self, path=None, save_interval=1.0):
+        self.path = path
+        self.save_interval = float(save_interval)
+        self.updated_at = None
+        self._records = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self._mtime = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._records)
+
+    # --- 更新 ---
+
+    def update(self, out_df, table):
+        """以寫入 table 的訊號更新各 symbol 的最新紀錄，回傳更新的筆數"""
+        records = latest_records(out_df, table)
+        if not records:
+            return 0
+        updated = 0
+        with self._lock:
+            for record in records:
+                key = (record['table'], record['symbol'])
+                current = self._records.get(key)
+                # 較舊的資料（例如重算歷史區間）不覆蓋較新的紀錄
+                if current and (current['datetime'] or '') > (
+                    record['datetime'] or ''
+                ):
+                    continue
+                record['updated_at'] = _iso(time.time())
+                self._records[key] = record
+                updated += 1
+            if updated:
+                self.updated_at = _iso(time.time())
+                self._dirty = True
+        if updated and time.time() - self._saved_at >= self.save_interval:
+            self.save()
+        return updated
+
+    # --- 檔案 ---
+
+    def as_dict(self):
+        """目前所有紀錄（依訊號表、symbol 排序）與更新時間"""
+        with self._lock:
+            records = [self._records[k] for k in sorted(self._records)]
+            updated_at = self.updated_at
+        return {
+            'updated_at': updated_at,
+            'count': len(records),
+            'signals': records,
+        }
+
+    def save(self):
+        """以原子替換方式寫入快照檔（未設定路徑或沒有變更時略過）"""
+        if not self.path or not self._dirty:
+            return
+        data = self.as_dict()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._dirty = False
+            self._saved_at = time.time()
+            self._mtime = os.path.getmtime(self.path)
+
+    def load(self):
+        """由快照檔載入紀錄（取代記憶體中的內容）"""
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        records = {
+            (r['table'], r['symbol']): r for r in data.get('signals', [])
+        }
+        with self._lock:
+            self._records = records
+            self.updated_at = data.get('updated_at')
+            self._dirty = False
+            self._mtime = mtime
+
+    def reload_if_changed(self):
+        """快照檔由其他行程更新時重新載入，回傳是否重新載入"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        if os.path.getmtime(self.path) == self._mtime:
+            return False
+        self.load()
+        return True
+
+    def close(self):
+        self.save()
+
+    # --- 查詢 ---
+
+    def query(
+        self, table=None, symbols=None, signal=None, side=None,
+        min_buy=None, min_sell=None, since=None, latest=False,
+        indicators=None, sort=None, limit=None,
+    ):
+        """
+        過濾並排序快照紀錄，回傳 {'count', 'updated_at', 'signals'}，
+        count 為符合條件的總筆數（limit 之前）。
+
+        - table：訊號表名稱（例如 trade_signals_1d），未指定時為全部
+        - symbols / signal：symbol、Trade_Signal 標籤（串列或逗號分隔）
+        - side：'buy'（買入、強烈買入）或 'sell'（賣出、強烈賣出）
+        - min_buy / min_sell：Buy_Signals / Sell_Signals 下限
+        - since：只保留最後一根 K 棒不早於此時間的 symbol
+        - latest：只保留位於該訊號表最新一根 K 棒的 symbol（排除停止
+          更新的商品）
+        - indicators：指標欄位 -> 標籤（串列或逗號分隔）的過濾條件
+        - sort：buy / sell / net / datetime / symbol；未指定時賣出方向
+          依 Sell_Signals、其餘依 Buy_Signals 由大到小
+        """
+        if side is not None and side not in SIDES:
+            raise ValueError(f"side 必須為 buy 或 sell: {side}")
+        wanted_signals = _split(signal)
+        if side is not None:
+            side_labels = set(SIDES[side])
+            wanted_signals = (
+                side_labels if wanted_signals is None
+                else wanted_signals & side_labels
+            )
+        if sort is None:
+            sell_only = wanted_signals and wanted_signals <= set(SELL_LABELS)
+            sort = 'sell' if sell_only else 'buy'
+        if sort not in SORT_KEYS:
+            raise ValueError(
+                f"未知的排序鍵: {sort}（可用: {', '.join(SORT_KEYS)}）"
+            )
+        filters = {}
+        for col, labels in (indicators or {}).items():
+            if col not in INDICATOR_COLUMNS:
+                raise ValueError(f"未知的指標欄位: {col}")
+            filters[col] = _split(labels)
+        wanted_symbols = _split(symbols)
+        since = _iso(since) if since is not None else None
+
+        with self._lock:
+            records = list(self._records.values())
+            updated_at = self.updated_at
+        newest = {}
+        if latest:
+            for r in records:
+                if (r['datetime'] or '') > newest.get(r['table'], ''):
+                    newest[r['table']] = r['datetime'] or ''
+
+        matched = []
+        for r in records:
+            if table is not None and r['table'] != table:
+                continue
+            if wanted_symbols is not None and r['symbol'] not in wanted_symbols:
+                continue
+            if wanted_signals is not None and (
+                r['Trade_Signal'] not in wanted_signals
+            ):
+                continue
+            if min_buy is not None and (r['Buy_Signals'] or 0.0) < min_buy:
+                continue
+            if min_sell is not None and (r['Sell_Signals'] or 0.0) < min_sell:
+                continue
+            if since is not None and (r['datetime'] or '') < since:
+                continue
+            if latest and r['datetime'] != newest.get(r['table']):
+                continue
+            if any(
+                r['signals'].get(col, '') not in labels
+                for col, labels in filters.items() if labels
+            ):
+                continue
+            matched.append(r)
+
+        key, descending = SORT_KEYS[sort]
+        matched.sort(key=lambda r: r['symbol'])
+        matched.sort(key=key, reverse=descending)
+        count = len(matched)
+        if limit is not None:
+            matched = matched[:max(0, int(limit))]
+        return {'count': count, 'updated_at': updated_at, 'signals': matched}
+
+    def get(self, symbol):
+        """單一 symbol 各訊號表的最新紀錄"""
+        with self._lock:
+            return [
+                r for (_, s), r in sorted(self._records.items())
+                if s == str(symbol)
+            ]
+
+
+# --- HTTP 端點 ---
+
+_QUERY_PARAMS = ('table', 'symbols', 'signal', 'side', 'sort')
+_FLOAT_PARAMS = ('min_buy', 'min_sell')
+
+
+def _query_args(params):
+    """將 URL 查詢參數（parse_qs 的結果）轉為 SignalSnapshot.query 的參數"""
+    args = {}
+    indicators = {}
+    for name, values in params.items():
+        value = ','.join(values)
+        if name in _QUERY_PARAMS or name == 'since':
+            args[name] = value
+        elif name in _FLOAT_PARAMS:
+            args[name] = float(value)
+        elif name == 'limit':
+            args[name] = int(value)
+        elif name == 'latest':
+            args[name] = value.lower() in ('1', 'true', 'yes')
+        elif name in INDICATOR_COLUMNS:
+            indicators[name] = value
+        else:
+            raise ValueError(f"未知的查詢參數: {name}")
+    if indicators:
+        args['indicators'] = indicators
+    return args
+
+
+def _handler(snapshot, reload):
+    class SnapshotHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = url.path.rstrip('/')
+            try:
+                if reload:
+                    snapshot.reload_if_changed()
+                if path in ('', '/health'):
+                    self._send(200, {
+                        'status': 'ok',
+                        'count': len(snapshot),
+                        'updated_at': snapshot.updated_at,
+                    })
+                elif path == '/signals':
+                    self._send(200, snapshot.query(
+                        **_query_args(parse_qs(url.query))
+                    ))
+                elif path.startswith('/signals/'):
+                    symbol = unquote(path[len('/signals/'):])
+                    records = snapshot.get(symbol)
+                    if records:
+                        self._send(200, {'symbol': symbol, 'signals': records})
+                    else:
+                        self._send(404, {'error': f"找不到 symbol={symbol}"})
+                else:
+                    self._send(404, {'error': f"未知的路徑: {url.path}"})
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            # 查詢頻繁，不逐筆輸出存取紀錄
+            pass
+
+    return SnapshotHandler
+
+
+def serve_snapshot(snapshot, host='127.0.0.1', port=8765, reload=False):
+    """
+    於背景執行緒啟動 JSON 查詢端點，回傳 ThreadingHTTPServer；結束時
+    呼叫其 shutdown()。reload 為 True 時每次查詢前檢查快照檔是否已由
+    其他行程更新。
+    """
+    server = ThreadingHTTPServer((host, port), _handler(snapshot, reload))
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name='snapshot-http', daemon=True
+    )
+    thread.start()
+    print(f"訊號快照查詢端點: http://{host}:{server.server_address[1]}/signals")
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='提供訊號快照檔的 JSON 查詢端點')
+    parser.add_argument('path', help='快照檔（main.py --snapshot 寫出的 JSON）')
+    parser.add_argument('--host', default='127.0.0.1', help='監聽位址')
+    parser.add_argument('--port', type=int, default=8765, help='監聽埠號')
+    args = parser.parse_args(argv)
+
+    snapshot = SignalSnapshot(args.path)
+    server = serve_snapshot(snapshot, args.host, args.port, reload=True)
+    print(f"已載入 {len(snapshot)} 筆訊號，按 Ctrl+C 結束")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
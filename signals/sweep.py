@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""參數掃描：以回測指標比較不同的訊號權重、min_signals 與指標門檻
+
+資料只讀取一次，先以預設參數計算所有計分指標的訊號代碼並快取；
+每組參數只重做受影響的部分：
+- SIGNAL_WEIGHTS / min_signals：只以快取的代碼重新查表計分，
+  不重新計算任何指標
+- 指標門檻（例如 rsi 的 overbought）：只重新計算該指標的計算核心，
+  同一 worker 內相同的門檻組合只算一次
+
+參數組合依門檻分組後分派到行程池，各組以 backtest.summarize_arrays
+回測，再依指定的回測指標排序。
+
+掃描設定為 JSON，例如：
+    {
+        "weights": {"MA_Cross": [1.0, 1.5, 2.0], "RSI_Oversold": [1.2, 1.6]},
+        "min_signals": [2, 3, 4],
+        "params": {"rsi": {"overbought": [70, 75], "oversold": [25, 30]}}
+    }
+"""
+
+import inspect
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import backtest as btmod
+from . import indicators as ind
+from . import trades as tradesmod
+from .compute import RAW_COLUMNS, compute_base_indicators
+from .config import SIGNAL_WEIGHTS
+
+# 可用於排序的回測指標（皆為越大越好）
+METRICS = (
+    'mean_signed_return', 'hit_rate', 'final_equity', 'max_drawdown',
+)
+
+
+def load_grid(path):
+    """讀取掃描設定 JSON"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _kernel_params(entry):
+    """
+    計算核心可掃描的門檻參數；輸入欄位名稱（*_col）不可掃描，
+    掃描時只讀取預設的輸入欄位
+    """
+    return [
+        name for name in inspect.signature(entry.kernel).parameters
+        if name != 'cols' and not name.endswith('_col')
+    ]
+
+
+def expand_grid(grid, indicators=None):
+    """
+    將掃描設定展開為參數組合串列，每組為
+    {'weights': {鍵: 值}, 'min_signals': n, 'params': {指標名稱: {參數: 值}}}。
+    只列出有掃描的鍵；未知的權重鍵、指標或參數會拋出 ValueError。
+    不參與計分的指標（例如 anomaly）調整門檻不會改變結果，會略過並提示。
+    """
+    axes = []
+    for key, values in (grid.get('weights') or {}).items():
+        if key not in SIGNAL_WEIGHTS:
+            raise ValueError(
+                f"未知的權重鍵: {key}（可用: {', '.join(SIGNAL_WEIGHTS)}）"
+            )
+        axes.append((('weights', key), list(values)))
+
+    min_signals = grid.get('min_signals', [3])
+    if not isinstance(min_signals, list):
+        min_signals = [min_signals]
+    axes.append((('min_signals', None), min_signals))
+
+    selected = {e.name for e in ind.resolve_indicators(indicators)}
+    for name, params in (grid.get('params') or {}).items():
+        entry = ind.resolve_indicators([name])[0]
+        if not entry.weight_keys:
+            print(f"[提示] 指標 {entry.name} 不參與計分，略過其參數掃描")
+            continue
+        if entry.name not in selected:
+            raise ValueError(
+                f"指標 {entry.name} 不在 --indicators 所選範圍內"
+            )
+        allowed = _kernel_params(entry)
+        for param, values in params.items():
+            if param not in allowed:
+                raise ValueError(
+                    f"指標 {entry.name} 沒有參數 {param}"
+                    f"（可用: {', '.join(allowed) or '無'}）"
+                )
+            axes.append((('params', (entry.name, param)), list(values)))
+
+    combos = []
+    for values in itertools.product(*(v for _, v in axes)):
+        combo = {'weights': {}, 'min_signals': 3, 'params': {}}
+        for ((kind, key), value) in zip((a for a, _ in axes), values):
+            if kind == 'weights':
+                combo['weights'][key] = float(value)
+            elif kind == 'min_signals':
+                combo['min_signals'] = value
+            else:
+                combo['params'].setdefault(key[0], {})[key[1]] = value
+        combos.append(combo)
+    return combos
+
+
+def _scoring_indicators(indicators=None):
+    return [e for e in ind.resolve_indicators(indicators) if e.weight_keys]
+
+
+def load_frames(backend, table, symbols=None, compute_indicators=False,
+                indicators=None, batch_size=500, page_size=50000):
+    """
+    讀取掃描用的資料，回傳各 symbol 的 DataFrame 串列（依 symbol、datetime
+    排序）。只讀取所選計分指標需要的欄位；symbols 為 None 時讀取整張表。
+    """
+    selected = _scoring_indicators(indicators)
+    if compute_indicators:
+        columns = RAW_COLUMNS
+    else:
+        columns = ['symbol', 'datetime', 'close_price']
+        columns += [
+            c for c in ind.required_columns(selected) if c not in columns
+        ]
+    if symbols:
+        reader = backend.read_ohlcv_by_symbols(
+            table, symbols, batch_size=batch_size, columns=columns,
+        )
+    else:
+        reader = backend.iter_ohlcv(
+            table, page_size=page_size, columns=columns,
+        )
+
+    frames = []
+    for symbol, df in reader:
+        if df.empty:
+            continue
+        if compute_indicators:
+            df = compute_base_indicators(
+                df, columns=ind.required_columns(selected)
+            )
+        frames.append(df.reset_index(drop=True))
+    frames.sort(key=lambda df: str(df['symbol'].iloc[0]))
+    return frames
+
+
+def prepare_data(frames, indicators=None):
+    """
+    以預設參數計算所選計分指標的訊號代碼，並準備回測所需的欄位。
+    回傳 dict：frames（各 symbol 的輸入欄位，供重算門檻使用）、
+    codes（{訊號欄位: 全部 symbol 串接的代碼陣列}）、prepared。
+    """
+    selected = _scoring_indicators(indicators)
+    parts = {entry.column: [] for entry in selected}
+    for df in frames:
+        out = ind.compute_signals(df.copy(deep=False), indicators=selected)
+        for entry in selected:
+            parts[entry.column].append(out[entry.column].cat.codes.to_numpy())
+    codes = {
+        col: np.concatenate(values) if values else np.array([], dtype=np.int8)
+        for col, values in parts.items()
+    }
+    combined = pd.concat(
+        [df[['symbol', 'datetime', 'close_price']] for df in frames],
+        ignore_index=True,
+    )
+    return {
+        'frames': frames,
+        'codes': codes,
+        'prepared': btmod.prepare(combined),
+        'indicators': [e.name for e in selected],
+    }
+
+
+def _params_key(params):
+    return tuple(sorted(
+        (name, tuple(sorted(values.items())))
+        for name, values in params.items()
+    ))
+
+
+def _variant_codes(data, name, values, cache):
+    """以指定門檻重新計算單一指標的代碼（同一組門檻只算一次）"""
+    key = (name, tuple(sorted(values.items())))
+    if key not in cache:
+        entry = ind.resolve_indicators([name])[0]
+        parts = []
+        for df in data['frames']:
+            out = ind.compute_signals(
+                df.copy(deep=False),
+                params={entry.column: values}, indicators=[entry],
+            )
+            parts.append(out[entry.column].cat.codes.to_numpy())
+        cache[key] = (entry.column, np.concatenate(parts))
+    return cache[key]
+
+
+def evaluate(result, horizon):
+    """由 backtest.combine 的結果計算排序用的回測指標"""
+    summary = result['summary']
+    equity = result['equity']
+    metrics = {
+        'signals': 0,
+        'mean_signed_return': np.nan,
+        'hit_rate': np.nan,
+        'final_equity': np.nan,
+        'max_drawdown': np.nan,
+    }
+    if summary.empty:
+        return metrics
+    try:
+        part = summary.loc[(horizon, 'signal')]
+    except KeyError:
+        part = summary.iloc[0:0]
+    part = part[part.index != btmod._NO_SIGNAL]
+    count = part['count'].sum()
+    if count > 0:
+        metrics['signals'] = int(count)
+        metrics['mean_signed_return'] = float(
+            (part['mean_signed_return'] * part['count']).sum() / count
+        )
+        metrics['hit_rate'] = float(
+            (part['hit_rate'] * part['count']).sum() / count
+        )
+    curve = equity[equity['horizon'] == horizon]['equity']
+    if not curve.empty:
+        metrics['final_equity'] = float(curve.iloc[-1])
+        metrics['max_drawdown'] = float((curve / curve.cummax() - 1).min())
+    return metrics
+
+
+def _evaluate_combo(data, combo, horizon, cache):
+    codes = dict(data['codes'])
+    for name, values in combo['params'].items():
+        column, variant = _variant_codes(data, name, values, cache)
+        codes[column] = variant
+    weights = {**SIGNAL_WEIGHTS, **combo['weights']}
+    scoring = tradesmod.compile_signal_rules(weights=weights)
+    n = len(data['prepared'].close)
+    buy, sell = tradesmod.score_codes(codes, n, scoring)
+    trade = tradesmod.trade_signal_codes(buy, sell, combo['min_signals'])
+    # 代碼依輸入列順序計算；與 backtest.summarize 相同，先套用 symbol/時間排序
+    order = data['prepared'].order
+    if order is not None:
+        trade, buy, sell = trade[order], buy[order], sell[order]
+    result = btmod.combine([
+        btmod.summarize_arrays(data['prepared'], trade, buy, sell, [horizon])
+    ])
+    return evaluate(result, horizon)
+
+
+# worker 行程共用的資料（由 initializer 設定，避免每個工作重複傳遞）
+_worker_data = None
+_worker_cache = {}
+
+
+def _init_worker(data):
+    global _worker_data, _worker_cache
+    _worker_data = data
+    _worker_cache = {}
+
+
+def _run_chunk(args):
+    combos, horizon = args
+    return [
+        _evaluate_combo(_worker_data, combo, horizon, _worker_cache)
+        for combo in combos
+    ]
+
+
+def _chunk_combos(combos, workers):
+    """依門檻分組（同組共用重算的指標），再切成大致平均的批次"""
+    groups = {}
+    for idx, combo in enumerate(combos):
+        groups.setdefault(_params_key(combo['params']), []).append(idx)
+    size = max(1, -(-len(combos) // (max(1, workers) * 4)))
+    chunks = []
+    for indices in groups.values():
+        for i in range(0, len(indices), size):
+            chunks.append(indices[i:i + size])
+    return chunks
+
+
+def run_sweep(data, combos, horizon=5, workers=1):
+    """
+    回測每組參數，回傳與 combos 同順序的回測指標 dict 串列。
+    workers > 1 時以 ProcessPoolExecutor 平行執行。
+    """
+    chunks = _chunk_combos(combos, workers)
+    results = [None] * len(combos)
+    done = 0
+    if workers <= 1:
+        cache = {}
+        for chunk in chunks:
+            for idx in chunk:
+                results[idx] = _evaluate_combo(
+                    data, combos[idx], horizon, cache
+                )
+            done += len(chunk)
+            print(f"[{done}/{len(combos)}] 組參數已完成")
+        return results
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(data,),
+    ) as executor:
+        tasks = [([combos[i] for i in chunk], horizon) for chunk in chunks]
+        for chunk, metrics in zip(chunks, executor.map(_run_chunk, tasks)):
+            for idx, value in zip(chunk, metrics):
+                results[idx] = value
+            done += len(chunk)
+            print(f"[{done}/{len(combos)}] 組參數已完成")
+    return results
+
+
+def _check_metric(metric):
+    if metric not in METRICS:
+        raise ValueError(
+            f"未知的排序指標: {metric}（可用: {', '.join(METRICS)}）"
+        )
+
+
+def rank_results(combos, results, metric='mean_signed_return'):
+    """將參數組合與回測指標整理為依 metric 由大到小排序的 DataFrame"""
+    _check_metric(metric)
+    rows = []
+    for combo, metrics in zip(combos, results):
+        row = {'min_signals': combo['min_signals']}
+        for key, value in combo['weights'].items():
+            row[f'weight:{key}'] = value
+        for name, values in combo['params'].items():
+            for param, value in values.items():
+                row[f'{name}.{param}'] = value
+        row.update(metrics)
+        rows.append(row)
+    ranked = pd.DataFrame(rows).sort_values(
+        metric, ascending=False, na_position='last', kind='stable'
+    ).reset_index(drop=True)
+    ranked.index = ranked.index + 1
+    ranked.index.name = 'rank'
+    return ranked
+
+
+def sweep(backend, table, grid, symbols=None, horizon=5,
+          metric='mean_signed_return', workers=1, compute_indicators=False,
+          indicators=None, batch_size=500, page_size=50000):
+    """讀取資料一次並掃描 grid 中的所有參數組合，回傳排序後的 DataFrame"""
+    combos = expand_grid(grid, indicators)
+    _check_metric(metric)
+    print(
+        f"參數掃描：共 {len(combos)} 組參數，"
+        f"依 {horizon} 根後報酬的 {metric} 排序"
+    )
+
+    start = time.time()
+    frames = load_frames(
+        backend, table, symbols, compute_indicators=compute_indicators,
+        indicators=indicators, batch_size=batch_size, page_size=page_size,
+    )
+    rows = sum(len(df) for df in frames)
+    print(
+        f"讀取 {len(frames)} 個 symbol、{rows:,} 筆資料，"
+        f"耗時 {time.time() - start:.2f} 秒"
+    )
+    if not frames:
+        print("沒有資料可掃描。")
+        return pd.DataFrame()
+
+    start = time.time()
+    data = prepare_data(frames, indicators)
+    print(f"預設參數指標計算完成，耗時 {time.time() - start:.2f} 秒")
+
+    start = time.time()
+    results = run_sweep(data, combos, horizon=horizon, workers=workers)
+    print(f"參數掃描完成，耗時 {time.time() - start:.2f} 秒")
+    return rank_results(combos, results, metric)
+
+
+def print_sweep_report(ranked, top=10):
+    print("\n=== 參數掃描結果 ===")
+    if ranked is None or ranked.empty:
+        print("沒有結果")
+        return
+    with pd.option_context(
+        'display.max_columns', None, 'display.width', 200,
+        'display.float_format', '{:.6g}'.format,
+    ):
+        print(ranked.head(top).to_string())
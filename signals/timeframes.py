@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""由最細的 K 棒（例如 1h）在本機合成較粗的時間週期（1d、1w）
+
+同一 symbol 的資料只讀取一次，依時間週期分桶後以 numpy reduceat
+一次算出各桶的開高低收與成交量，不逐桶跑 Python 迴圈：
+- open：桶內第一根的開盤價
+- high / low：桶內最高 / 最低價
+- close：桶內最後一根的收盤價
+- volume：桶內成交量加總
+
+日線以日曆日分桶，週線以週一為起點；K 棒的 datetime 為該桶的起始時間
+（與 stock_data_1d 的日期相同）。最後一桶可能尚未收完（例如當日盤中），
+與資料表一樣依現有資料計算，之後重跑時以 upsert 覆寫。
+"""
+
+import numpy as np
+import pandas as pd
+
+from .compute import RAW_COLUMNS
+
+# 支援的時間週期，依粒度由細到粗排列
+TIMEFRAMES = ('1h', '1d', '1w')
+
+
+def parse_timeframes(value):
+    """解析逗號分隔的時間週期字串，依粒度排序；未知週期拋出 ValueError"""
+    if isinstance(value, str):
+        value = value.split(',')
+    names = [str(v).strip().lower() for v in value if str(v).strip()]
+    unknown = [n for n in names if n not in TIMEFRAMES]
+    if unknown:
+        raise ValueError(
+            f"未知的時間週期: {', '.join(unknown)}"
+            f"（可用: {', '.join(TIMEFRAMES)}）"
+        )
+    return [tf for tf in TIMEFRAMES if tf in names]
+
+
+def table_timeframe(table):
+    """由資料表名稱（例如 stock_data_1h）取得其時間週期，無法判斷時回傳 None"""
+    base = table.split('.')[-1].replace('[', '').replace(']', '')
+    suffix = base.rsplit('_', 1)[-1].lower()
+    return suffix if suffix in TIMEFRAMES else None
+
+
+def timeframe_table(table, timeframe):
+    """將資料表名稱的週期後綴換成 timeframe（stock_data_1h -> stock_data_1d）"""
+    prefix, sep, _ = table.rpartition('_')
+    return f'{prefix}{sep}{timeframe}' if sep else f'{table}_{timeframe}'
+
+
+def _bucket_keys(times, timeframe):
+    """各 K 棒所屬時間桶的起始時間（datetime64[ns]）"""
+    if timeframe == '1h':
+        return times.astype('datetime64[h]').astype('datetime64[ns]')
+    days = times.astype('datetime64[D]')
+    if timeframe == '1w':
+        # 1970-01-01 為週四，+3 後取 7 的餘數即為距離週一的天數
+        weekday = (days.astype(np.int64) + 3) % 7
+        days = days - weekday.astype('timedelta64[D]')
+    return days.astype('datetime64[ns]')
+
+
+def resample_ohlcv(df, timeframe):
+    """
+    將單一 symbol、依 datetime 排序的 OHLCV 合成為 timeframe 週期的 K 棒，
+    回傳只含 RAW_COLUMNS 的新 DataFrame（指標需另以 compute_base_indicators
+    計算）。
+    """
+    if df.empty:
+        return pd.DataFrame(columns=RAW_COLUMNS)
+    times = pd.to_datetime(df['datetime']).to_numpy()
+    keys = _bucket_keys(times, timeframe)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+
+    def values(col):
+        return pd.to_numeric(df[col], errors='coerce').to_numpy(
+            dtype=float, na_value=np.nan
+        )
+
+    high = values('high_price')
+    low = values('low_price')
+    volume = np.nan_to_num(values('volume'))
+    return pd.DataFrame({
+        'symbol': df['symbol'].iloc[0],
+        'datetime': keys[starts],
+        'open_price': values('open_price')[starts],
+        'high_price': np.fmax.reduceat(high, starts),
+        'low_price': np.fmin.reduceat(low, starts),
+        'close_price': values('close_price')[ends],
+        'volume': np.add.reduceat(volume, starts),
+    }, columns=RAW_COLUMNS)
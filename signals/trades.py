@@ -1,77 +1,143 @@
 # -*- coding: utf-8 -*-
 """買賣訊號彙整與分析報告"""
 
-from .config import SIGNAL_WEIGHTS
-
-
-def generate_trade_signals(df, min_signals=3):
-    df['Buy_Signals'] = 0.0
-    df['Sell_Signals'] = 0.0
-
-    buy_conditions = [
-        (df['MA_Cross'] == '突破MA20', SIGNAL_WEIGHTS['MA_Cross']),
-        (df['MACD_Cross'] == '黃金交叉', SIGNAL_WEIGHTS['MACD_Cross']),
-        (df['EMA_Cross'] == 'EMA黃金交叉', SIGNAL_WEIGHTS['EMA_Cross']),
-        (df['KD_Signal'] == 'K上穿D', SIGNAL_WEIGHTS['KD_Cross']),
-        (df['RSI_Signal'] == '超賣', SIGNAL_WEIGHTS['RSI_Oversold']),
-        (df['RSI_Signal'] == '接近超賣', SIGNAL_WEIGHTS['RSI_Near']),
-        (df['BB_Signal'] == '突破下軌', SIGNAL_WEIGHTS['BB_Break']),
-        (df['MACD_Div'] == '底背離', SIGNAL_WEIGHTS['MACD_Div']),
-        (df['Trend'] == '偏多', SIGNAL_WEIGHTS['Trend']),
-        (df['Volume_Anomaly'] == '量能異常', SIGNAL_WEIGHTS['Volume']),
-        (df['CCI_Signal'] == 'CCI超賣', SIGNAL_WEIGHTS['CCI']),
-        (df['CCI_Signal'] == 'CCI上穿零軸', SIGNAL_WEIGHTS['CCI']),
-        (df['WILLR_Signal'] == 'WILLR超賣', SIGNAL_WEIGHTS['WILLR']),
-        (df['MOM_Signal'] == '動量轉正', SIGNAL_WEIGHTS['MOM']),
-        (df['KD_Signal'] == 'KD超賣', SIGNAL_WEIGHTS['KD_Cross'])
-    ]
-
-    for condition, weight in buy_conditions:
-        df.loc[condition, 'Buy_Signals'] += weight
-
-    sell_conditions = [
-        (df['MA_Cross'] == '跌破MA20', SIGNAL_WEIGHTS['MA_Cross']),
-        (df['MACD_Cross'] == '死亡交叉', SIGNAL_WEIGHTS['MACD_Cross']),
-        (df['EMA_Cross'] == 'EMA死亡交叉', SIGNAL_WEIGHTS['EMA_Cross']),
-        (df['KD_Signal'] == 'K下穿D', SIGNAL_WEIGHTS['KD_Cross']),
-        (df['RSI_Signal'] == '超買', SIGNAL_WEIGHTS['RSI_Oversold']),
-        (df['RSI_Signal'] == '接近超買', SIGNAL_WEIGHTS['RSI_Near']),
-        (df['BB_Signal'] == '突破上軌', SIGNAL_WEIGHTS['BB_Break']),
-        (df['MACD_Div'] == '頂背離', SIGNAL_WEIGHTS['MACD_Div']),
-        (df['Trend'] == '偏空', SIGNAL_WEIGHTS['Trend']),
-        (df['KD_Signal'] == 'KD超買', SIGNAL_WEIGHTS['KD_Cross']),
-        (df['CCI_Signal'] == 'CCI超買', SIGNAL_WEIGHTS['CCI']),
-        (df['CCI_Signal'] == 'CCI下穿零軸', SIGNAL_WEIGHTS['CCI']),
-        (df['WILLR_Signal'] == 'WILLR超買', SIGNAL_WEIGHTS['WILLR']),
-        (df['MOM_Signal'] == '動量轉負', SIGNAL_WEIGHTS['MOM'])
-    ]
-
-    for condition, weight in sell_conditions:
-        df.loc[condition, 'Sell_Signals'] += weight
-
-    df['Trade_Signal'] = ''
-    df['Signal_Strength'] = ''
-
-    strong_buy = df['Buy_Signals'] >= min_signals + 1
-    buy = (df['Buy_Signals'] >= min_signals) & (~strong_buy)
-    strong_sell = df['Sell_Signals'] >= min_signals + 1
-    sell = (df['Sell_Signals'] >= min_signals) & (~strong_sell)
-
-    df.loc[strong_buy, 'Trade_Signal'] = '強烈買入'
-    df.loc[buy, 'Trade_Signal'] = '買入'
-    df.loc[strong_sell, 'Trade_Signal'] = '強烈賣出'
-    df.loc[sell, 'Trade_Signal'] = '賣出'
-
-    df.loc[df['Trade_Signal'].isin(['買入', '強烈買入']), 'Signal_Strength'] = (
-        '多頭' + df.loc[df['Trade_Signal'].isin(['買入', '強烈買入']), 'Buy_Signals']
-        .map(lambda v: f'{v:.1f}分')
+import numpy as np
+import pandas as pd
+
+from .config import SIGNAL_LABELS, SIGNAL_RULES, SIGNAL_WEIGHTS
+from .indicators import label_code
+
+
+def compile_signal_rules(rules=None, weights=None):
+    """
+    將 SIGNAL_RULES 編譯為計分查表。
+
+    回傳 {'buy': [(欄位, 權重表), ...], 'sell': [...]}，權重表為以訊號
+    代碼為索引的 float 陣列。同一欄位連續的規則合併為一步；被其他欄位
+    隔開時另起一步，使每列分數的累加順序與規則順序完全一致。
+    """
+    rules = SIGNAL_RULES if rules is None else rules
+    weights = SIGNAL_WEIGHTS if weights is None else weights
+    compiled = {'buy': [], 'sell': []}
+    for col, label, side, key in rules:
+        steps = compiled[side]
+        if not steps or steps[-1][0] != col:
+            steps.append((col, np.zeros(len(SIGNAL_LABELS[col]))))
+        steps[-1][1][label_code(col, label)] += weights[key]
+    return compiled
+
+
+_default_scoring = None
+
+
+def _get_default_scoring():
+    global _default_scoring
+    if _default_scoring is None:
+        _default_scoring = compile_signal_rules()
+    return _default_scoring
+
+
+def score_codes(codes, n, scoring=None):
+    """
+    以代碼查表加總多頭 / 空頭分數，回傳 (buy, sell) 兩個 float 陣列。
+    codes 為 {訊號欄位: int 代碼陣列}，缺少的欄位（未計算的指標）視為無訊號。
+    """
+    scoring = scoring or _get_default_scoring()
+    totals = {}
+    for side in ('buy', 'sell'):
+        total = np.zeros(n)
+        for col, table in scoring[side]:
+            if col not in codes:
+                continue
+            total += table[codes[col]]
+        totals[side] = total
+    return totals['buy'], totals['sell']
+
+
+def score_signals(df, scoring=None):
+    """以代碼查表加總多頭 / 空頭分數，回傳 (buy, sell) 兩個 float 陣列"""
+    scoring = scoring or _get_default_scoring()
+    codes = {}
+    for steps in scoring.values():
+        for col, _ in steps:
+            if col not in codes and col in df.columns:
+                codes[col] = df[col].cat.codes.to_numpy()
+    return score_codes(codes, len(df), scoring)
+
+
+def trade_signal_codes(buy_scores, sell_scores, min_signals=3):
+    """由多頭 / 空頭分數判斷 Trade_Signal，回傳 int8 代碼陣列"""
+    buy_scores = np.asarray(buy_scores)
+    sell_scores = np.asarray(sell_scores)
+    strong_buy = buy_scores >= min_signals + 1
+    buy = (buy_scores >= min_signals) & (~strong_buy)
+    strong_sell = sell_scores >= min_signals + 1
+    sell = (sell_scores >= min_signals) & (~strong_sell)
+
+    codes = np.zeros(len(buy_scores), dtype=np.int8)
+    codes[strong_buy] = label_code('Trade_Signal', '強烈買入')
+    codes[buy] = label_code('Trade_Signal', '買入')
+    codes[strong_sell] = label_code('Trade_Signal', '強烈賣出')
+    codes[sell] = label_code('Trade_Signal', '賣出')
+    return codes
+
+
+def generate_trade_signals(df, min_signals=3, scoring=None):
+    buy_scores, sell_scores = score_signals(df, scoring)
+    df['Buy_Signals'] = buy_scores
+    df['Sell_Signals'] = sell_scores
+    codes = trade_signal_codes(buy_scores, sell_scores, min_signals)
+    df['Trade_Signal'] = pd.Categorical.from_codes(
+        codes, categories=SIGNAL_LABELS['Trade_Signal']
     )
-    df.loc[df['Trade_Signal'].isin(['賣出', '強烈賣出']), 'Signal_Strength'] = (
-        '空頭' + df.loc[df['Trade_Signal'].isin(['賣出', '強烈賣出']), 'Sell_Signals']
-        .map(lambda v: f'{v:.1f}分')
+    return df
+
+
+def _format_scores(values):
+    """將分數格式化為「x.x分」；只對不重複的分數做字串格式化"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.array([], dtype=object)
+    uniques, inverse = np.unique(values, return_inverse=True)
+    texts = np.array([f'{v:.1f}分' for v in uniques], dtype=object)
+    return texts[inverse]
+
+
+def signal_strength(df):
+    """由 Trade_Signal 代碼與 Buy/Sell 分數組出 Signal_Strength 文字欄"""
+    codes = df['Trade_Signal'].cat.codes.to_numpy()
+    is_buy = np.isin(codes, [
+        label_code('Trade_Signal', '買入'),
+        label_code('Trade_Signal', '強烈買入'),
+    ])
+    is_sell = np.isin(codes, [
+        label_code('Trade_Signal', '賣出'),
+        label_code('Trade_Signal', '強烈賣出'),
+    ])
+    strength = np.full(len(df), '', dtype=object)
+    strength[is_buy] = '多頭' + _format_scores(
+        df['Buy_Signals'].to_numpy()[is_buy]
     )
+    strength[is_sell] = '空頭' + _format_scores(
+        df['Sell_Signals'].to_numpy()[is_sell]
+    )
+    return pd.Series(strength, index=df.index, name='Signal_Strength')
 
-    return df
+
+def format_signals_for_output(df):
+    """
+    產生寫入 CSV / 資料庫用的資料表：補上 Signal_Strength 文字欄，
+    並將 Categorical 訊號欄展開為中文標籤字串。
+    """
+    out = df.copy(deep=False)
+    if 'Trade_Signal' in out.columns:
+        out['Signal_Strength'] = signal_strength(out)
+    for col in SIGNAL_LABELS:
+        if col in out.columns and isinstance(
+            out[col].dtype, pd.CategoricalDtype
+        ):
+            out[col] = out[col].astype(object)
+    return out
 
 
 def print_analysis_summary(df):
@@ -89,7 +155,7 @@ def print_analysis_summary(df):
     trade_counts = df['Trade_Signal'].value_counts()
     print("\n交易訊號統計：")
     for signal, count in trade_counts.items():
-        if signal != '':
+        if signal != '' and count > 0:
             percentage = count/total_records*100 if total_records > 0 else 0
             print(f"  {signal}: {count:,} 次 ({percentage:.2f}%)")
 
@@ -114,9 +180,10 @@ def print_analysis_summary(df):
 
     latest_signals = df[df['Trade_Signal'] != ''].tail(3)
     if len(latest_signals) > 0:
+        strengths = signal_strength(latest_signals)
         print("\n最近3個交易訊號:")
-        for _, row in latest_signals.iterrows():
+        for idx, row in latest_signals.iterrows():
             print(
                 f"  {row['datetime'].strftime('%Y-%m-%d')}: "
-                f"{row['Trade_Signal']} ({row['Signal_Strength']})"
+                f"{row['Trade_Signal']} ({strengths[idx]})"
             )